@@ -0,0 +1,75 @@
+"""Compare save and load times of the users database in each save format.
+
+Synthetic databases of 10k, 100k and 1M users are saved and loaded in JSON, binary and compressed binary formats.
+Loading is timed in two parts: reading the file, and building the UserDB. Run from the repository root: python -m benchmarks.dbFormats [sizes...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bot.cfg import configurator
+configurator.init()
+
+from bot.lib import jsonHandler
+from bot.databases import userDB
+
+# Number of users in each synthetic database, unless given on the command line
+DEFAULT_SIZES = (10000, 100000, 1000000)
+# Database file names to save to, selecting each format
+FORMAT_FILES = {"json": "users.json", "binary": "users.msgpack", "binary+zlib": "users.msgpack.z"}
+
+
+def makeUsersDB(numUsers: int) -> dict:
+    """Generate a dictionary-serialized UserDB of random users.
+
+    :param int numUsers: The number of users to generate
+    :return: A dictionary-serialized UserDB, as returned by UserDB.toDict
+    :rtype: dict
+    """
+    rng = random.Random(numUsers)
+    data = {}
+    for _ in range(numUsers):
+        user = {}
+        if rng.random() < 0.3:
+            user["pollOwned"] = True
+        if rng.random() < 0.1:
+            user["helpMenuOwned"] = True
+        if rng.random() < 0.5:
+            user["timeOffset"] = rng.randint(-12, 12)
+        data[str(rng.randrange(10 ** 17, 10 ** 18))] = user
+    return data
+
+
+def benchmark(numUsers: int, folder: str):
+    """Print the time taken to save and load a synthetic users database of the given size, in each format.
+
+    :param int numUsers: The number of users in the database
+    :param str folder: The folder to save database files in
+    """
+    data = makeUsersDB(numUsers)
+    for formatName, fileName in FORMAT_FILES.items():
+        filePath = os.path.join(folder, str(numUsers) + "-" + fileName)
+
+        start = time.perf_counter()
+        jsonHandler.writeDB(filePath, data)
+        saveTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded, _, _ = jsonHandler.readDBWithDeltas(filePath)
+        readTime = time.perf_counter() - start
+        db = userDB.UserDB.fromDict(loaded)
+        buildTime = time.perf_counter() - start - readTime
+
+        assert len(db) == len(data)
+        print("{:>9} users  {:<12} save {:7.3f}s  read {:7.3f}s  build UserDB {:7.3f}s  size {:8.2f}MB".format(
+                numUsers, formatName, saveTime, readTime, buildTime, os.path.getsize(filePath) / 1024 ** 2))
+        os.remove(filePath)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            benchmark(size, folder)
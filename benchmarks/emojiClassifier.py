@@ -0,0 +1,98 @@
+"""Compare classifyEmoji with the strIsCustomEmoji, strIsUnicodeEmoji and BasedEmoji.fromStr chain it replaces.
+
+Each classifier is timed on a mix of story contributions of the kinds seen in emoji only mode: unicode emojis with and
+without variation selectors, regional indicators, custom emojis, and plain words. The number of inputs on which the two
+classifiers disagree is also reported.
+Run from the repository root: python -m benchmarks.emojiClassifier [numInputs]
+"""
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import emoji
+
+from bot.cfg import configurator
+configurator.init()
+
+from bot import botState
+from bot.lib import emojis, exceptions
+
+DEFAULT_NUM_INPUTS = 100000
+# IDs of the custom emojis the simulated client can access
+KNOWN_EMOJI_IDS = range(1000, 1100)
+WORDS = ["once", "upon", "a", "time", "there", "was", "a", "bot", "<notAnEmoji>", "<:broken:emoji>"]
+
+
+def makeInputs(numInputs: int) -> list:
+    """Generate a mix of emojis and words to classify.
+
+    :param int numInputs: The number of inputs to generate
+    :return: A list of strings to classify
+    :rtype: list
+    """
+    rng = random.Random(numInputs)
+    unicodeEmojis = list(emoji.EMOJI_DATA)
+    makers = [lambda: rng.choice(unicodeEmojis),
+                lambda: rng.choice(unicodeEmojis).rstrip(emojis.VAR_SELECTOR) + emojis.VAR_SELECTOR,
+                lambda: rng.choice(emojis.REGIONAL_INDICATORS),
+                lambda: "<:custom:" + str(rng.choice(KNOWN_EMOJI_IDS)) + ">",
+                lambda: "<:unknown:" + str(rng.randrange(1, 1000)) + ">",
+                lambda: rng.choice(WORDS)]
+    return [rng.choice(makers)() for _ in range(numInputs)]
+
+
+def classifyByChain(s: str):
+    """Classify s as story turns did before classifyEmoji.
+
+    :return: The parsed emoji, None if s is not an emoji, or the exception raised while parsing it
+    """
+    if not (emojis.strIsCustomEmoji(s) or emojis.strIsUnicodeEmoji(s)):
+        return None
+    try:
+        return emojis.BasedEmoji.fromStr(s, rejectInvalid=True)
+    except (exceptions.UnrecognisedCustomEmoji, TypeError) as e:
+        return type(e)
+
+
+def classifyByClassifier(s: str):
+    """Classify s with classifyEmoji.
+
+    :return: The parsed emoji, None if s is not an emoji, or the exception raised while parsing it
+    """
+    try:
+        return emojis.classifyEmoji(s, rejectInvalid=True)
+    except exceptions.UnrecognisedCustomEmoji as e:
+        return type(e)
+
+
+def timeClassifier(classify, inputs: list) -> tuple:
+    """Classify every input, and time how long it takes.
+
+    :return: The result for each input, and the number of seconds taken
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    results = [classify(s) for s in inputs]
+    return results, time.perf_counter() - start
+
+
+def main(numInputs: int):
+    botState.client = SimpleNamespace(get_emoji=lambda id: "<:custom:" + str(id) + ">" if id in KNOWN_EMOJI_IDS else None)
+    # Every unknown custom emoji would otherwise be logged
+    emojis.logUnknownEmojis = False
+    inputs = makeInputs(numInputs)
+
+    chainResults, chainSeconds = timeClassifier(classifyByChain, inputs)
+    classifierResults, classifierSeconds = timeClassifier(classifyByClassifier, inputs)
+    disagreements = [s for s, a, b in zip(inputs, chainResults, classifierResults) if a != b]
+
+    print(str(numInputs) + " inputs")
+    for name, seconds in (("chain", chainSeconds), ("classifier", classifierSeconds)):
+        print("{:<12} {:>8.3f}s {:>8.2f}us/input".format(name, seconds, seconds / numInputs * 1e6))
+    print("speedup      {:>8.1f}x".format(chainSeconds / classifierSeconds))
+    print(str(len(disagreements)) + " disagreements" + (": " + repr(sorted(set(disagreements))[:10]) if disagreements else ""))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_INPUTS)
@@ -0,0 +1,82 @@
+"""Compare TimedTaskHeap and TimingWheel with 100k concurrently scheduled reaction menu timeouts.
+
+Each scheduler is timed on scheduling every menu's timeout, cancelling a third of them (menus deleted early),
+rescheduling a third (e.g menu timeouts being extended), and then expiring the rest.
+Run from the repository root: python -m benchmarks.menuSchedulers [numMenus]
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bot.scheduling.timedTask import TimedTask
+from bot.scheduling.timedTaskHeap import TimedTaskHeap
+from bot.scheduling.timingWheel import TimingWheel
+
+DEFAULT_NUM_MENUS = 100000
+# Menu timeouts are spread uniformly over this many seconds
+TIMEOUT_SPREAD_SECONDS = 300
+# TimingWheel configuration, matching the defaults in cfg
+TICK_SECONDS = 1
+NUM_SLOTS = 4096
+
+
+def expireMenu(menuID: int):
+    """Stand-in for a menu expiry function.
+    """
+    pass
+
+
+async def benchmark(name: str, scheduler: TimedTaskHeap, numMenus: int):
+    """Print the time taken by the given scheduler for each phase of the benchmark.
+
+    Expiry times are placed in the past, so that every remaining task is due when expiry is timed. Since the scheduler
+    was created before those times, the TimingWheel still spreads the tasks over its slots.
+
+    :param str name: The name of the scheduler, to print
+    :param TimedTaskHeap scheduler: The scheduler to benchmark
+    :param int numMenus: The number of menus to schedule
+    """
+    rng = random.Random(numMenus)
+    now = datetime.utcnow()
+    tasks = [TimedTask(expiryTime=now - timedelta(seconds=rng.uniform(0, TIMEOUT_SPREAD_SECONDS)),
+                        expiryFunction=expireMenu, expiryFunctionArgs=menuID) for menuID in range(numMenus)]
+    cancelled = tasks[:numMenus // 3]
+    rescheduled = tasks[numMenus // 3:2 * numMenus // 3]
+    newTimes = [now - timedelta(seconds=rng.uniform(0, TIMEOUT_SPREAD_SECONDS)) for _ in rescheduled]
+
+    start = time.perf_counter()
+    for task in tasks:
+        scheduler.scheduleTask(task)
+    scheduleTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for task in cancelled:
+        scheduler.unscheduleTask(task)
+    cancelTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for task, newTime in zip(rescheduled, newTimes):
+        await task.reschedule(expiryTime=newTime)
+    rescheduleTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await scheduler.doTaskChecking()
+    await scheduler.waitForExpiries()
+    expireTime = time.perf_counter() - start
+
+    assert scheduler.countLiveTasks() == 0
+    print("{:<16} schedule {:7.3f}s  cancel {:7.3f}s  reschedule {:7.3f}s  expire {:7.3f}s".format(
+            name, scheduleTime, cancelTime, rescheduleTime, expireTime))
+
+
+async def main(numMenus: int):
+    print(str(numMenus) + " menus")
+    await benchmark("TimedTaskHeap", TimedTaskHeap(), numMenus)
+    startTime = time.monotonic() - TIMEOUT_SPREAD_SECONDS - TICK_SECONDS
+    await benchmark("TimingWheel", TimingWheel(TICK_SECONDS, NUM_SLOTS, startTime=startTime), numMenus)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_MENUS))
@@ -0,0 +1,148 @@
+"""Replay a long stream of reaction menu schedules, cancellations and expiries against each scheduler in virtual time.
+
+Menus are created at a steady random rate with random timeouts. Some are deleted before they time out, and some are
+ended early with TimedTask.forceExpire, which runs in the background like ReactionMenu.delete. Time is
+provided by a SimulatedClock, so hours of bot activity replay in seconds without sleeping. The main loop is simulated
+in both timedTaskCheckingType modes: "dynamic" checks exactly when the scheduler reports its next expiry time, and
+"fixed" checks every timedTaskLatenessThresholdSeconds.
+
+For each scheduler and checking mode, this reports the throughput of schedule/cancel/expire operations (in real time),
+the 99th percentile and maximum lateness of expiries (in virtual time), and the peak number of tasks held by the
+scheduler, including tombstones. Every menu's expiry function must be called at most once; the benchmark fails if any
+is called again, e.g by the scheduler expiring a task while forceExpire is still expiring it.
+Run from the repository root: python -m benchmarks.simulatedScheduling [numOperations]
+"""
+import asyncio
+import heapq
+import math
+import random
+import sys
+import time
+from datetime import timedelta
+
+from bot.cfg import cfg
+from bot.scheduling.clock import SimulatedClock
+from bot.scheduling.timedTask import TimedTask
+from bot.scheduling.timedTaskHeap import TimedTaskHeap
+from bot.scheduling.timingWheel import TimingWheel
+
+DEFAULT_NUM_OPERATIONS = 1000000
+# Average number of reaction menus created per virtual second
+MENUS_PER_SECOND = 20
+# Menu timeouts are chosen uniformly between these numbers of seconds
+MIN_TIMEOUT_SECONDS = 30
+MAX_TIMEOUT_SECONDS = 1800
+# Proportion of menus deleted before they time out
+CANCEL_PROPORTION = 0.3
+# Proportion of menus ended early, e.g polls ended by their owner
+FORCE_EXPIRE_PROPORTION = 0.1
+
+
+async def simulate(scheduler: TimedTaskHeap, clock: SimulatedClock, checkInterval: float, numOperations: int) -> dict:
+    """Replay menu activity against the given scheduler until numOperations schedules, cancels and expiries are done.
+
+    :param TimedTaskHeap scheduler: The scheduler to replay against, which must use clock
+    :param SimulatedClock clock: The clock to advance
+    :param float checkInterval: The number of seconds between scheduler checks, or None to check only when the
+                                scheduler's next expiry time is reached
+    :param int numOperations: The number of operations to replay
+    :return: A dictionary of results, with keys operations, realSeconds, virtualSeconds, lateness (a sorted list of
+                seconds), peakSize and repeatExpiries (the number of expiry function calls beyond each menu's first)
+    :rtype: dict
+    """
+    rng = random.Random(numOperations)
+    lateness = []
+    # The number of times each menu's expiry function has been called, by menu number
+    expiryCalls = {}
+    # Menus ended early, by menu number
+    forced = set()
+    forceExpiries = []
+
+    async def expireMenu(menu: list):
+        menuNumber, expiryTime = menu
+        expiryCalls[menuNumber] = expiryCalls.get(menuNumber, 0) + 1
+        if menuNumber not in forced:
+            lateness.append(clock.monotonic() - expiryTime)
+        # Menu expiry functions make API calls, letting the main loop run before they finish
+        await asyncio.sleep(0)
+
+    # Menus waiting to be deleted or ended early, as a heap of (deletion time, menu number, task, whether to end the
+    # menu rather than deleting it)
+    cancellations = []
+    nextArrival = clock.monotonic() + rng.expovariate(MENUS_PER_SECOND)
+    nextCheck = clock.monotonic() if checkInterval is not None else None
+    numMenus = numCancelled = 0
+    peakSize = 0
+
+    start = time.perf_counter()
+    while numMenus + numCancelled + len(forced) + len(lateness) < numOperations:
+        if checkInterval is None:
+            nextCheck = scheduler.nextExpiryTime()
+        now = min(t for t in (nextArrival, nextCheck, cancellations[0][0] if cancellations else None) if t is not None)
+        clock.advanceTo(now)
+
+        while nextArrival <= now:
+            timeout = rng.uniform(MIN_TIMEOUT_SECONDS, MAX_TIMEOUT_SECONDS)
+            task = TimedTask(expiryDelta=timedelta(seconds=timeout), expiryFunction=expireMenu,
+                                expiryFunctionArgs=[numMenus + 1, now + timeout], clock=clock)
+            scheduler.scheduleTask(task)
+            numMenus += 1
+            roll = rng.random()
+            if roll < CANCEL_PROPORTION + FORCE_EXPIRE_PROPORTION:
+                heapq.heappush(cancellations, (now + rng.uniform(0, timeout), numMenus, task,
+                                                roll < FORCE_EXPIRE_PROPORTION))
+            nextArrival += rng.expovariate(MENUS_PER_SECOND)
+        peakSize = max(peakSize, scheduler.countLiveTasks() + scheduler.countTombstones())
+
+        while cancellations and cancellations[0][0] <= now:
+            _, menuNumber, task, forceExpire = heapq.heappop(cancellations)
+            if task.heap is None:
+                continue
+            if forceExpire:
+                forced.add(menuNumber)
+                forceExpiries.append(asyncio.ensure_future(task.forceExpire()))
+            else:
+                scheduler.unscheduleTask(task)
+                numCancelled += 1
+
+        if nextCheck is not None and nextCheck <= now:
+            await scheduler.doTaskChecking()
+            await scheduler.waitForExpiries()
+            if checkInterval is not None:
+                nextCheck += checkInterval
+
+    await asyncio.gather(*forceExpiries)
+    return {"operations": numMenus + numCancelled + len(forced) + len(lateness),
+            "realSeconds": time.perf_counter() - start, "virtualSeconds": clock.monotonic(),
+            "lateness": sorted(lateness), "peakSize": peakSize,
+            "repeatExpiries": sum(calls - 1 for calls in expiryCalls.values())}
+
+
+def printResults(name: str, results: dict):
+    """Print a summary of the results of simulate.
+
+    :param str name: The name of the scheduler and checking mode simulated
+    :param dict results: The results returned by simulate
+    """
+    lateness = results["lateness"]
+    p99 = lateness[max(0, math.ceil(len(lateness) * 0.99) - 1)] if lateness else 0
+    print("{:<22} {:>9.0f} ops/s  p99 lateness {:7.3f}s  max lateness {:7.3f}s  peak size {:>7}  ({:.1f} virtual hours)"
+            .format(name, results["operations"] / results["realSeconds"], p99, lateness[-1] if lateness else 0,
+                    results["peakSize"], results["virtualSeconds"] / 3600))
+    if results["repeatExpiries"]:
+        raise SystemExit(name + ": " + str(results["repeatExpiries"]) + " expiry functions were called more than once")
+
+
+async def main(numOperations: int):
+    print(str(numOperations) + " operations")
+    for mode, checkInterval in (("dynamic", None), ("fixed", cfg.timedTaskLatenessThresholdSeconds)):
+        clock = SimulatedClock()
+        printResults("TimedTaskHeap " + mode, await simulate(TimedTaskHeap(clock=clock), clock, checkInterval,
+                                                                numOperations))
+        clock = SimulatedClock()
+        wheel = TimingWheel(cfg.timingWheelTickSeconds, cfg.timingWheelSlots, clock=clock)
+        printResults("TimingWheel " + mode, await simulate(wheel, clock, checkInterval, numOperations))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_OPERATIONS))
@@ -0,0 +1,147 @@
+"""Stress story turns with thousands of simulated users posting at once, across many guilds.
+
+Messages arrive in bursts, with the messages in each burst delivered to the bot in a shuffled order, and every
+response sent to discord takes a random amount of time. Turns are taken concurrently, both through
+storyEngine.turnQueue and directly without it, and each guild's resulting story and responses are compared with
+those from taking the same turns one at a time in message ID order.
+
+For each mode, this reports the number of guilds whose stories diverged from the sequential result, and the throughput
+of turns. Turns taken through the queue must match sequential play in every guild; the script exits with an error if
+any guild diverges. Run from the repository root: python -m benchmarks.storyTurns [numMessages]
+"""
+import asyncio
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from bot.cfg import configurator
+configurator.init()
+
+from bot import botState
+from bot.users import storyEngine
+
+DEFAULT_NUM_MESSAGES = 20000
+NUM_GUILDS = 50
+# Number of different users posting in each guild
+POSTERS_PER_GUILD = 40
+# Number of messages delivered at once
+BURST_SIZE = 200
+# Responses sent to discord take up to this many seconds
+MAX_RESPONSE_SECONDS = 0.002
+WORDS = ["once", "upon", "a", "time", "there", "was", "a", "bot", "! wow", "- and", "two words", "."]
+
+
+class StoryGuild:
+    """The parts of a BasedGuild used when taking story turns.
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.storyEngine = storyEngine.StoryEngine()
+        self.emojiOnly = False
+        self.emojiOnlyErrSent = False
+        # Every message sent in the guild's story channel
+        self.responses = []
+
+
+    @property
+    def story(self) -> str:
+        return self.storyEngine.render()
+
+
+    def addToStory(self, text: str, authorID: int):
+        self.storyEngine.append(text, authorID)
+
+
+    def resetStory(self):
+        self.storyEngine.reset()
+
+
+class StoryChannel:
+    """A story channel which takes a random amount of time to send each message.
+    """
+
+    def __init__(self, guild: StoryGuild, rng: random.Random):
+        self.guild = guild
+        self.rng = rng
+
+
+    async def send(self, content: str):
+        await asyncio.sleep(self.rng.uniform(0, MAX_RESPONSE_SECONDS))
+        self.guild.responses.append(content)
+
+
+def makeMessages(numMessages: int) -> list:
+    """Generate the messages to post, in the order discord would assign their IDs.
+
+    :param int numMessages: The number of messages to generate
+    :return: A list of (message ID, guild ID, author ID, content) tuples
+    :rtype: list
+    """
+    rng = random.Random(numMessages)
+    return [(msgID, rng.randrange(NUM_GUILDS), rng.randrange(POSTERS_PER_GUILD), rng.choice(WORDS))
+            for msgID in range(1, numMessages + 1)]
+
+
+def makeMessage(guilds: dict, channels: dict, msgID: int, guildID: int, authorID: int, content: str):
+    author = SimpleNamespace(id=authorID, mention="<@" + str(authorID) + ">")
+
+    async def delete():
+        pass
+
+    return SimpleNamespace(id=msgID, guild=guilds[guildID], channel=channels[guildID], author=author, content=content,
+                            delete=delete)
+
+
+async def playAll(messages: list, useQueue: bool, sequential: bool = False) -> tuple:
+    """Take every message's turn, and collect each guild's results.
+
+    :param list messages: The messages to post, as returned by makeMessages
+    :param bool useQueue: Whether to take turns through storyEngine.turnQueue
+    :param bool sequential: Whether to take turns one at a time in message ID order (Default False)
+    :return: The final story and responses of each guild, and the number of seconds taken
+    :rtype: tuple
+    """
+    rng = random.Random(len(messages))
+    guilds = {guildID: StoryGuild(guildID) for guildID in range(NUM_GUILDS)}
+    channels = {guildID: StoryChannel(guild, rng) for guildID, guild in guilds.items()}
+    botState.guildsDB = SimpleNamespace(getGuild=guilds.__getitem__)
+
+    async def turn(message):
+        if useQueue:
+            await storyEngine.turnQueue.takeTurn(message.guild.id, message.id,
+                                                    lambda: storyEngine.playTurn(message, message.content))
+        else:
+            await storyEngine.playTurn(message, message.content)
+
+    start = time.perf_counter()
+    if sequential:
+        for msg in messages:
+            await turn(makeMessage(guilds, channels, *msg))
+    else:
+        for burstStart in range(0, len(messages), BURST_SIZE):
+            burst = messages[burstStart:burstStart + BURST_SIZE]
+            rng.shuffle(burst)
+            await asyncio.gather(*(turn(makeMessage(guilds, channels, *msg)) for msg in burst))
+    seconds = time.perf_counter() - start
+
+    return {guildID: (guild.story, guild.responses) for guildID, guild in guilds.items()}, seconds
+
+
+async def main(numMessages: int):
+    messages = makeMessages(numMessages)
+    expected, seconds = await playAll(messages, useQueue=False, sequential=True)
+    print(str(numMessages) + " messages in " + str(NUM_GUILDS) + " guilds")
+    print("{:<12} {:>9.0f} turns/s".format("sequential", numMessages / seconds))
+    for name, useQueue in (("turn queue", True), ("no queue", False)):
+        results, seconds = await playAll(messages, useQueue)
+        diverged = sum(results[guildID] != expected[guildID] for guildID in expected)
+        print("{:<12} {:>9.0f} turns/s  {:>3} of {} guilds diverged from sequential play"
+                .format(name, numMessages / seconds, diverged, NUM_GUILDS))
+        if useQueue and diverged:
+            raise SystemExit(str(diverged) + " guilds' stories diverged from message ID order through the turn queue")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_MESSAGES))
@@ -0,0 +1,99 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Tuple, Set, Callable, Any
+
+
+# Sentinel for attributes which have not yet been assigned
+_UNSET = object()
+
+
+class ChangeTracked:
+    """An object which reports whenever one of a set of its attributes is assigned a new value.
+    Used by databases to track which of their records need to be saved.
+
+    :var trackedAttrs: Class attribute naming the attributes whose changes should be reported
+    :vartype trackedAttrs: Tuple[str]
+    :var changeListener: Called with this object whenever a tracked attribute is assigned a different value.
+                            None for no listener.
+    :vartype changeListener: Callable[[ChangeTracked], Any]
+    """
+    trackedAttrs: Tuple[str, ...] = ()
+    changeListener: Callable[[ChangeTracked], Any] = None
+
+    def __setattr__(self, name: str, value):
+        """Assign an attribute, notifying changeListener if the attribute is tracked and its value has changed.
+
+        :param str name: The name of the attribute to assign
+        :param value: The new value for the attribute
+        """
+        if name in self.trackedAttrs and self.changeListener is not None:
+            changed = getattr(self, name, _UNSET) != value
+            super().__setattr__(name, value)
+            if changed:
+                self.changeListener(self)
+        else:
+            super().__setattr__(name, value)
+
+
+class ChangeTrackingDB(ABC):
+    """A database of ChangeTracked records, keyed by record ID, which tracks the IDs of records that have been
+    added, removed or modified since the database was last saved.
+    This allows saving to only write out the records which have changed.
+
+    :var changedIDs: The IDs of all records which have changed since the last save
+    :vartype changedIDs: Set[int]
+    :var fullSaveRequired: Whether the next save must write the entire database, rather than just the changed records
+    :vartype fullSaveRequired: bool
+    :var deltaSize: The number of records written as changes since the database was last saved in full
+    :vartype deltaSize: int
+    """
+
+    def __init__(self):
+        self.changedIDs: Set[int] = set()
+        self.fullSaveRequired = False
+        self.deltaSize = 0
+
+
+    def recordChanged(self, record: ChangeTracked):
+        """Mark the given record as changed. Records stored in the database should use this as their changeListener.
+
+        :param ChangeTracked record: The record that changed
+        """
+        self.changedIDs.add(record.id)
+
+
+    def hasChanges(self) -> bool:
+        """Decide whether or not the database needs to be saved.
+
+        :return: True if any records have changed since the last save, or a full save is required. False otherwise
+        :rtype: bool
+        """
+        return self.fullSaveRequired or bool(self.changedIDs)
+
+
+    def clearChanges(self):
+        """Mark all records as saved.
+        """
+        self.changedIDs = set()
+        self.fullSaveRequired = False
+
+
+    @abstractmethod
+    def toDeltaDict(self, **kwargs) -> dict:
+        """Serialise only the records that have changed since the last save.
+        Records which have been removed from the database are represented by None.
+
+        :return: A dictionary mapping the string IDs of changed records to their serialised form, or None if removed
+        :rtype: dict
+        """
+        return {}
+
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Get the number of records stored in the database.
+
+        :return: The number of records in the database
+        :rtype: int
+        """
+        return 0
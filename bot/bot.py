@@ -12,19 +12,25 @@ from discord.ext.commands import Bot as ClientBaseClass
 # Util imports
 
 from datetime import datetime
+import time
 import os
 import traceback
 import asyncio
 import signal
 import aiohttp
+from typing import Callable, List
+import functools
 
 
 # BASED Imports
 
 from . import lib, botState, logging
-from .databases import guildDB, reactionMenuDB, userDB
+from .databases import guildDB, reactionMenuDB, userDB, storyJournal, sqliteDB, timedTaskDB
+from .reactionMenus import reactionSeeding, editCoalescing
+from .users import storyEngine
 from .scheduling.timedTask import TimedTask
 from .scheduling.timedTaskHeap import TimedTaskHeap
+from .scheduling.timingWheel import TimingWheel
 
 
 async def checkForUpdates():
@@ -115,17 +121,23 @@ class GracefulKiller:
 
     :var kill_now: Whether or not a termination signal has been received
     :vartype kill_now: bool
+    :var onKill: Called when a termination signal is received, or None. Signal handlers may interrupt the event loop at
+                    any point, so this should only schedule work with loop.call_soon_threadsafe.
+    :vartype onKill: Callable[[], Any]
     """
 
     def __init__(self):
         """Register signal handlers"""
         self.kill_now = False
+        self.onKill = None
         signal.signal(signal.SIGINT, self.exit_gracefully) # keyboard interrupt
         signal.signal(signal.SIGTERM, self.exit_gracefully) # graceful exit request
 
     def exit_gracefully(self, signum, frame):
         """Termination signal received, mark kill indicator"""
         self.kill_now = True
+        if self.onKill is not None:
+            self.onKill()
 
 
 class BasedClient(ClientBaseClass):
@@ -149,6 +161,14 @@ class BasedClient(ClientBaseClass):
     :vartype launchTime: datetime
     :var killer: Indicator of when OS termination signals are received
     :vartype killer: GracefulKiller
+    :var saveLock: Lock preventing concurrent database saves. Created on first use, inside the event loop.
+    :vartype saveLock: asyncio.Lock
+    :var lastSavedMenusDB: The serialized reaction menus database as it was last saved, used to skip saving when unchanged
+    :vartype lastSavedMenusDB: dict
+    :var lastSavedTimedTasksDB: The serialized reaction menu timeouts as they were last saved, used to skip saving when unchanged
+    :vartype lastSavedTimedTasksDB: dict
+    :var menusRestored: Whether saved reaction menus have finished being restored. Until then, menus are not saved.
+    :vartype menusRestored: bool
     """
 
     def __init__(self, storeUsers: bool = True, storeGuilds: bool = True, storeMenus: bool = True):
@@ -167,6 +187,65 @@ class BasedClient(ClientBaseClass):
         self.storeNone = not(storeUsers or storeGuilds or storeMenus)
         self.launchTime = datetime.utcnow()
         self.killer = GracefulKiller()
+        self.saveLock = None
+        self.lastSavedMenusDB = None
+        self.lastSavedTimedTasksDB = None
+        self.menusRestored = False
+
+    def snapshotDBs(self) -> List[Callable[[], None]]:
+        """Take a consistent snapshot of all unsaved changes in the bot's databases.
+        This must be called from the event loop, so that no database is modified part way through serialization.
+        Databases without any changes since they were last saved are skipped.
+
+        :return: A list of functions, each writing the snapshot of one database to file. These may be called from a worker thread.
+        :rtype: List[Callable[[], None]]
+        """
+        writers = []
+        for store, dbPath, db in ((self.storeUsers, cfg.paths.usersDB, botState.usersDB),
+                                  (self.storeGuilds, cfg.paths.guildsDB, botState.guildsDB)):
+            if not store:
+                continue
+            if isinstance(db, sqliteDB.SQLiteBackedDB):
+                writers.append(db.prepareSave())
+            else:
+                writers.append(lib.jsonHandler.prepareDBSave(dbPath, db, cfg.dbDeltaCompactionRatio))
+        if self.storeMenus and self.menusRestored:
+            # Reaction menus are few in number, so they are always serialized in full, but only written if changed
+            menusData = botState.reactionMenusDB.toDict()
+            if menusData != self.lastSavedMenusDB:
+                self.lastSavedMenusDB = menusData
+                writers.append(functools.partial(self.writeMenusDB, menusData))
+            # Save the timeouts of all scheduled reaction menus, so that they can be restored on restart
+            if botState.reactionMenusTTDB is not None:
+                tasksData = timedTaskDB.toDict(botState.reactionMenusTTDB)
+                if tasksData != self.lastSavedTimedTasksDB:
+                    self.lastSavedTimedTasksDB = tasksData
+                    writers.append(functools.partial(self.writeTimedTasksDB, tasksData))
+        return [writer for writer in writers if writer is not None]
+
+    def writeMenusDB(self, menusData: dict):
+        """Write a snapshot of the reaction menus database to file.
+        If writing fails, the next save will write the menus database again regardless of whether it has changed.
+
+        :param dict menusData: The serialized reaction menus database, as returned by ReactionMenuDB.toDict
+        """
+        try:
+            lib.jsonHandler.writeJSON(cfg.paths.reactionMenusDB, menusData)
+        except BaseException:
+            self.lastSavedMenusDB = None
+            raise
+
+    def writeTimedTasksDB(self, tasksData: dict):
+        """Write a snapshot of the scheduled reaction menu timeouts to file.
+        If writing fails, the next save will write the timeouts again regardless of whether they have changed.
+
+        :param dict tasksData: The serialized timeouts, as returned by timedTaskDB.toDict
+        """
+        try:
+            lib.jsonHandler.writeJSON(cfg.paths.timedTasksDB, tasksData)
+        except BaseException:
+            self.lastSavedTimedTasksDB = None
+            raise
 
     def saveAllDBs(self):
         """Save all of the bot's savedata to file.
@@ -174,16 +253,46 @@ class BasedClient(ClientBaseClass):
         - the users database
         - the guilds database
         - the reaction menus database
+        - reaction menu timeouts
         - logs
+
+        Only changes made since the last save are written to file.
+        This method blocks the event loop until all files are written. Where possible, use saveAllDBsAsync instead.
         """
-        if self.storeUsers:
-            lib.jsonHandler.saveDB(cfg.paths.usersDB, botState.usersDB)
-        if self.storeGuilds:
-            lib.jsonHandler.saveDB(cfg.paths.guildsDB, botState.guildsDB)
-        if self.storeMenus:
-            lib.jsonHandler.saveDB(cfg.paths.reactionMenusDB, botState.reactionMenusDB)
+        writers = self.snapshotDBs()
+        for writer in writers:
+            writer()
         botState.logger.save()
-        if not self.storeNone:
+        if writers:
+            print(datetime.now().strftime("%H:%M:%S: Data saved!"))
+
+    async def saveAllDBsAsync(self):
+        """Save all of the bot's savedata to file, without blocking the event loop.
+        A snapshot of all databases is taken on the event loop, and then serialized and written to file in worker threads.
+        Files are written atomically, so a crash during saving will never leave a truncated database file.
+        Concurrent calls are serialized, so that an older snapshot can never overwrite a newer one.
+        Only changes made since the last save are written to file.
+        Once the guilds database is saved, the story journal is compacted.
+
+        This currently saves:
+        - the users database
+        - the guilds database
+        - the reaction menus database
+        - reaction menu timeouts
+        - logs
+        """
+        if self.saveLock is None:
+            self.saveLock = asyncio.Lock()
+        async with self.saveLock:
+            # Every story journal record up to this point is reflected in the guilds snapshot
+            journalSeq = botState.storyJournal.lastSeq if botState.storyJournal is not None else 0
+            writers = self.snapshotDBs()
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(None, writer) for writer in writers))
+            if self.storeGuilds and botState.storyJournal is not None:
+                await botState.storyJournal.compact(journalSeq)
+            botState.logger.save()
+        if writers:
             print(datetime.now().strftime("%H:%M:%S: Data saved!"))
 
     async def shutdown(self):
@@ -196,16 +305,18 @@ class BasedClient(ClientBaseClass):
         """
         if self.storeMenus:
             # expire non-saveable reaction menus
-            menus = list(botState.reactionMenusDB.values())
-            for menu in menus:
-                if not menu.saveable:
-                    await menu.delete()
+            await botState.reactionMenusDB.deleteMenus(botState.reactionMenusDB.unsaveable())
+            # let menus that are already expiring finish
+            if botState.reactionMenusTTDB is not None:
+                await botState.reactionMenusTTDB.waitForExpiries()
 
         # log out of discord
         self.loggedIn = False
         await self.logout()
         # save bot save data
-        self.saveAllDBs()
+        if botState.storyJournal is not None:
+            await botState.storyJournal.flush()
+        await self.saveAllDBsAsync()
         print(datetime.now().strftime("%H:%M:%S: Shutdown complete."))
         # close the bot's aiohttp session
         await botState.httpClient.close()
@@ -228,37 +339,84 @@ botCommands = commands.loadCommands()
 ####### DATABASE FUNCTIONS #####
 
 def loadUsersDB(filePath: str) -> userDB.UserDB:
-    """Build a UserDB from the specified JSON file.
+    """Build a UserDB from the specified database file, applying any changes saved since the file was last saved in full.
+    The file may be JSON, or in the binary format if filePath ends in lib.jsonHandler.BINARY_EXT.
+    If filePath has an SQLite extension (see sqliteDB.SQLITE_EXTS), an SQLiteUserDB is opened instead.
 
-    :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
+    :param str filePath: path to the database file to load. Theoretically, this can be absolute or relative.
     :return: a UserDB as described by the dictionary-serialized representation stored in the file located in filePath.
     """
-    if os.path.isfile(filePath):
-        return userDB.UserDB.fromDict(lib.jsonHandler.readJSON(filePath))
-    return userDB.UserDB()
-
-
-def loadGuildsDB(filePath: str, dbReload: bool = False) -> guildDB.GuildDB:
-    """Build a GuildDB from the specified JSON file.
-
-    :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
+    if sqliteDB.isSQLitePath(filePath):
+        return sqliteDB.SQLiteUserDB(filePath, cfg.sqliteCacheSize)
+    records, deltaSize, deltasValid = lib.jsonHandler.iterDBWithDeltas(filePath)
+    db = userDB.UserDB.fromDict(records)
+    db.deltaSize = deltaSize
+    db.fullSaveRequired = db.fullSaveRequired or not deltasValid
+    return db
+
+
+def loadGuildsDB(filePath: str, dbReload: bool = False, journal: storyJournal.StoryJournal = None) -> guildDB.GuildDB:
+    """Build a GuildDB from the specified database file, applying any changes saved since the file was last saved in full.
+    The file may be JSON, or in the binary format if filePath ends in lib.jsonHandler.BINARY_EXT.
+    If a story journal is given, any story changes recorded since the guilds were last saved are also replayed.
+    If filePath has an SQLite extension (see sqliteDB.SQLITE_EXTS), an SQLiteGuildDB is opened instead.
+
+    :param str filePath: path to the database file to load. Theoretically, this can be absolute or relative.
+    :param StoryJournal journal: The story journal to replay (Default None)
     :return: a GuildDB as described by the dictionary-serialized representation stored in the file located in filePath.
     """
-    if os.path.isfile(filePath):
-        return guildDB.GuildDB.fromDict(lib.jsonHandler.readJSON(filePath))
-    return guildDB.GuildDB()
-
+    if sqliteDB.isSQLitePath(filePath):
+        db = sqliteDB.SQLiteGuildDB(filePath, cfg.sqliteCacheSize)
+        if journal is not None:
+            db.replayJournal(journal)
+        return db
+    records, deltaSize, deltasValid = lib.jsonHandler.iterDBWithDeltas(filePath)
+    db = guildDB.GuildDB.fromDict(records)
+    if journal is not None:
+        # Replayed changes must be saved before the journal is next compacted
+        db.changedIDs.update(journal.replay(db.guildData, keyType=int))
+    db.deltaSize = deltaSize
+    db.fullSaveRequired = db.fullSaveRequired or not deltasValid
+    return db
+
+
+async def restoreReactionMenus(filePath: str, restoredTasks: timedTaskDB.TimedTaskDB):
+    """Restore the reaction menus saved in the specified JSON file into botState.reactionMenusDB, and then schedule
+    the timeouts they claimed. This is run in the background, so that the bot can respond to other events while menu
+    messages are fetched.
+    Timeouts are only scheduled once all menus have been restored, so that no menu can time out before it is restored.
+    The reaction menus DB is not saved until this has finished.
 
-async def loadReactionMenusDB(filePath: str) -> reactionMenuDB.ReactionMenuDB:
-    """Build a reactionMenuDB from the specified JSON file.
-    This method must be called asynchronously, to allow awaiting of discord message fetching functions.
+    :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
+    :param TimedTaskDB restoredTasks: Saved menu timeouts restored from file, unscheduled, for menus to claim
+    """
+    try:
+        if os.path.isfile(filePath):
+            await reactionMenuDB.fromDict(lib.jsonHandler.readJSON(filePath), restoredTasks=restoredTasks,
+                                            db=botState.reactionMenusDB)
+    except Exception as e:
+        botState.logger.log("Main", "restoreReactionMenus", "Failed to restore reaction menus: " + type(e).__name__,
+                            category="reactionMenus", eventType="MENU_LOAD_ERR", trace=traceback.format_exc())
+    # Timeouts for menus that could not be restored are no longer needed
+    restoredTasks.dropUnclaimed()
+    restoredTasks.scheduleClaimed(botState.reactionMenusTTDB)
+    botState.client.menusRestored = True
+    # Menus which timed out while the bot was offline are all expired together, in the background
+    await botState.reactionMenusTTDB.doTaskChecking()
+
+
+def loadTimedTasksDB(filePath: str, heap: TimedTaskHeap, schedule: bool = True) -> timedTaskDB.TimedTaskDB:
+    """Restore the TimedTasks saved in the specified JSON file, scheduling them all onto the given heap at once.
 
     :param str filePath: path to the JSON file to load. Theoretically, this can be absolute or relative.
-    :return: a reactionMenuDB as described by the dictionary-serialized representation stored in the file located in filePath.
+    :param TimedTaskHeap heap: The heap to schedule the restored tasks onto
+    :param bool schedule: Give False to leave the restored tasks unscheduled, to be scheduled once claimed
+                            (Default True)
+    :return: a TimedTaskDB holding the restored tasks
     """
     if os.path.isfile(filePath):
-        return await reactionMenuDB.fromDict(lib.jsonHandler.readJSON(filePath))
-    return reactionMenuDB.ReactionMenuDB()
+        return timedTaskDB.fromDict(lib.jsonHandler.readJSON(filePath), heap, schedule=schedule)
+    return timedTaskDB.TimedTaskDB()
 
 
 ####### SYSTEM COMMANDS #######
@@ -296,7 +454,7 @@ async def on_guild_join(guild: discord.Guild):
 
 @botState.client.event
 async def on_guild_remove(guild: discord.Guild):
-    """Remove the database entry for any guilds the bot leaves.
+    """Remove the database entry for any guilds the bot leaves, and deactivate any reaction menus in the guild.
     TODO: Once deprecation databases are implemented, if guilds now store important information consider moving them to deprecated.
 
     :param discord.Guild guild: the guild just left.
@@ -311,6 +469,34 @@ async def on_guild_remove(guild: discord.Guild):
                                 ("\n -- The guild was removed from botState.guildsDB" if guildExists else ""),
                                 category="guildsDB", eventType="NW_GLD")
 
+    # Menus in the guild can no longer be reacted to
+    await botState.reactionMenusDB.deleteMenus(botState.reactionMenusDB.menusInGuild(guild.id))
+
+
+@botState.client.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    """Called every time a channel is deleted from a guild.
+    Deactivate and unschedule any reaction menus in the channel, since discord does not send message deletion events
+    for them.
+
+    :param discord.abc.GuildChannel channel: the channel that was deleted.
+    """
+    await botState.reactionMenusDB.deleteMenus(botState.reactionMenusDB.menusInChannel(channel.id))
+
+
+def secondsUntilNextTask() -> float:
+    """Find the number of seconds until the next scheduled task is due to expire, for the main loop to sleep for.
+    This considers reaction menu expiry, database saving, and checking for updates.
+
+    :return: The number of seconds until the next task expires, or 0 if a task is already due
+    :rtype: float
+    """
+    expiryTimes = [botState.dbSaveTT.expiryMonotonic, botState.updatesCheckTT.expiryMonotonic]
+    nextMenuExpiry = botState.reactionMenusTTDB.nextExpiryTime()
+    if nextMenuExpiry is not None:
+        expiryTimes.append(nextMenuExpiry)
+    return max(0, min(expiryTimes) - time.monotonic())
+
 
 @botState.client.event
 async def on_ready():
@@ -334,22 +520,33 @@ async def on_ready():
 
     # Load save data. If the specified files do not exist, an empty database will be created instead.
     botState.usersDB = loadUsersDB(cfg.paths.usersDB)
-    botState.guildsDB = loadGuildsDB(cfg.paths.guildsDB)
+    botState.storyJournal = storyJournal.StoryJournal(cfg.paths.storyJournal, cfg.storyJournalFlushMilliseconds / 1000)
+    botState.guildsDB = loadGuildsDB(cfg.paths.guildsDB, journal=botState.storyJournal)
 
     for guild in botState.client.guilds:
         if not botState.guildsDB.idExists(guild.id):
             botState.guildsDB.addID(guild.id)
 
-    botState.reactionMenusDB = await loadReactionMenusDB(cfg.paths.reactionMenusDB)
+    # Schedule reaction menu expiry
+    if cfg.reactionMenuSchedulerType == "wheel":
+        botState.reactionMenusTTDB = TimingWheel(cfg.timingWheelTickSeconds, cfg.timingWheelSlots,
+                                                    maxConcurrentExpiries=cfg.maxConcurrentMenuExpiries)
+    else:
+        botState.reactionMenusTTDB = TimedTaskHeap(maxConcurrentExpiries=cfg.maxConcurrentMenuExpiries)
+
+    botState.messageCache = lib.messageCache.MessageCache()
+    botState.reactionSeeder = reactionSeeding.ReactionSeeder()
+    botState.editCoalescer = editCoalescing.EditCoalescer()
+    # Restore menu timeouts before the menus themselves, so that restored menus can claim their timeouts
+    restoredTasks = loadTimedTasksDB(cfg.paths.timedTasksDB, botState.reactionMenusTTDB, schedule=False)
+    botState.reactionMenusDB = reactionMenuDB.ReactionMenuDB()
+    asyncio.create_task(restoreReactionMenus(cfg.paths.reactionMenusDB, restoredTasks))
 
     # Set help embed thumbnails
     setHelpEmbedThumbnails()
-
-    # Schedule reaction menu expiry
-    botState.reactionMenusTTDB = TimedTaskHeap()
     # Schedule database saving
     botState.dbSaveTT = TimedTask(expiryDelta=lib.timeUtil.timeDeltaFromDict(cfg.timeouts.dataSaveFrequency),
-                                    autoReschedule=True, expiryFunction=botState.client.saveAllDBs)
+                                    autoReschedule=True, expiryFunction=botState.client.saveAllDBsAsync)
     # Schedule BASED updates checking
     botState.updatesCheckTT = TimedTask(expiryDelta=lib.timeUtil.timeDeltaFromDict(cfg.timeouts.BASED_updateCheckFrequency),
                                         autoReschedule=True, expiryFunction=checkForUpdates)
@@ -363,12 +560,22 @@ async def on_ready():
     # bot is now logged in
     botState.client.loggedIn = True
 
+    # Wake the main loop as soon as a termination signal is received
+    loop = asyncio.get_running_loop()
+    botState.client.killer.onKill = lambda: loop.call_soon_threadsafe(botState.reactionMenusTTDB.wakeEvent.set)
+
     # Main loop: execute regular tasks while the bot is logged in
     while botState.client.loggedIn:
         if cfg.timedTaskCheckingType == "fixed":
             await asyncio.sleep(cfg.timedTaskLatenessThresholdSeconds)
         elif cfg.timedTaskCheckingType == "dynamic":
-            pass
+            # Sleep until the next task is due, or a new task is scheduled to expire before it
+            wakeEvent = botState.reactionMenusTTDB.wakeEvent
+            try:
+                await asyncio.wait_for(wakeEvent.wait(), secondsUntilNextTask())
+            except asyncio.TimeoutError:
+                pass
+            wakeEvent.clear()
 
         await botState.dbSaveTT.doExpiryCheck()
         await botState.reactionMenusTTDB.doTaskChecking()
@@ -448,57 +655,8 @@ async def on_message(message: discord.Message):
 
     # Non-command messages
     elif not isDM and (callingGuild := botState.guildsDB.getGuild(message.guild.id)).storyChannelID == message.channel.id:
-        if message.author.id == callingGuild.lastAuthorID:
-            await message.channel.send(":boom: **Story broken, " + message.author.mention + "!** It wasn't your turn!")
-            if callingGuild.story:
-                await message.channel.send(callingGuild.story)
-            callingGuild.story = ""
-            callingGuild.lastAuthorID = -1
-            return
-        elif message.content == ".":
-            if callingGuild.story != "":
-                await message.channel.send("**Story complete!**")
-                await message.channel.send(callingGuild.story)
-                callingGuild.story = ""
-                callingGuild.lastAuthorID = -1
-        else:
-            msgSplit = message.content.split(" ")
-            if len(msgSplit) > 2 or len(msgSplit) == 2 and msgSplit[0] not in cfg.ignoredSymbols:
-                await message.channel.send(f":boom: **Story broken, {message.author.mention}!** You only add one {'emoji' if callingGuild.emojiOnly else 'word'} at a time!")
-                if callingGuild.story:
-                    await message.channel.send(callingGuild.story)
-                callingGuild.story = ""
-                callingGuild.lastAuthorID = -1
-                if callingGuild.emojiOnlyErrSent:
-                    callingGuild.emojiOnlyErrSent = False
-            elif len(callingGuild.story) + len(message.content) > 2000:
-                await message.channel.send(":boom: **Max story length exceeded!**")
-                await message.channel.send(callingGuild.story)
-                callingGuild.story = ""
-                callingGuild.lastAuthorID = -1
-            else:
-                if callingGuild.emojiOnly:
-                    if not (lib.emojis.strIsCustomEmoji(message.content) or lib.emojis.strIsUnicodeEmoji(message.content)):
-                        await message.delete()
-                        if not callingGuild.emojiOnlyErrSent:
-                            await message.channel.send(message.author.mention + " emoji only mode is enabled! You can only contribute a single emoji.")
-                            callingGuild.emojiOnlyErrSent = True
-                        return
-                    try:
-                        lib.emojis.BasedEmoji.fromStr(message.content, rejectInvalid=True)
-                    except (lib.exceptions.UnrecognisedCustomEmoji, TypeError):
-                        await message.delete()
-                        await message.channel.send(message.author.mention + " please only use standard emojis or emojis from this server!")
-                        return
-                    if callingGuild.emojiOnlyErrSent:
-                        callingGuild.emojiOnlyErrSent = False
-                if len(msgSplit) > 1 and msgSplit[0] == "-":
-                    callingGuild.story += " " + message.content
-                elif len(msgSplit) > 1 and msgSplit[0] in cfg.ignoredSymbols:
-                    callingGuild.story += message.content
-                else:
-                    callingGuild.story += " " + message.content
-                callingGuild.lastAuthorID = message.author.id
+        await storyEngine.turnQueue.takeTurn(callingGuild.id, message.id,
+                                                functools.partial(storyEngine.playTurn, message, message.content))
 
 
 @botState.client.event
@@ -510,16 +668,22 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     """
     # ignore bot reactions
     if payload.user_id != botState.client.user.id:
-        # Get rich, useable reaction data
-        _, user, emoji = await lib.discordUtil.reactionFromRaw(payload)
-        if None in [user, emoji]:
+        # Check the reacted message is a reaction menu before looking anything up
+        menu = botState.reactionMenusDB.get(payload.message_id, None)
+        if menu is None:
             return
 
-        # If the message reacted to is a reaction menu
-        if payload.message_id in botState.reactionMenusDB and \
-                botState.reactionMenusDB[payload.message_id].hasEmojiRegistered(emoji):
-            # Envoke the reacted option's behaviour
-            await botState.reactionMenusDB[payload.message_id].reactionAdded(emoji, user)
+        # Only resolve the reacting user for emojis which are options in the menu.
+        # The menu already holds its message, so there is no need to fetch it.
+        emoji = lib.discordUtil.emojiFromRaw(payload)
+        if emoji is None or not menu.hasEmojiRegistered(emoji):
+            return
+        user = await lib.discordUtil.userFromRaw(payload)
+        if user is None:
+            return
+
+        # Envoke the reacted option's behaviour
+        await menu.reactionAdded(emoji, user)
 
 
 @botState.client.event
@@ -531,16 +695,22 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     """
     # ignore bot reactions
     if payload.user_id != botState.client.user.id:
-        # Get rich, useable reaction data
-        _, user, emoji = await lib.discordUtil.reactionFromRaw(payload)
-        if None in [user, emoji]:
+        # Check the reacted message is a reaction menu before looking anything up
+        menu = botState.reactionMenusDB.get(payload.message_id, None)
+        if menu is None:
             return
 
-        # If the message reacted to is a reaction menu
-        if payload.message_id in botState.reactionMenusDB and \
-                botState.reactionMenusDB[payload.message_id].hasEmojiRegistered(emoji):
-            # Envoke the reacted option's behaviour
-            await botState.reactionMenusDB[payload.message_id].reactionRemoved(emoji, user)
+        # Only resolve the reacting user for emojis which are options in the menu.
+        # The menu already holds its message, so there is no need to fetch it.
+        emoji = lib.discordUtil.emojiFromRaw(payload)
+        if emoji is None or not menu.hasEmojiRegistered(emoji):
+            return
+        user = await lib.discordUtil.userFromRaw(payload)
+        if user is None:
+            return
+
+        # Envoke the reacted option's behaviour
+        await menu.reactionRemoved(emoji, user)
 
 
 @botState.client.event
@@ -550,6 +720,7 @@ async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
 
     :param discord.RawMessageDeleteEvent payload: An event describing the message deleted.
     """
+    botState.messageCache.invalidate(payload.message_id)
     if payload.message_id in botState.reactionMenusDB:
         await botState.reactionMenusDB[payload.message_id].delete()
 
@@ -562,10 +733,23 @@ async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent)
     :param discord.RawBulkMessageDeleteEvent payload: An event describing all messages deleted.
     """
     for msgID in payload.message_ids:
+        botState.messageCache.invalidate(msgID)
         if msgID in botState.reactionMenusDB:
             await botState.reactionMenusDB[msgID].delete()
 
 
+@botState.client.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    """Called every time a message is edited.
+    If the message is cached, remove it from the cache so that it is refetched when next needed.
+    Edits made by the bot are ignored, as these already update the edited message object.
+
+    :param discord.RawMessageUpdateEvent payload: An event describing the message edited.
+    """
+    if payload.data.get("author", {}).get("id", None) != str(botState.client.user.id):
+        botState.messageCache.invalidate(payload.message_id)
+
+
 def run():
     """Runs the bot. Ensure that prior to importing this module, you have initialized your bot config
     by running cfg.configurator.init()
@@ -9,6 +9,7 @@ client = None
 usersDB = None
 guildsDB = None
 reactionMenusDB = None
+storyJournal = None
 
 logger = None
 
@@ -17,6 +18,9 @@ dbSaveTT = None
 # Reaction Menus
 reactionMenusDB = None
 reactionMenusTTDB = None
+messageCache = None
+reactionSeeder = None
+editCoalescer = None
 
 shutdown = ShutDownState.restart
 
@@ -35,10 +35,16 @@ timeouts = {
 }
 
 paths = {
-    # path to JSON files for database saves
+    # path to JSON files for database saves.
+    # Users and guilds may instead be saved in a faster binary format by ending their paths in .msgpack (requires the
+    # msgpack package), or .msgpack.z to also compress them. Existing JSON saves are read automatically when switching.
     "usersDB": "saveData" + "/" + "users.json",
     "guildsDB": "saveData" + "/" + "guilds.json",
     "reactionMenusDB": "saveData" + "/" + "reactionMenus.json",
+    # path to the saved reaction menu timeouts, which are restored when the bot restarts
+    "timedTasksDB": "saveData" + "/" + "timedTasks.json",
+    # path to the journal of story changes made since the guilds database was last saved
+    "storyJournal": "saveData" + "/" + "guilds.journal",
 
     # path to folder to save log txts to
     "logsFolder": "saveData" + "/" + "logs"
@@ -62,11 +68,51 @@ includedCommandModules = ("usr_misc",
 # Text to edit into expired menu messages
 expiredMenuMsg = "😴 This role menu has now expired."
 
-# Can currently only be "fixed"
-timedTaskCheckingType = "fixed"
-# Number of seconds by with the expiry of a timedtask may acceptably be late
+# When saving users and guilds, only changed records are written, appended to a delta file alongside the database file.
+# Once the delta file holds more than this many records per record in the database, the full database is saved instead.
+dbDeltaCompactionRatio = 0.5
+
+# Users and guilds are stored with SQLite rather than JSON if their paths above end in .sqlite, .sqlite3 or .db.
+# With SQLite, records are only loaded when needed. This is the number of recently used records to keep loaded.
+sqliteCacheSize = 1000
+
+# Guilds are loaded from the guilds database when first used. This is the number of recently used guilds to keep loaded.
+guildCacheSize = 1000
+
+# Reaction menu messages are cached to avoid refetching them. This is the number of recently used messages to keep.
+messageCacheSize = 1000
+
+# Cached messages do not see reactions or edits made by other users, so are refetched after this many seconds
+messageCacheTTLSeconds = 300
+
+# Menu option reactions are sent without waiting for each other, but at most one per this many seconds in each channel
+reactionSeedingIntervalSeconds = 0.25
+
+# Edits to the same menu message are sent at least this many seconds apart, with edits in between combined into one
+menuEditWindowSeconds = 1
+
+# Saved reaction menus are restored on startup concurrently across channels, with at most this many messages fetched at once
+menuRestoreMaxRequests = 10
+
+# Story changes are journaled to disk in batches. This is the maximum number of milliseconds a change may wait to be written.
+storyJournalFlushMilliseconds = 100
+
+# "fixed" to check for expired timedtasks at a regular interval, or "dynamic" to sleep until the next task is due
+timedTaskCheckingType = "dynamic"
+# When timedTaskCheckingType is "fixed", the number of seconds by with the expiry of a timedtask may acceptably be late
 timedTaskLatenessThresholdSeconds = 10
 
+# How to schedule reaction menu expiry: "heap" for a TimedTaskHeap, or "wheel" for a TimingWheel,
+# which schedules and cancels in constant time, but expires menus up to timingWheelTickSeconds late
+reactionMenuSchedulerType = "heap"
+# Maximum number of reaction menus that may be expiring at once
+maxConcurrentMenuExpiries = 50
+# Length of a TimingWheel tick, in seconds
+timingWheelTickSeconds = 1
+# Number of slots in a TimingWheel. Menu expiry times up to timingWheelTickSeconds * timingWheelSlots apart are spread
+# across different slots
+timingWheelSlots = 4096
+
 # Whether or not to check for updates to BASED
 BASED_checkForUpdates = True
 
@@ -86,6 +132,8 @@ ignoredSymbols = ('.', ',', '!', '?', '`', '%', '&', '(', ')', '[', ']', '-', '+
                     '~', "'", '"', '_', '\n', ':', ';', '...')
 
 pollMenuResultsBarLength = 10
+# The maximum number of discord API requests that may be in progress at once when finalising a batch of expired polls
+pollFinaliserMaxRequests = 5
 
 promptLocations = ["Sydney", "York", "Pisa", "Mumbai", "Santiago", "the street", "a gloomy alley", "a forest",
                     "the Austrian alps", "Indonesia", "Luxembourg", "Palestine", "WHSmiths", "the basement",
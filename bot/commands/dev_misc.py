@@ -62,7 +62,7 @@ async def dev_cmd_save(message: discord.Message, args: str, isDM: bool):
     :param bool isDM: Whether or not the command is being called from a DM channel
     """
     try:
-        botState.client.saveAllDBs()
+        await botState.client.saveAllDBsAsync()
     except Exception as e:
         print("SAVING ERROR", e.__class__.__name__)
         print(traceback.format_exc())
@@ -74,6 +74,36 @@ async def dev_cmd_save(message: discord.Message, args: str, isDM: bool):
 botCommands.register("save", dev_cmd_save, 3, allowDM=True, useDoc=True)
 
 
+async def dev_cmd_message_cache(message: discord.Message, args: str, isDM: bool):
+    """developer command printing the size and hit rate of the reaction menu message cache
+
+    :param discord.Message message: the discord message calling the command
+    :param str args: ignored
+    :param bool isDM: Whether or not the command is being called from a DM channel
+    """
+    cache = botState.messageCache
+    await message.channel.send("message cache: " + str(len(cache)) + "/" + str(cache.cacheSize) + " messages, " +
+                                str(cache.hits) + " hits, " + str(cache.misses) + " misses (" +
+                                str(round(cache.hitRate() * 100, 1)) + "% hit rate)")
+
+botCommands.register("message-cache", dev_cmd_message_cache, 3, allowDM=True, useDoc=True)
+
+
+async def dev_cmd_reaction_seeding(message: discord.Message, args: str, isDM: bool):
+    """developer command printing the latency of adding option reactions to reaction menus
+
+    :param discord.Message message: the discord message calling the command
+    :param str args: ignored
+    :param bool isDM: Whether or not the command is being called from a DM channel
+    """
+    seeder = botState.reactionSeeder
+    await message.channel.send("reaction seeding: " + str(seeder.numSeeded) + " menus, " + str(seeder.numRequests) +
+                                " requests, mean " + str(round(seeder.meanSeconds(), 2)) + "s, max " +
+                                str(round(seeder.maxSeconds, 2)) + "s")
+
+botCommands.register("reaction-seeding", dev_cmd_reaction_seeding, 3, allowDM=True, useDoc=True)
+
+
 async def dev_cmd_say(message: discord.Message, args: str, isDM: bool):
     """developer command sending a message to the same channel as the command is called in
 
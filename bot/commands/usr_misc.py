@@ -4,6 +4,7 @@ from bot.cfg import versionInfo
 import discord
 from datetime import datetime, timezone, timedelta
 import random
+import functools
 
 from . import commandsDB as botCommands
 from . import util_help
@@ -11,7 +12,7 @@ from .. import lib
 from ..cfg import versionInfo, cfg
 from ..scheduling import timedTask
 from ..reactionMenus import reactionPollMenu, reactionMenu
-from ..users import basedUser
+from ..users import basedUser, storyEngine
 
 from random_word import RandomWords
 wordPicker = RandomWords()
@@ -65,6 +66,27 @@ async def cmd_source(message: discord.Message, args: str, isDM: bool):
 botCommands.register("source", cmd_source, 0, allowDM=True, signatureStr="**source**", shortHelp="Show links to the project's GitHub page.")
 
 
+async def showPollStatus(message : discord.Message):
+    """Show the current results of the calling user's running poll.
+
+    :param discord.Message message: the discord message calling the command
+    """
+    for menu in botState.reactionMenusDB.menusOwnedBy(message.author.id):
+        if isinstance(menu, reactionPollMenu.ReactionPollMenu):
+            break
+    else:
+        await message.channel.send(":x: You don't have a poll running!")
+        return
+
+    statusEmbed = lib.discordUtil.makeEmbed(titleTxt="Poll Status", desc=menu.desc + "\n[Go to poll](" + menu.msg.jump_url + ")",
+                                            col=menu.col, authorName=menu.authorName, icon=menu.icon)
+    statusEmbed.add_field(name="Results so far", value=reactionPollMenu.makeResultsStr(menu.getResults()), inline=False)
+    if menu.timeout is not None:
+        statusEmbed.set_footer(text="This poll will end in " +
+                                    lib.timeUtil.td_format_noYM(max(menu.timeout.expiryTime - datetime.utcnow(), timedelta(0))) + ".")
+    await message.channel.send(embed=statusEmbed)
+
+
 async def cmd_poll(message : discord.Message, args : str, isDM : bool):
     """Run a reaction-based poll, allowing users to choose between several named options.
     Users may not create more than one poll at a time, anywhere.
@@ -88,6 +110,8 @@ async def cmd_poll(message : discord.Message, args : str, isDM : bool):
 
     Polls must have a run length. That is, specifying ALL run time kwargs as 'off' will return an error.
 
+    Giving args as just 'status' instead shows the current results of the calling user's running poll.
+
     TODO: restrict target kwarg to just roles, not users
     TODO: Change options list formatting from comma separated to new line separated
     TODO: Support target IDs
@@ -96,6 +120,10 @@ async def cmd_poll(message : discord.Message, args : str, isDM : bool):
     :param str args: A comma-separated list of space-separated emoji-option pairs, and optionally any kwargs as specified in this function's docstring
     :param bool isDM: Whether or not the command is being called from a DM channel
     """
+    if args.strip().lower() == "status":
+        await showPollStatus(message)
+        return
+
     if botState.usersDB.getOrAddID(message.author.id).pollOwned:
         await message.channel.send(":x: You can only make one poll at a time!")
         return
@@ -217,7 +245,7 @@ async def cmd_poll(message : discord.Message, args : str, isDM : bool):
     botState.reactionMenusDB[menuMsg.id] = menu
     botState.usersDB.getUser(message.author.id).pollOwned = True
 
-botCommands.register("poll", cmd_poll, 0, forceKeepArgsCasing=True, allowDM=False, signatureStr="**poll** *<subject>*\n**<option1 emoji> <option1 name>**\n...    ...\n*[kwargs]*", shortHelp="Start a reaction-based poll. Each option must be on its own new line, as an emoji, followed by a space, followed by the option name.", longHelp="Start a reaction-based poll. Each option must be on its own new line, as an emoji, followed by a space, followed by the option name. The `subject` is the question that users answer in the poll and is optional, to exclude your subject simply give a new line.\n\n__Optional Arguments__\nOptional arguments should be given by `name=value`, with each arg on a new line.\n- Give `multiplechoice=no` to only allow one vote per person (default: yes).\n- Give `target=@role mention` to limit poll participants only to users with the specified role.\n- You may specify the length of the poll, with each time division on a new line. Acceptable time divisions are: `seconds`, `minutes`, `hours`, `days`. (default: minutes=5)")
+botCommands.register("poll", cmd_poll, 0, forceKeepArgsCasing=True, allowDM=False, signatureStr="**poll** *<subject>*\n**<option1 emoji> <option1 name>**\n...    ...\n*[kwargs]*", shortHelp="Start a reaction-based poll. Each option must be on its own new line, as an emoji, followed by a space, followed by the option name.", longHelp="Start a reaction-based poll. Each option must be on its own new line, as an emoji, followed by a space, followed by the option name. The `subject` is the question that users answer in the poll and is optional, to exclude your subject simply give a new line.\n\n__Optional Arguments__\nOptional arguments should be given by `name=value`, with each arg on a new line.\n- Give `multiplechoice=no` to only allow one vote per person (default: yes).\n- Give `target=@role mention` to limit poll participants only to users with the specified role.\n- You may specify the length of the poll, with each time division on a new line. Acceptable time divisions are: `seconds`, `minutes`, `hours`, `days`. (default: minutes=5)\n\nGive `poll status` to see the current results of your running poll.")
 
 
 async def cmd_prompt(message: discord.Message, args: str, isDM: bool):
@@ -271,21 +299,23 @@ async def cmd_random(message: discord.Message, args: str, isDM: bool):
         await message.channel.send(":x: This server does not have a story channel!")
     elif callingGuild.storyChannelID != message.channel.id:
         await message.channel.send(":x: This command can only be used from the story channel!")
-    elif callingGuild.lastAuthorID == message.author.id:
-        await message.channel.send(":boom: **Story broken, " + message.author.mention + "!** It wasn't your turn!")
-        await message.channel.send(callingGuild.story)
-        callingGuild.story = ""
-        callingGuild.lastAuthorID = -1
     else:
-        callingGuild.lastAuthorID = message.author.id
-        excludes = "adjective, adverb, interjection, pronoun, preposition, abbreviation, affix, article, auxiliary-verb, conjunction, definite-article, family-name, given-name, idiom, imperative, noun-plural, noun-posessive, past-participle, phrasal-prefix, proper-noun, proper-noun-plural, proper-noun-posessive, suffix, verb-intransitive, verb-transitive"
-        if args == "noun":
-            excludes += ", verb"
-        else:
-            excludes += ", noun"
-        newWord = wordPicker.get_random_word(includePartOfSpeech=args, excludePartOfSpeech=excludes)#hasDictionaryDef="true", 
-        callingGuild.story += " " + newWord
-        await message.reply(newWord)
+        async def randomTurn():
+            turnGuild = botState.guildsDB.getGuild(message.guild.id)
+            if not await storyEngine.respondToTurn(message, turnGuild, turnGuild.storyEngine.checkTurn(message.author.id)[0]):
+                return None
+            excludes = "adjective, adverb, interjection, pronoun, preposition, abbreviation, affix, article, auxiliary-verb, conjunction, definite-article, family-name, given-name, idiom, imperative, noun-plural, noun-posessive, past-participle, phrasal-prefix, proper-noun, proper-noun-plural, proper-noun-posessive, suffix, verb-intransitive, verb-transitive"
+            if args == "noun":
+                excludes += ", verb"
+            else:
+                excludes += ", noun"
+            newWord = wordPicker.get_random_word(includePartOfSpeech=args, excludePartOfSpeech=excludes)#hasDictionaryDef="true", 
+            turnGuild.addToStory(" " + newWord, message.author.id)
+            return newWord
+
+        newWord = await storyEngine.turnQueue.takeTurn(callingGuild.id, message.id, randomTurn)
+        if newWord is not None:
+            await message.reply(newWord)
     
 
 botCommands.register("random", cmd_random, 0, allowDM=False, signatureStr="**random [word-type]**", shortHelp="Have the bot choose a random word to contribute to the story in place of your turn.\n`word-type` must be either `noun` or `verb`.") 
@@ -411,45 +441,9 @@ async def cmd_newline(message: discord.Message, args: str, isDM: bool):
         await message.channel.send(":x: This server does not have a story channel!")
     elif callingGuild.storyChannelID != message.channel.id:
         await message.channel.send(":x: This command can only be used from the story channel!")
-    elif callingGuild.lastAuthorID == message.author.id:
-        await message.channel.send(":boom: **Story broken, " + message.author.mention + "!** It wasn't your turn!")
-        await message.channel.send(callingGuild.story)
-        callingGuild.story = ""
-        callingGuild.lastAuthorID = -1
     else:
-        args = "\n" + args
-        msgSplit = args.split(" ")
-        if len(msgSplit) > 2:
-            await message.channel.send(f":boom: **Story broken, {message.author.mention}!** You only add one {'emoji' if callingGuild.emojiOnly else 'word'} at a time!")
-            if callingGuild.story:
-                await message.channel.send(callingGuild.story)
-            callingGuild.story = ""
-            callingGuild.lastAuthorID = -1
-            if callingGuild.emojiOnlyErrSent:
-                callingGuild.emojiOnlyErrSent = False
-        elif len(callingGuild.story) + len(args) > 2000:
-            await message.channel.send(":boom: **Max story length exceeded!**")
-            await message.channel.send(callingGuild.story)
-            callingGuild.story = ""
-            callingGuild.lastAuthorID = -1
-        else:
-            if callingGuild.emojiOnly:
-                if not (lib.emojis.strIsCustomEmoji(args) or lib.emojis.strIsUnicodeEmoji(args)):
-                    await message.delete()
-                    if not callingGuild.emojiOnlyErrSent:
-                        await message.channel.send(message.author.mention + " emoji only mode is enabled! You can only contribute a single emoji.")
-                        callingGuild.emojiOnlyErrSent = True
-                    return
-                try:
-                    lib.emojis.BasedEmoji.fromStr(args, rejectInvalid=True)
-                except (lib.exceptions.UnrecognisedCustomEmoji, TypeError):
-                    await message.delete()
-                    await message.channel.send(message.author.mention + " please only use standard emojis or emojis from this server!")
-                    return
-                if callingGuild.emojiOnlyErrSent:
-                    callingGuild.emojiOnlyErrSent = False
-            callingGuild.story += " " + args
-            callingGuild.lastAuthorID = message.author.id
+        await storyEngine.turnQueue.takeTurn(callingGuild.id, message.id,
+                                                functools.partial(storyEngine.playTurn, message, "\n" + args, allowSymbols=False))
     
 
 botCommands.register("nl", cmd_newline, 0, allowDM=False, aliases=["n", "newline", "new-line", "line", "return"], signatureStr="**nl <word/emoji>**", shortHelp="Add a new line to the story, followed by your word if one is given. Your message must be strictly one word/emoji - ignored symbols do not apply, e.g ending off a quote or brackets.") 
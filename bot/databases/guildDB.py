@@ -2,21 +2,43 @@ from __future__ import annotations
 
 from ..users import basedGuild
 from typing import List
+from collections import OrderedDict
+import weakref
 from .. import botState
-from ..baseClasses import serializable
+from ..baseClasses import serializable, changeTracked
 from .. import lib
+from ..cfg import cfg
 
 
-class GuildDB(serializable.Serializable):
+class GuildDB(serializable.Serializable, changeTracked.ChangeTrackingDB):
     """A database of BasedGuilds.
 
-    :var guilds: Dictionary of guild.id to guild, where guild is a BasedGuild
-    :vartype guilds: dict[int, BasedGuild]
+    Guilds are stored in dictionary-serialized form, and only built into BasedGuild objects when first requested.
+    The most recently used BasedGuilds are kept, and the rest are serialized back into dictionaries.
+    Every BasedGuild built is also tracked in an identity map of weak references, so a guild which is evicted while still
+    in use elsewhere, e.g by a story turn awaiting a message send, is never built a second time. Requesting it again
+    returns the object in use, and it is serialized from that object rather than from guildData.
+
+    :var guilds: Most recently used BasedGuilds, keyed by guild ID, from least to most recently used
+    :vartype guilds: OrderedDict[int, BasedGuild]
+    :var guildData: Dictionary-serialized guilds which are not currently in guilds, keyed by guild ID
+    :vartype guildData: dict[int, dict]
+    :var cacheSize: The maximum number of BasedGuilds to keep in guilds
+    :vartype cacheSize: int
+    :var liveGuilds: Every BasedGuild object currently in memory, including evicted guilds still in use, keyed by guild ID
+    :vartype liveGuilds: weakref.WeakValueDictionary
     """
 
-    def __init__(self):
+    def __init__(self, cacheSize: int = None):
+        """
+        :param int cacheSize: The maximum number of BasedGuild objects to keep in memory (Default cfg.guildCacheSize)
+        """
+        super().__init__()
         # Store guilds as a dict of guild.id: guild
-        self.guilds = {}
+        self.guilds = OrderedDict()
+        self.guildData = {}
+        self.cacheSize = cfg.guildCacheSize if cacheSize is None else cacheSize
+        self.liveGuilds = weakref.WeakValueDictionary()
 
 
     def getIDs(self) -> List[int]:
@@ -25,26 +47,70 @@ class GuildDB(serializable.Serializable):
         :return: A list containing all guild IDs (ints) stored in the database.
         :rtype: list
         """
-        return list(self.guilds.keys())
+        return list(self.guilds.keys()) + list(self.guildData.keys())
 
 
     def getGuilds(self) -> List[basedGuild.BasedGuild]:
         """Get a list of all BasedGuilds in the database.
+        ⚠ This builds a BasedGuild object for every guild in the database.
 
         :return: A list containing all BasedGuild objects stored in the database
         :rtype: list
         """
-        return list(self.guilds.values())
+        guilds = []
+        for id in self.getIDs():
+            try:
+                guilds.append(self.getGuild(id))
+            except KeyError:
+                pass
+        return guilds
+
+
+    def storeGuild(self, guild: basedGuild.BasedGuild):
+        """Store a BasedGuild object as the most recently used guild.
+        If too many BasedGuilds are stored, the least recently used guild is serialized back into guildData.
+
+        :param BasedGuild guild: The guild to store
+        """
+        self.guilds[guild.id] = guild
+        self.guilds.move_to_end(guild.id)
+        self.liveGuilds[guild.id] = guild
+        self.guildData.pop(guild.id, None)
+        while len(self.guilds) > self.cacheSize:
+            evictedID, evicted = self.guilds.popitem(last=False)
+            self.guildData[evictedID] = evicted.toDict()
 
 
     def getGuild(self, id: int) -> basedGuild.BasedGuild:
-        """Get the BasedGuild object with the specified ID.
+        """Get the BasedGuild object with the specified ID, building it from its serialized form if needed.
+        Guilds that the bot can no longer access are removed from the database.
 
         :param str id: integer discord ID for the requested guild
+        :raise KeyError: If no guild exists with the requested ID
         :return: BasedGuild having the requested ID
         :rtype: BasedGuild
         """
-        return self.guilds[id]
+        if id in self.guilds:
+            self.guilds.move_to_end(id)
+            return self.guilds[id]
+        # The guild was evicted, but is still in use elsewhere
+        guild = self.liveGuilds.get(id)
+        if guild is not None:
+            self.storeGuild(guild)
+            return guild
+
+        try:
+            guild = basedGuild.BasedGuild.fromDict(self.guildData[id], id=id)
+        except lib.exceptions.NoneDCGuildObj:
+            botState.logger.log("GuildDB", "getGuild", "no corresponding discord guild found for ID " + str(id) +
+                                                        ", guild removed from database",
+                                category="guildsDB", eventType="NULL_GLD")
+            del self.guildData[id]
+            self.changedIDs.add(id)
+            raise KeyError(id)
+        guild.changeListener = self.recordChanged
+        self.storeGuild(guild)
+        return guild
 
 
     def idExists(self, id: int) -> bool:
@@ -54,14 +120,7 @@ class GuildDB(serializable.Serializable):
         :return: True if a BasedGuild is stored in the database with the requested ID, False otherwise
         :rtype: bool
         """
-        # Search the DB for the requested ID
-        try:
-            self.getGuild(id)
-        # No BasedGuild found, return False
-        except KeyError:
-            return False
-        # Return True otherwise
-        return True
+        return id in self.guilds or id in self.guildData
 
 
     def guildExists(self, guild: basedGuild.BasedGuild) -> bool:
@@ -84,8 +143,10 @@ class GuildDB(serializable.Serializable):
         """
         # Ensure guild is not yet in the database
         if self.guildExists(guild):
-            raise KeyError("Attempted to add a guild that already exists: " + guild.id)
-        self.guilds[guild.id] = guild
+            raise KeyError("Attempted to add a guild that already exists: " + str(guild.id))
+        self.storeGuild(guild)
+        guild.changeListener = self.recordChanged
+        self.recordChanged(guild)
 
 
     def addID(self, id: int) -> basedGuild.BasedGuild:
@@ -101,16 +162,52 @@ class GuildDB(serializable.Serializable):
         if self.idExists(id):
             raise KeyError("Attempted to add a guild that already exists: " + str(id))
         # Create and return a BasedGuild for the requested ID
-        self.guilds[id] = basedGuild.BasedGuild(id, botState.client.get_guild(id))
-        return self.guilds[id]
+        newGuild = basedGuild.BasedGuild(id, botState.client.get_guild(id))
+        self.storeGuild(newGuild)
+        newGuild.changeListener = self.recordChanged
+        self.recordChanged(newGuild)
+        return newGuild
 
 
     def removeID(self, id: int):
         """Remove the BasedGuild with the requested ID from the database.
 
         :param int id: integer discord ID to remove from the database
+        :raise KeyError: If no guild exists with the requested ID
+        """
+        if id in self.guilds:
+            self.guilds.pop(id).changeListener = None
+        else:
+            del self.guildData[id]
+        guild = self.liveGuilds.pop(id, None)
+        if guild is not None:
+            guild.changeListener = None
+        self.changedIDs.add(id)
+
+
+    def serialiseEvicted(self, id: int, **kwargs) -> dict:
+        """Serialise a guild which is not in guilds, from its BasedGuild object if it is still in use, or from guildData.
+
+        :param int id: The ID of the guild to serialise
+        :return: The dictionary-serialized guild, or None if no such guild exists
+        :rtype: dict
         """
-        self.guilds.pop(id)
+        guild = self.liveGuilds.get(id)
+        if guild is not None:
+            return guild.toDict(**kwargs)
+        return self.guildData.get(id)
+
+
+    def recordChanged(self, guild: basedGuild.BasedGuild):
+        """Mark the given guild as changed.
+        If the guild was serialized back into guildData while still in use elsewhere, it is stored again, so that the
+        change is not lost.
+
+        :param BasedGuild guild: The guild that changed
+        """
+        super().recordChanged(guild)
+        if guild.id in self.guildData:
+            self.storeGuild(guild)
 
 
     def removeGuild(self, guild: basedGuild.BasedGuild):
@@ -128,16 +225,40 @@ class GuildDB(serializable.Serializable):
         :return: A dictionary containing all data needed to recreate this GuildDB
         :rtype: dict
         """
-        data = {}
+        # Guilds evicted from guilds are serialised from their BasedGuild if still in use, and are otherwise already serialised
+        data = {str(id): self.serialiseEvicted(id, **kwargs) for id in self.guildData}
         # Iterate over all stored guilds
-        for guild in self.getGuilds():
+        for guild in self.guilds.values():
             # Serialise and then store each guild
             # JSON stores properties as strings, so ids must be converted to str first.
-            print("GUILDID",guild.id)
             data[str(guild.id)] = guild.toDict(**kwargs)
         return data
 
 
+    def toDeltaDict(self, **kwargs) -> dict:
+        """Serialise only the guilds that have been added, removed or modified since the last save.
+
+        :return: A dictionary mapping the string IDs of changed guilds to their serialised form, or None if removed
+        :rtype: dict
+        """
+        data = {}
+        for id in self.changedIDs:
+            if id in self.guilds:
+                data[str(id)] = self.guilds[id].toDict(**kwargs)
+            else:
+                data[str(id)] = self.serialiseEvicted(id, **kwargs)
+        return data
+
+
+    def __len__(self) -> int:
+        """Get the number of guilds stored in the database.
+
+        :return: The number of guilds in the database
+        :rtype: int
+        """
+        return len(self.guilds) + len(self.guildData)
+
+
     def __str__(self) -> str:
         """Fetch summarising information about the database, as a string
         Currently only the number of guilds stored
@@ -145,28 +266,22 @@ class GuildDB(serializable.Serializable):
         :return: A string summarising this db
         :rtype: str
         """
-        return "<GuildDB: " + str(len(self.guilds)) + " guilds>"
+        return "<GuildDB: " + str(len(self)) + " guilds>"
 
 
     @classmethod
     def fromDict(cls, guildDBDict: dict, **kwargs) -> GuildDB:
         """Construct a GuildDB object from dictionary-serialised format; the reverse of GuildDB.todict()
+        Guilds are kept in serialised form, and only built into BasedGuild objects when first requested with getGuild.
 
-        :param dict bountyDBDict: The dictionary representation of the GuildDB to create
+        :param dict guildDBDict: The dictionary representation of the GuildDB to create. May also be an iterator over
+                                    (guild ID, serialised guild) pairs, e.g from lib.jsonHandler.iterDBWithDeltas.
         :return: The new GuildDB
         :rtype: GuildDB
         """
         # Instance the new GuildDB
         newDB = GuildDB()
-        # Iterate over all IDs to add to the DB
-        for id in guildDBDict.keys():
-            # Instance new BasedGuilds for each ID, with the provided data
-            # JSON stores properties as strings, so ids must be converted to int first.
-            try:
-                newDB.addGuild(basedGuild.BasedGuild.fromDict(guildDBDict[id], id=int(id)))
-            # Ignore guilds that don't have a corresponding dcGuild
-            except lib.exceptions.NoneDCGuildObj:
-                botState.logger.log("GuildDB", "fromDict", "no corresponding discord guild found for ID " + id +
-                                                            ", guild removed from database",
-                                    category="guildsDB", eventType="NULL_GLD")
+        # JSON stores properties as strings, so ids must be converted to int first.
+        items = guildDBDict.items() if isinstance(guildDBDict, dict) else guildDBDict
+        newDB.guildData = {int(id): guildDict for id, guildDict in items}
         return newDB
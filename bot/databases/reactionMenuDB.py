@@ -1,4 +1,42 @@
+from __future__ import annotations
 from .. import botState
+from ..reactionMenus import reactionPollMenu
+from . import timedTaskDB
+from discord import NotFound, HTTPException, Forbidden
+from ..cfg import cfg
+import asyncio
+import time
+import traceback
+from typing import Dict, Iterable, List, Set, Tuple, Type, TYPE_CHECKING
+if TYPE_CHECKING:
+    from discord.abc import Messageable
+    from ..reactionMenus.reactionMenu import ReactionMenu
+
+# ReactionMenu subclasses which can be restored from file, by type name
+menuTypes: Dict[str, Type[ReactionMenu]] = {}
+
+
+def registerMenuType(menuType: Type[ReactionMenu], name: str = None) -> Type[ReactionMenu]:
+    """Allow saved reaction menus of the given type to be restored from file when the bot restarts.
+    The menu type must implement fromDict, accepting msg and restoredTasks kwargs.
+    This returns menuType, so may be used as a decorator.
+
+    :param type menuType: The ReactionMenu subclass to register
+    :param str name: The type name that menus are saved under (Default the name of menuType)
+    :return: menuType
+    :rtype: type
+    :raise KeyError: If a different menu type is already registered with the same name
+    """
+    if name is None:
+        name = menuType.__name__
+    if menuTypes.get(name, menuType) is not menuType:
+        raise KeyError("A reaction menu type is already registered with this name: " + name)
+    menuTypes[name] = menuType
+    return menuType
+
+
+registerMenuType(reactionPollMenu.ReactionPollMenu)
+
 
 # ReactionMenu subclasses that cannot be saved to dictionary
 # TODO: change to a class-variable reference e.g menu.__class__.SAVEABLE
@@ -6,8 +44,166 @@ unsaveableMenuTypes = ["ReactionDuelChallengeMenu"]
 
 
 class ReactionMenuDB(dict):
-    """A database of ReactionMenu instances.
-    Currently just an extension of dict to add toDict()."""
+    """A database of ReactionMenu instances, keyed by menu message ID.
+    Menus are also indexed by the guild and channel containing them, by the ID of the user who owns them, and by whether
+    they are saveable, so that menus in a given scope can be found without scanning every menu.
+    Indexes are kept up to date as menus are stored and removed.
+
+    :var guildMenus: The IDs of the menus in each guild, by guild ID
+    :vartype guildMenus: Dict[int, Set[int]]
+    :var channelMenus: The IDs of the menus in each channel, by channel ID
+    :vartype channelMenus: Dict[int, Set[int]]
+    :var ownerMenus: The IDs of the menus owned by each user, by user ID
+    :vartype ownerMenus: Dict[int, Set[int]]
+    :var unsaveableMenus: The IDs of the menus which cannot be saved to file
+    :vartype unsaveableMenus: Set[int]
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.guildMenus: Dict[int, Set[int]] = {}
+        self.channelMenus: Dict[int, Set[int]] = {}
+        self.ownerMenus: Dict[int, Set[int]] = {}
+        self.unsaveableMenus: Set[int] = set()
+
+
+    def indexKeys(self, menu: ReactionMenu) -> List[Tuple[Dict[int, Set[int]], int]]:
+        """Get the indexes that the given menu belongs in, and the key it is stored under in each.
+
+        :param ReactionMenu menu: The menu to index
+        :return: A list of (index, key) pairs
+        :rtype: List[Tuple[Dict[int, Set[int]], int]]
+        """
+        keys = [(self.channelMenus, menu.msg.channel.id)]
+        if menu.msg.guild is not None:
+            keys.append((self.guildMenus, menu.msg.guild.id))
+        owner = getattr(menu, "owningBasedUser", None)
+        if owner is not None:
+            keys.append((self.ownerMenus, owner.id))
+        return keys
+
+
+    def __setitem__(self, msgID: int, menu: ReactionMenu):
+        if msgID in self:
+            self.unindex(msgID)
+        super().__setitem__(msgID, menu)
+        for index, key in self.indexKeys(menu):
+            index.setdefault(key, set()).add(msgID)
+        if not menu.saveable:
+            self.unsaveableMenus.add(msgID)
+
+
+    def unindex(self, msgID: int):
+        """Remove the menu with the given ID from all indexes, leaving it in the database.
+
+        :param int msgID: The ID of the menu to unindex
+        """
+        for index, key in self.indexKeys(self[msgID]):
+            ids = index[key]
+            ids.discard(msgID)
+            if not ids:
+                del index[key]
+        self.unsaveableMenus.discard(msgID)
+
+
+    def __delitem__(self, msgID: int):
+        if msgID in self:
+            self.unindex(msgID)
+        super().__delitem__(msgID)
+
+
+    def pop(self, msgID: int, *default):
+        if msgID in self:
+            self.unindex(msgID)
+        return super().pop(msgID, *default)
+
+
+    def popitem(self):
+        raise NotImplementedError("ReactionMenuDB does not support popitem")
+
+
+    def setdefault(self, msgID: int, menu: ReactionMenu = None):
+        if msgID not in self:
+            self[msgID] = menu
+        return self[msgID]
+
+
+    def update(self, *args, **kwargs):
+        for msgID, menu in dict(*args, **kwargs).items():
+            self[msgID] = menu
+
+
+    def clear(self):
+        super().clear()
+        self.guildMenus.clear()
+        self.channelMenus.clear()
+        self.ownerMenus.clear()
+        self.unsaveableMenus.clear()
+
+
+    def getMenus(self, msgIDs: Iterable[int]) -> List[ReactionMenu]:
+        """Get the menus with the given IDs.
+
+        :param Iterable[int] msgIDs: The IDs of the menus to get
+        :return: The requested menus
+        :rtype: List[ReactionMenu]
+        """
+        return [self[msgID] for msgID in msgIDs]
+
+
+    def menusInGuild(self, guildID: int) -> List[ReactionMenu]:
+        """Get all menus in the guild with the given ID.
+
+        :param int guildID: The ID of the guild
+        :return: The menus in the guild
+        :rtype: List[ReactionMenu]
+        """
+        return self.getMenus(self.guildMenus.get(guildID, ()))
+
+
+    def menusInChannel(self, channelID: int) -> List[ReactionMenu]:
+        """Get all menus in the channel with the given ID.
+
+        :param int channelID: The ID of the channel
+        :return: The menus in the channel
+        :rtype: List[ReactionMenu]
+        """
+        return self.getMenus(self.channelMenus.get(channelID, ()))
+
+
+    def menusOwnedBy(self, userID: int) -> List[ReactionMenu]:
+        """Get all menus owned by the user with the given ID.
+
+        :param int userID: The ID of the user
+        :return: The menus owned by the user
+        :rtype: List[ReactionMenu]
+        """
+        return self.getMenus(self.ownerMenus.get(userID, ()))
+
+
+    def unsaveable(self) -> List[ReactionMenu]:
+        """Get all menus which cannot be saved to file.
+
+        :return: The unsaveable menus
+        :rtype: List[ReactionMenu]
+        """
+        return self.getMenus(self.unsaveableMenus)
+
+
+    async def deleteMenus(self, menus: List[ReactionMenu]):
+        """Delete all of the given menus at once, calling each menu's timeout expiry function.
+        Menus which fail to delete are logged and removed from the database.
+
+        :param List[ReactionMenu] menus: The menus to delete
+        """
+        results = await asyncio.gather(*(menu.delete() for menu in menus), return_exceptions=True)
+        for menu, result in zip(menus, results):
+            if isinstance(result, Exception):
+                botState.logger.log("ReactionMenuDB", "deleteMenus", "Failed to delete reaction menu " + str(menu.msg.id) +
+                                    ": " + type(result).__name__, category="reactionMenus", eventType="MENU_DEL_ERR",
+                                    trace="".join(traceback.format_exception(type(result), result, result.__traceback__)))
+                self.pop(menu.msg.id, None)
+
 
     def toDict(self, **kwargs) -> dict:
         """Serialise all saveable ReactionMenus in this DB into a single dictionary.
@@ -23,27 +219,79 @@ class ReactionMenuDB(dict):
         return data
 
 
-async def fromDict(dbDict: dict) -> ReactionMenuDB:
+async def restoreChannelMenus(channel: Messageable, menusData: List[Tuple[int, dict]], db: ReactionMenuDB,
+                                restoredTasks: timedTaskDB.TimedTaskDB, budget: asyncio.Semaphore) -> int:
+    """Restore the saved menus in one channel into db, one at a time.
+    Menus whose messages can no longer be found are skipped.
+
+    :param discord.abc.Messageable channel: The channel containing the menus
+    :param menusData: The IDs and dictionary-serialized forms of the menus to restore
+    :type menusData: List[Tuple[int, dict]]
+    :param ReactionMenuDB db: The database to restore the menus into
+    :param TimedTaskDB restoredTasks: Saved menu timeouts restored from file, for menus to claim
+    :param asyncio.Semaphore budget: Held while making discord API requests
+    :return: The number of menus restored
+    :rtype: int
+    """
+    numRestored = 0
+    for msgID, menuData in menusData:
+        try:
+            async with budget:
+                msg = await channel.fetch_message(menuData["msg"])
+        except (NotFound, Forbidden):
+            continue
+        except HTTPException:
+            botState.logger.log("reactionMenuDB", "restoreChannelMenus", "Failed to fetch reaction menu " + str(msgID),
+                                category="reactionMenus", eventType="MENU_LOAD_ERR", trace=traceback.format_exc())
+            continue
+        try:
+            menu = menuTypes[menuData["type"]].fromDict(menuData, msg=msg, restoredTasks=restoredTasks)
+            db[msgID] = menu
+            await menu.afterRestore(budget)
+            numRestored += 1
+        except Exception as e:
+            botState.logger.log("reactionMenuDB", "restoreChannelMenus", "Failed to restore reaction menu " + str(msgID) +
+                                ": " + type(e).__name__, category="reactionMenus", eventType="MENU_LOAD_ERR",
+                                trace=traceback.format_exc())
+            db.pop(msgID, None)
+    return numRestored
+
+
+async def fromDict(dbDict: dict, restoredTasks: timedTaskDB.TimedTaskDB = None, db: ReactionMenuDB = None) -> ReactionMenuDB:
     """Factory function constructing a new ReactionMenuDB from dictionary-serialized format;
     the opposite of ReactionMenuDB.toDict
+    Menus are rebuilt by their registered type. Menus of unregistered types, and menus whose channels or messages can no
+    longer be found, are skipped.
+    Channels are restored concurrently, with at most cfg.menuRestoreMaxRequests message fetches in flight. Menus become
+    available in the database as soon as they are restored.
 
     :param dict dbDict: A dictionary containing all info needed to reconstruct a ReactionMenuDB,
                         in accordance with ReactionMenuDB.toDict
-    :return: A new ReactionMenuDB instance as described by dbDict
+    :param TimedTaskDB restoredTasks: Saved menu timeouts restored from file, for menus to claim (Default None)
+    :param ReactionMenuDB db: The database to restore menus into (Default a new ReactionMenuDB)
+    :return: The database holding the restored menus
     :rtype: ReactionMenuDB
     """
-    newDB = ReactionMenuDB()
+    newDB = ReactionMenuDB() if db is None else db
+    start = time.perf_counter()
 
-    for msgID in dbDict:
-        dcGuild = botState.client.get_guild(dbDict[msgID]["guild"])
-        # msg = await dcGuild.get_channel(dbDict[msgID]["channel"]).fetch_message(dbDict[msgID]["msg"])
-
-        if botState.client.get_channel(dbDict[msgID]["channel"]) is None:
+    # Saved menus to restore, grouped by channel
+    channels: Dict[Messageable, List[Tuple[int, dict]]] = {}
+    for msgID, menuData in dbDict.items():
+        if menuData.get("type", None) not in menuTypes:
             continue
-        if "type" in dbDict[msgID]:
-            # if dbDict[msgID]["type"] == "ReactionInventoryPicker":
-            #     # newDB[int(msgID)] = ReactionInventoryPicker.fromDict(dbDict[msgID], msg=msg)
-            #     continue
+        channel = botState.client.get_channel(menuData["channel"])
+        if channel is None:
             continue
+        channels.setdefault(channel, []).append((int(msgID), menuData))
+
+    budget = asyncio.Semaphore(cfg.menuRestoreMaxRequests)
+    numRestored = sum(await asyncio.gather(*(restoreChannelMenus(channel, menusData, newDB, restoredTasks, budget)
+                                                for channel, menusData in channels.items())))
 
+    seconds = time.perf_counter() - start
+    botState.logger.log("reactionMenuDB", "fromDict", "Restored " + str(numRestored) + " of " + str(len(dbDict)) +
+                        " reaction menus from " + str(len(channels)) + " channels in " + str(round(seconds, 2)) + "s (" +
+                        str(round(numRestored / seconds if seconds else 0, 1)) + " menus/s)",
+                        category="reactionMenus", eventType="MENUS_RESTORED")
     return newDB
@@ -0,0 +1,544 @@
+"""SQLite storage for UserDB and GuildDB.
+
+Records are stored as JSON text, one row per record, keyed by ID. Only the records that are in use are held in memory;
+all other records are loaded from the database on demand. Changes are written to the database in a single transaction
+per save, in a worker thread.
+
+The storage backend for a database is chosen by the extension of its path in cfg.paths. Paths ending in one of
+SQLITE_EXTS are stored with SQLite, all others are stored as JSON.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import traceback
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .. import botState, lib
+from ..baseClasses import changeTracked
+from ..users import basedGuild
+from ..users.basedUser import BasedUser
+from . import guildDB, userDB
+
+
+# File extensions which select the SQLite storage backend
+SQLITE_EXTS = (".sqlite", ".sqlite3", ".db")
+
+
+def isSQLitePath(filePath: str) -> bool:
+    """Decide whether a database path in cfg.paths selects the SQLite storage backend.
+
+    :param str filePath: The path to the database file
+    :return: True if filePath ends with one of SQLITE_EXTS, False otherwise
+    :rtype: bool
+    """
+    return filePath.lower().endswith(SQLITE_EXTS)
+
+
+class SQLiteStore:
+    """A table of dictionary-serialized records stored in an SQLite database file, keyed by integer ID.
+
+    Reads are performed with a connection owned by the event loop's thread. Writes are performed with a separate
+    connection, which may be used from any thread but only by one thread at a time. The database is opened in WAL mode,
+    so reads are never blocked by an ongoing write.
+
+    :var filePath: Path to the SQLite database file
+    :vartype filePath: str
+    :var table: The name of the table storing the records
+    :vartype table: str
+    """
+
+    def __init__(self, filePath: str, table: str):
+        """
+        :param str filePath: Path to the SQLite database file. The file is created if it does not exist.
+        :param str table: The name of the table storing the records. Created if it does not exist.
+        """
+        self.filePath = filePath
+        self.table = table
+        self.writeLock = threading.Lock()
+        self.writer = sqlite3.connect(filePath, check_same_thread=False)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        with self.writer:
+            self.writer.execute("CREATE TABLE IF NOT EXISTS " + table + " (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self.reader = sqlite3.connect(filePath)
+
+
+    def get(self, id: int) -> Optional[dict]:
+        """Fetch the record with the given ID.
+
+        :param int id: The ID of the record to fetch
+        :return: The record with the given ID, or None if no such record is stored
+        :rtype: Optional[dict]
+        """
+        row = self.reader.execute("SELECT data FROM " + self.table + " WHERE id = ?", (id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+
+    def exists(self, id: int) -> bool:
+        """Decide whether a record is stored with the given ID.
+
+        :param int id: The ID to check
+        :return: True if a record is stored with the given ID, False otherwise
+        :rtype: bool
+        """
+        return self.reader.execute("SELECT 1 FROM " + self.table + " WHERE id = ?", (id,)).fetchone() is not None
+
+
+    def ids(self) -> List[int]:
+        """Get the IDs of all stored records.
+
+        :return: A list of the IDs of all stored records
+        :rtype: List[int]
+        """
+        return [row[0] for row in self.reader.execute("SELECT id FROM " + self.table)]
+
+
+    def count(self) -> int:
+        """Get the number of stored records.
+
+        :return: The number of stored records
+        :rtype: int
+        """
+        return self.reader.execute("SELECT COUNT(*) FROM " + self.table).fetchone()[0]
+
+
+    def items(self) -> Iterator[Tuple[int, dict]]:
+        """Iterate over all stored records. Records are read from the database one at a time.
+
+        :return: An iterator over tuples of (record ID, record)
+        :rtype: Iterator[Tuple[int, dict]]
+        """
+        for id, data in self.reader.execute("SELECT id, data FROM " + self.table):
+            yield id, json.loads(data)
+
+
+    def maxField(self, field: str) -> Optional[int]:
+        """Get the largest value of the given top-level field across all stored records.
+
+        :param str field: The name of the field
+        :return: The largest value of the field, or None if no record has the field
+        :rtype: Optional[int]
+        """
+        return self.reader.execute("SELECT MAX(json_extract(data, ?)) FROM " + self.table, ("$." + field,)).fetchone()[0]
+
+
+    def writeChanges(self, changes: Dict[int, Optional[dict]]):
+        """Write a batch of changes to the database in a single transaction.
+        This blocks until the transaction is committed, so should usually be called from a worker thread.
+
+        :param changes: A dictionary mapping record IDs to their new records, or None to delete the record
+        :type changes: Dict[int, Optional[dict]]
+        """
+        upserts = [(id, json.dumps(data)) for id, data in changes.items() if data is not None]
+        deletes = [(id,) for id, data in changes.items() if data is None]
+        with self.writeLock, self.writer:
+            self.writer.executemany("INSERT OR REPLACE INTO " + self.table + " (id, data) VALUES (?, ?)", upserts)
+            self.writer.executemany("DELETE FROM " + self.table + " WHERE id = ?", deletes)
+
+
+    def close(self):
+        """Close both database connections.
+        """
+        self.reader.close()
+        with self.writeLock:
+            self.writer.close()
+
+
+class SQLiteBackedDB(changeTracked.ChangeTrackingDB):
+    """Storage logic shared by SQLiteUserDB and SQLiteGuildDB.
+    Must appear before UserDB/GuildDB in the bases of its subclasses.
+
+    Loaded records are tracked in an identity map of weak references, so that any record still in use elsewhere is never
+    loaded twice. The most recently used records are also kept alive by an LRU cache, and records with unsaved changes
+    are kept alive until they have been saved.
+
+    :var store: The SQLite table storing this database's records
+    :vartype store: SQLiteStore
+    :var loaded: All records currently in memory, keyed by ID
+    :vartype loaded: weakref.WeakValueDictionary
+    :var cacheSize: The number of recently used records to keep in memory
+    :vartype cacheSize: int
+    """
+
+    def __init__(self, store: SQLiteStore, cacheSize: int):
+        """
+        :param SQLiteStore store: The SQLite table storing this database's records
+        :param int cacheSize: The number of recently used records to keep in memory
+        """
+        super().__init__()
+        self.store = store
+        self.cacheSize = cacheSize
+        self.loaded = weakref.WeakValueDictionary()
+        self.recent = OrderedDict()
+        # Records changed since the last save, kept alive until they are written
+        self.pinned = {}
+        # Records included in the save in progress
+        self.savingPins = {}
+        # IDs removed but not yet deleted from the store
+        self.removedIDs = set()
+        self.savingRemovedIDs = set()
+        # Changes from a save that failed, to be written in the next save
+        self.failedChanges = {}
+
+
+    def hydrate(self, id: int, data: dict):
+        """Construct a record object from its dictionary-serialized form. Implemented by subclasses.
+
+        :param int id: The ID of the record
+        :param dict data: The dictionary-serialized record
+        :return: The new record object
+        """
+        raise NotImplementedError()
+
+
+    def touch(self, record):
+        """Mark a record as recently used, evicting the least recently used record from the cache if it is full.
+
+        :param record: The record that was used
+        """
+        self.recent[record.id] = record
+        self.recent.move_to_end(record.id)
+        if len(self.recent) > self.cacheSize:
+            self.recent.popitem(last=False)
+
+
+    def loadRecord(self, id: int):
+        """Get the record with the given ID, loading it from the store if it is not already in memory.
+
+        :param int id: The ID of the record to get
+        :raise KeyError: If no record exists with the given ID
+        :return: The record with the given ID
+        """
+        record = self.loaded.get(id)
+        if record is None:
+            if id in self.removedIDs or id in self.savingRemovedIDs:
+                raise KeyError(id)
+            data = self.store.get(id)
+            if data is None:
+                raise KeyError(id)
+            record = self.hydrate(id, data)
+            self.loaded[id] = record
+            record.changeListener = self.recordChanged
+        self.touch(record)
+        return record
+
+
+    def removeRecord(self, id: int):
+        """Remove the record with the given ID from the database.
+
+        :param int id: The ID of the record to remove
+        :raise KeyError: If no record exists with the given ID
+        """
+        if not self.idExists(id):
+            raise KeyError("record not found: " + str(id))
+        record = self.loaded.pop(id, None)
+        if record is not None:
+            record.changeListener = None
+        self.recent.pop(id, None)
+        self.pinned.pop(id, None)
+        self.removedIDs.add(id)
+        self.changedIDs.add(id)
+
+
+    def recordChanged(self, record: changeTracked.ChangeTracked):
+        """Mark the given record as changed, and keep it in memory until it has been saved.
+
+        :param ChangeTracked record: The record that changed
+        """
+        super().recordChanged(record)
+        self.loaded[record.id] = record
+        self.pinned[record.id] = record
+        self.removedIDs.discard(record.id)
+        self.savingRemovedIDs.discard(record.id)
+
+
+    def idExists(self, id: int) -> bool:
+        """Check whether a record with the given ID exists in the database.
+
+        :param int id: The ID to check
+        :return: True if a record exists with the given ID, False otherwise
+        :rtype: bool
+        """
+        if id in self.loaded:
+            return True
+        if id in self.removedIDs or id in self.savingRemovedIDs:
+            return False
+        return self.store.exists(id)
+
+
+    def getIDs(self) -> List[int]:
+        """Get a list of the IDs of all records in the database.
+
+        :return: A list containing the ID of every record in the database
+        :rtype: List[int]
+        """
+        ids = set(self.store.ids())
+        ids.update(self.loaded.keys())
+        return list(ids - self.removedIDs - self.savingRemovedIDs)
+
+
+    def allRecords(self) -> list:
+        """Get every record in the database, loading all of them into memory.
+        ⚠ This defeats the purpose of the SQLite backend, and should be avoided wherever possible.
+
+        :return: A list of all records in the database
+        :rtype: list
+        """
+        records = []
+        for id in self.getIDs():
+            try:
+                records.append(self.loadRecord(id))
+            except KeyError:
+                pass
+        return records
+
+
+    def __len__(self) -> int:
+        """Get the number of records in the database.
+
+        :return: The number of records in the database
+        :rtype: int
+        """
+        return len(self.getIDs())
+
+
+    def toDict(self, **kwargs) -> dict:
+        """Serialise the entire database into dictionary format, in the same format as the JSON backend.
+        Records are read from the store one at a time, so only records already in memory are fully loaded.
+
+        :return: A dictionary containing all data needed to recreate this database
+        :rtype: dict
+        """
+        data = {}
+        for id, recordData in self.store.items():
+            if id not in self.removedIDs and id not in self.savingRemovedIDs and id not in self.loaded:
+                data[str(id)] = recordData
+        for id, record in list(self.loaded.items()):
+            data[str(id)] = record.toDict(**kwargs)
+        return data
+
+
+    def toDeltaDict(self, **kwargs) -> dict:
+        """Serialise only the records that have changed since the last save.
+
+        :return: A dictionary mapping the string IDs of changed records to their serialised form, or None if removed
+        :rtype: dict
+        """
+        return {str(id): (None if id in self.removedIDs else self.loaded[id].toDict(**kwargs)) for id in self.changedIDs}
+
+
+    def prepareSave(self, **kwargs) -> Optional[Callable[[], None]]:
+        """Take a snapshot of all unsaved changes, and return a function which writes them to the store
+        in a single transaction. The returned function may be called from a worker thread.
+
+        :return: A function writing the snapshot to the store, or None if there are no changes to save
+        :rtype: Optional[Callable[[], None]]
+        """
+        if not self.hasChanges():
+            return None
+
+        changes = {int(id): data for id, data in self.toDeltaDict(**kwargs).items()}
+        if self.fullSaveRequired:
+            changes = {**self.failedChanges, **changes}
+            self.savingPins.update(self.pinned)
+            self.savingRemovedIDs.update(self.removedIDs)
+        else:
+            self.savingPins = self.pinned
+            self.savingRemovedIDs = self.removedIDs
+        self.failedChanges = {}
+        self.pinned = {}
+        self.removedIDs = set()
+        self.clearChanges()
+
+        def write():
+            try:
+                self.store.writeChanges(changes)
+            except BaseException:
+                self.failedChanges = changes
+                self.fullSaveRequired = True
+                raise
+
+        return write
+
+
+class SQLiteUserDB(SQLiteBackedDB, userDB.UserDB):
+    """A UserDB storing its users in an SQLite database, loading them into memory only when requested.
+    """
+
+    def __init__(self, filePath: str, cacheSize: int):
+        """
+        :param str filePath: Path to the SQLite database file
+        :param int cacheSize: The number of recently used users to keep in memory
+        """
+        super().__init__(SQLiteStore(filePath, "users"), cacheSize)
+        self.users = self.loaded
+
+
+    def hydrate(self, id: int, data: dict) -> BasedUser:
+        """Construct a BasedUser from its dictionary-serialized form.
+
+        :param int id: The ID of the user
+        :param dict data: The dictionary-serialized user
+        :return: The new BasedUser
+        :rtype: BasedUser
+        """
+        return BasedUser.fromDict(data, id=id)
+
+
+    def reinitUser(self, userID: int):
+        """Reset the stats for the user with the specified ID.
+
+        :param int userID: The ID of the user to reset. Can be integer or a string of digits.
+        :raise KeyError: If no user is found with the requested ID
+        """
+        self.getUser(userID).resetUser()
+
+
+    def removeID(self, userID: int):
+        """Remove the BasedUser with the specified ID from the database.
+
+        :param int userID: integer discord ID for the user to remove
+        :raise KeyError: If no BasedUser exists in the database with the specified ID
+        """
+        self.removeRecord(self.validateID(userID))
+
+
+    def getUser(self, userID: int) -> BasedUser:
+        """Fetch the BasedUser from the database with the given ID, loading it from the database if needed.
+
+        :param int userID: integer discord ID for the user to fetch
+        :return: the stored BasedUser with the given ID
+        :rtype: BasedUser
+        """
+        return self.loadRecord(self.validateID(userID))
+
+
+    def getUsers(self) -> List[BasedUser]:
+        """Get a list of all BasedUser objects stored in the database.
+        ⚠ This loads every user into memory.
+
+        :return: list containing all BasedUser objects in the db
+        :rtype: list[BasedUser]
+        """
+        return self.allRecords()
+
+
+    def __str__(self) -> str:
+        return "<SQLiteUserDB: " + str(len(self)) + " users>"
+
+
+class SQLiteGuildDB(SQLiteBackedDB, guildDB.GuildDB):
+    """A GuildDB storing its guilds in an SQLite database, loading them into memory only when requested.
+    """
+
+    def __init__(self, filePath: str, cacheSize: int):
+        """
+        :param str filePath: Path to the SQLite database file
+        :param int cacheSize: The number of recently used guilds to keep in memory
+        """
+        super().__init__(SQLiteStore(filePath, "guilds"), cacheSize)
+        self.guilds = self.loaded
+
+
+    def hydrate(self, id: int, data: dict) -> basedGuild.BasedGuild:
+        """Construct a BasedGuild from its dictionary-serialized form.
+
+        :param int id: The ID of the guild
+        :param dict data: The dictionary-serialized guild
+        :raise lib.exceptions.NoneDCGuildObj: If the bot cannot access the discord guild with the given ID
+        :return: The new BasedGuild
+        :rtype: BasedGuild
+        """
+        return basedGuild.BasedGuild.fromDict(data, id=id)
+
+
+    def storeGuild(self, guild: basedGuild.BasedGuild):
+        """Store a BasedGuild object as the most recently used guild.
+
+        :param BasedGuild guild: The guild to store
+        """
+        self.loaded[guild.id] = guild
+        self.touch(guild)
+
+
+    def getGuild(self, id: int) -> basedGuild.BasedGuild:
+        """Get the BasedGuild object with the specified ID, loading it from the database if needed.
+        Guilds that the bot can no longer access are removed from the database.
+
+        :param int id: integer discord ID for the requested guild
+        :raise KeyError: If no guild exists with the requested ID
+        :return: BasedGuild having the requested ID
+        :rtype: BasedGuild
+        """
+        try:
+            return self.loadRecord(id)
+        except lib.exceptions.NoneDCGuildObj:
+            botState.logger.log("SQLiteGuildDB", "getGuild", "no corresponding discord guild found for ID " + str(id) +
+                                                                ", guild removed from database",
+                                category="guildsDB", eventType="NULL_GLD")
+            self.removedIDs.add(id)
+            self.changedIDs.add(id)
+            raise KeyError(id)
+
+
+    def getGuilds(self) -> List[basedGuild.BasedGuild]:
+        """Get a list of all BasedGuilds in the database.
+        ⚠ This loads every guild into memory.
+
+        :return: A list containing all BasedGuild objects stored in the database
+        :rtype: list
+        """
+        return self.allRecords()
+
+
+    def removeID(self, id: int):
+        """Remove the BasedGuild with the requested ID from the database.
+
+        :param int id: integer discord ID to remove from the database
+        """
+        self.removeRecord(id)
+
+
+    def __str__(self) -> str:
+        return "<SQLiteGuildDB: " + str(len(self)) + " guilds>"
+
+
+    def replayJournal(self, journal):
+        """Replay the given story journal over the stored guilds, writing the results back to the store.
+
+        :param StoryJournal journal: The story journal to replay
+        """
+        guildsData = {}
+        for guildID in journal.recordedGuildIDs():
+            data = self.store.get(guildID)
+            if data is not None:
+                guildsData[guildID] = data
+        changedIDs = journal.replay(guildsData, keyType=int)
+        journal.lastSeq = max(journal.lastSeq, self.store.maxField("journalSeq") or 0)
+        self.store.writeChanges({id: guildsData[id] for id in changedIDs})
+
+
+def migrateFromJSON(jsonPath: str, sqlitePath: str, table: str) -> int:
+    """Copy all records from a JSON database save file (including any saved changes in its delta file)
+    into an SQLite database, in a single transaction. Existing records with the same IDs are replaced.
+
+    :param str jsonPath: Path to the JSON database file to migrate
+    :param str sqlitePath: Path to the SQLite database file to migrate to. Created if it does not exist.
+    :param str table: The table to migrate records into, e.g "users" or "guilds"
+    :return: The number of records migrated
+    :rtype: int
+    """
+    data, _, _ = lib.jsonHandler.readDBWithDeltas(jsonPath)
+    store = SQLiteStore(sqlitePath, table)
+    try:
+        store.writeChanges({int(id): record for id, record in data.items()})
+    except Exception:
+        print(traceback.format_exc())
+        raise
+    finally:
+        store.close()
+    return len(data)
@@ -0,0 +1,241 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+from typing import List, Tuple
+
+from .. import lib, botState
+import traceback
+
+
+# Journal record operations
+OP_APPEND = "a"
+OP_RESET = "r"
+
+
+def applyRecord(guildData: dict, record: list):
+    """Apply a journal record to the dictionary-serialized representation of a BasedGuild.
+
+    :param dict guildData: A dictionary-serialized BasedGuild, as returned by BasedGuild.toDict
+    :param list record: The journal record to apply
+    :raise ValueError: If the record's operation is not recognised
+    """
+    seq, op = record[0], record[2]
+    if op == OP_APPEND:
+        guildData["currentStory"] = guildData.get("currentStory", "") + record[3]
+        guildData["lastAuthorID"] = record[4]
+    elif op == OP_RESET:
+        guildData["currentStory"] = ""
+        guildData["lastAuthorID"] = -1
+    else:
+        raise ValueError("Unrecognised story journal operation: " + str(op))
+    guildData["journalSeq"] = seq
+
+
+class StoryJournal:
+    """An append-only journal of changes to guilds' stories, allowing story progress to survive a crash
+    between database saves at the cost of only one small record per story change.
+
+    Records are buffered in memory, and written to file (and fsync'd) in batches every flushInterval seconds.
+    Each record has a sequence number, which is saved with the BasedGuild it applies to. When replaying the journal,
+    records already reflected in a guild's saved state are skipped, so replaying is always safe.
+
+    :var filePath: Path to the journal file
+    :vartype filePath: str
+    :var flushInterval: The maximum number of seconds that a record may wait before being written to file
+    :vartype flushInterval: float
+    :var lastSeq: The sequence number of the most recently recorded story change
+    :vartype lastSeq: int
+    """
+
+    def __init__(self, filePath: str, flushInterval: float):
+        """
+        :param str filePath: Path to the journal file
+        :param float flushInterval: The maximum number of seconds that a record may wait before being written to file
+        """
+        self.filePath = filePath
+        self.flushInterval = flushInterval
+        self.lastSeq = 0
+        # Records waiting to be written to file, as tuples of (sequence number, encoded record)
+        self.pendingRecords: List[Tuple[int, str]] = []
+        # Records written to file since the journal was last compacted
+        self.writtenRecords: List[Tuple[int, str]] = []
+        self.flushHandle = None
+        self.fileLock = None
+
+
+    def replay(self, guildsData: dict, keyType: type = None) -> list:
+        """Apply all journal records in the journal file to the given dictionary-serialized GuildDB.
+        Records which are already reflected in a guild's saved state, and records for guilds not in guildsData (e.g
+        guilds removed before the journal was compacted), are skipped.
+        This also advances lastSeq past every sequence number used so far, and should be called before recording anything.
+
+        :param dict guildsData: A dictionary-serialized GuildDB, as returned by GuildDB.toDict. This is modified in place.
+                                Guild IDs may be either strings or ints, but must all be the same type.
+        :param type keyType: The type of the guild IDs in guildsData, either str or int. Inferred from guildsData if not given.
+        :return: The keys in guildsData of all guilds changed by the journal
+        :rtype: List
+        """
+        for guildData in guildsData.values():
+            self.lastSeq = max(self.lastSeq, guildData.get("journalSeq", 0))
+
+        if not os.path.isfile(self.filePath):
+            return []
+        with open(self.filePath, "r") as f:
+            lines = f.read().split("\n")
+
+        # Databases saved in binary format have int keys, rather than strings
+        if keyType is None:
+            keyType = type(next(iter(guildsData), ""))
+        changedKeys = set()
+        corrupted = False
+        for line in lines:
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            # The final record may have been partially written during a crash
+            except ValueError:
+                corrupted = True
+                continue
+            self.writtenRecords.append((record[0], line))
+            self.lastSeq = max(self.lastSeq, record[0])
+            key = keyType(record[1])
+            # The guild was removed after the record was written, so don't bring it back
+            if key not in guildsData:
+                continue
+            guildData = guildsData[key]
+            if record[0] > guildData.get("journalSeq", 0):
+                applyRecord(guildData, record)
+                changedKeys.add(key)
+
+        # Remove partially written records, so that new records are not appended onto the end of them
+        if corrupted:
+            lib.jsonHandler.writeAtomic(self.filePath, "".join(line + "\n" for _, line in self.writtenRecords).encode())
+
+        return list(changedKeys)
+
+
+    def recordedGuildIDs(self) -> List[int]:
+        """Get the IDs of all guilds with records in the journal file.
+
+        :return: A list of the IDs of all guilds with records in the journal file
+        :rtype: List[int]
+        """
+        if not os.path.isfile(self.filePath):
+            return []
+        guildIDs = set()
+        with open(self.filePath, "r") as f:
+            for line in f:
+                try:
+                    guildIDs.add(json.loads(line)[1])
+                except ValueError:
+                    continue
+        return list(guildIDs)
+
+
+    def record(self, guildID: int, op: str, *args) -> int:
+        """Record a change to a guild's story. The record will be written to file within flushInterval seconds.
+        This must be called from within the event loop.
+
+        :param int guildID: The ID of the guild whose story changed
+        :param str op: The story operation performed, e.g OP_APPEND
+        :param args: Any arguments to the operation
+        :return: The sequence number of the new record
+        :rtype: int
+        """
+        self.lastSeq += 1
+        self.pendingRecords.append((self.lastSeq, json.dumps([self.lastSeq, guildID, op, *args])))
+        if self.flushHandle is None:
+            self.flushHandle = asyncio.get_running_loop().call_later(self.flushInterval, self.scheduleFlush)
+        return self.lastSeq
+
+
+    def recordAppend(self, guildID: int, text: str, authorID: int) -> int:
+        """Record text being added to a guild's story.
+
+        :param int guildID: The ID of the guild whose story changed
+        :param str text: The text added to the end of the story
+        :param int authorID: The ID of the user who added the text
+        :return: The sequence number of the new record
+        :rtype: int
+        """
+        return self.record(guildID, OP_APPEND, text, authorID)
+
+
+    def recordReset(self, guildID: int) -> int:
+        """Record a guild's story being cleared.
+
+        :param int guildID: The ID of the guild whose story changed
+        :return: The sequence number of the new record
+        :rtype: int
+        """
+        return self.record(guildID, OP_RESET)
+
+
+    def scheduleFlush(self):
+        """Start writing all pending records to file in the background.
+        """
+        asyncio.ensure_future(self.flush())
+
+
+    def getFileLock(self) -> asyncio.Lock:
+        """Get the lock preventing concurrent writes to the journal file, creating it if needed.
+        The lock is created on first use so that it belongs to the running event loop.
+
+        :return: The journal file lock
+        :rtype: asyncio.Lock
+        """
+        if self.fileLock is None:
+            self.fileLock = asyncio.Lock()
+        return self.fileLock
+
+
+    def appendToFile(self, records: List[Tuple[int, str]]):
+        """Append the given records to the journal file, and fsync it. This blocks, so should be called from a worker thread.
+
+        :param records: The records to write, as tuples of (sequence number, encoded record)
+        :type records: List[Tuple[int, str]]
+        """
+        with open(self.filePath, "a") as f:
+            f.write("".join(line + "\n" for _, line in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+    async def flush(self):
+        """Write all pending records to file, and fsync the journal file. The file is written in a worker thread.
+        """
+        if self.flushHandle is not None:
+            self.flushHandle.cancel()
+            self.flushHandle = None
+        async with self.getFileLock():
+            if not self.pendingRecords:
+                return
+            records, self.pendingRecords = self.pendingRecords, []
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.appendToFile, records)
+            except Exception as e:
+                botState.logger.log("StoryJournal", "flush", "Failed to write story journal: " + type(e).__name__,
+                                    category="guildsDB", eventType="JRNL_ERR", trace=traceback.format_exc())
+                # Try again in the next batch
+                self.pendingRecords = records + self.pendingRecords
+                if self.flushHandle is None:
+                    self.flushHandle = asyncio.get_running_loop().call_later(self.flushInterval, self.scheduleFlush)
+                return
+            self.writtenRecords.extend(records)
+
+
+    async def compact(self, savedSeq: int):
+        """Remove all records from the journal file that are already reflected in the saved guilds database.
+        This should be called once a snapshot of the guilds database, taken when lastSeq was savedSeq, has been saved.
+
+        :param int savedSeq: The value of lastSeq when the saved guilds database snapshot was taken
+        """
+        async with self.getFileLock():
+            remaining = [(seq, line) for seq, line in self.writtenRecords if seq > savedSeq]
+            if len(remaining) == len(self.writtenRecords) and os.path.isfile(self.filePath):
+                return
+            data = "".join(line + "\n" for _, line in remaining).encode()
+            await asyncio.get_running_loop().run_in_executor(None, lib.jsonHandler.writeAtomic, self.filePath, data)
+            self.writtenRecords = remaining
@@ -0,0 +1,176 @@
+from __future__ import annotations
+import json
+from datetime import timedelta
+from types import FunctionType
+from typing import Dict, List, Optional, Tuple
+
+from ..scheduling import timedTask
+from ..scheduling.timedTaskHeap import TimedTaskHeap
+
+
+# Expiry functions whose TimedTasks are saved to file, by name
+expiryFunctions: Dict[str, FunctionType] = {}
+
+
+def registerExpiryFunction(expiryFunction: FunctionType, name: str = None) -> FunctionType:
+    """Allow TimedTasks calling the given expiry function to be saved to file, and restored when the bot restarts.
+    Saved tasks are recorded by the name of their expiry function and their expiryFunctionArgs, so the function must be
+    a module-level function, and any expiryFunctionArgs given to it must be serializable to JSON.
+    This returns expiryFunction, so may be used as a decorator.
+
+    :param function expiryFunction: The expiry function to register
+    :param str name: The name to save the function under. Must not be changed once tasks have been saved. (Default the
+                        function's module and name)
+    :return: expiryFunction
+    :rtype: function
+    :raise KeyError: If a different function is already registered with the same name
+    """
+    if name is None:
+        name = expiryFunction.__module__ + "." + expiryFunction.__qualname__
+    if expiryFunctions.get(name, expiryFunction) is not expiryFunction:
+        raise KeyError("An expiry function is already registered with this name: " + name)
+    expiryFunctions[name] = expiryFunction
+    return expiryFunction
+
+
+def expiryFunctionName(expiryFunction: FunctionType) -> Optional[str]:
+    """Get the name that the given expiry function is registered under.
+
+    :param function expiryFunction: The expiry function to look up
+    :return: The function's registered name, or None if it is not registered
+    :rtype: Optional[str]
+    """
+    for name, registered in expiryFunctions.items():
+        if registered is expiryFunction:
+            return name
+    return None
+
+
+def taskKey(name: str, expiryFunctionArgs) -> Tuple[str, str]:
+    """Get the key that a task is stored under in a TimedTaskDB.
+
+    :param str name: The registered name of the task's expiry function
+    :param expiryFunctionArgs: The task's expiryFunctionArgs, or None if it has none
+    :return: A key identifying the task by its expiry function and arguments
+    :rtype: Tuple[str, str]
+    """
+    return name, json.dumps(expiryFunctionArgs, sort_keys=True)
+
+
+class TimedTaskDB(dict):
+    """A database of the TimedTasks restored from file when the bot started, keyed by taskKey.
+
+    Every task on a TimedTaskHeap which calls a registered expiry function is saved, with its expiry time as a POSIX
+    timestamp. On startup, saved tasks are all rescheduled onto a heap at once, including tasks that came due while the
+    bot was offline. Objects restored from file then claim their tasks with claimTask, rather than scheduling new ones.
+    Once everything has been restored, dropUnclaimed unschedules any tasks that nothing claimed, e.g because the
+    message they refer to no longer exists, and the overdue tasks can be expired in one batch.
+
+    If tasks are restored without being scheduled, they cannot expire before the objects that claim them have been
+    restored. Claimed tasks are then scheduled all at once with scheduleClaimed.
+
+    :var claimed: The tasks which have been claimed since scheduleClaimed was last called
+    :vartype claimed: List[TimedTask]
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.claimed: List[timedTask.TimedTask] = []
+
+
+    def claimTask(self, expiryFunction: FunctionType, expiryFunctionArgs = None) -> Optional[timedTask.TimedTask]:
+        """Take the restored task calling the given expiry function with the given arguments.
+        The task remains scheduled, but will no longer be removed by dropUnclaimed.
+
+        :param function expiryFunction: The task's expiry function, which must be registered
+        :param expiryFunctionArgs: The task's expiryFunctionArgs (Default None)
+        :return: The restored task, or None if no such task was restored or it has already been claimed
+        :rtype: Optional[TimedTask]
+        """
+        name = expiryFunctionName(expiryFunction)
+        if name is None:
+            return None
+        task = self.pop(taskKey(name, expiryFunctionArgs), None)
+        if task is not None:
+            self.claimed.append(task)
+        return task
+
+
+    def scheduleClaimed(self, heap: TimedTaskHeap):
+        """Schedule every claimed task which is not yet scheduled onto the given heap, all at once.
+        Claimed tasks which have already been expired, e.g because the object claiming them was deleted, are skipped.
+
+        :param TimedTaskHeap heap: The heap to schedule the claimed tasks onto
+        """
+        heap.scheduleTasks([task for task in self.claimed if task.heap is None and not task.gravestone])
+        self.claimed = []
+
+
+    def dropUnclaimed(self) -> int:
+        """Unschedule every restored task which has not been claimed.
+
+        :return: The number of tasks unscheduled
+        :rtype: int
+        """
+        numDropped = 0
+        for task in self.values():
+            if task.heap is not None:
+                task.heap.unscheduleTask(task)
+                numDropped += 1
+        self.clear()
+        return numDropped
+
+
+def toDict(heap: TimedTaskHeap, **kwargs) -> dict:
+    """Serialise every task on the given heap which calls a registered expiry function.
+
+    :param TimedTaskHeap heap: The heap whose tasks to serialise
+    :return: A dictionary mapping string keys to serialised tasks
+    :rtype: dict
+    """
+    data = {}
+    for task in heap.getTasks():
+        name = expiryFunctionName(task.expiryFunction)
+        if name is None:
+            continue
+        args = task.expiryFunctionArgs if task.hasExpiryFunctionArgs else None
+        taskData = {"function": name, "expiry": round(task.expiryTimestamp(), 3)}
+        if args is not None:
+            taskData["args"] = args
+        if task.autoReschedule:
+            taskData["autoReschedule"] = True
+            taskData["delay"] = task.delaySeconds
+        if task.orderedExpiry:
+            taskData["orderedExpiry"] = True
+        data["/".join(taskKey(name, args))] = taskData
+    return data
+
+
+def fromDict(dbDict: dict, heap: TimedTaskHeap, schedule: bool = True) -> TimedTaskDB:
+    """Recreate the tasks in a dictionary-serialised heap, and schedule them all onto the given heap at once;
+    the opposite of timedTaskDB.toDict.
+    Tasks calling expiry functions which are no longer registered are skipped.
+
+    :param dict dbDict: A dictionary of serialised tasks, as returned by timedTaskDB.toDict
+    :param TimedTaskHeap heap: The heap to schedule restored tasks onto
+    :param bool schedule: Give False to leave the restored tasks unscheduled, to be scheduled once claimed with
+                            TimedTaskDB.scheduleClaimed (Default True)
+    :return: A TimedTaskDB holding the restored tasks
+    :rtype: TimedTaskDB
+    """
+    newDB = TimedTaskDB()
+    tasks: List[timedTask.TimedTask] = []
+    for taskData in dbDict.values():
+        if taskData["function"] not in expiryFunctions:
+            continue
+        args = taskData.get("args", None)
+        task = timedTask.TimedTask(expiryTimestamp=taskData["expiry"],
+                                    expiryDelta=timedelta(seconds=taskData["delay"]) if "delay" in taskData else None,
+                                    expiryFunction=expiryFunctions[taskData["function"]], expiryFunctionArgs=args,
+                                    autoReschedule=taskData.get("autoReschedule", False),
+                                    orderedExpiry=taskData.get("orderedExpiry", False), clock=heap.clock)
+        newDB[taskKey(taskData["function"], args)] = task
+        tasks.append(task)
+    if schedule:
+        heap.scheduleTasks(tasks)
+    return newDB
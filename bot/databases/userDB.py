@@ -4,10 +4,10 @@ from .. import lib
 from .. import botState
 import traceback
 from typing import List
-from ..baseClasses import serializable
+from ..baseClasses import serializable, changeTracked
 
 
-class UserDB(serializable.Serializable):
+class UserDB(serializable.Serializable, changeTracked.ChangeTrackingDB):
     """A database of BasedUser objects.
 
     :var users: Dictionary of users in the database, where values are the BasedUser objects and keys are the ids
@@ -16,6 +16,7 @@ class UserDB(serializable.Serializable):
     """
 
     def __init__(self):
+        super().__init__()
         # Store users as a dict of user.id: user
         self.users = {}
 
@@ -91,6 +92,8 @@ class UserDB(serializable.Serializable):
         # Create and return a new user
         newUser = BasedUser(userID)
         self.users[userID] = newUser
+        newUser.changeListener = self.recordChanged
+        self.recordChanged(newUser)
         return newUser
 
 
@@ -105,6 +108,8 @@ class UserDB(serializable.Serializable):
             raise KeyError("Attempted to add a user that is already in this UserDB: " + str(userObj))
         # Store the passed BasedUser
         self.users[userObj.id] = userObj
+        userObj.changeListener = self.recordChanged
+        self.recordChanged(userObj)
 
 
     def getOrAddID(self, userID: int) -> BasedUser:
@@ -128,7 +133,8 @@ class UserDB(serializable.Serializable):
         userID = self.validateID(userID)
         if not self.idExists(userID):
             raise KeyError("user not found: " + str(userID))
-        del self.users[userID]
+        self.users.pop(userID).changeListener = None
+        self.changedIDs.add(userID)
 
 
     def getUser(self, userID: int) -> BasedUser:
@@ -179,6 +185,34 @@ class UserDB(serializable.Serializable):
         return data
 
 
+    def toDeltaDict(self, **kwargs) -> dict:
+        """Serialise only the users that have been added, removed or modified since the last save.
+
+        :return: A dictionary mapping the string IDs of changed users to their serialised form, or None if removed
+        :rtype: dict
+        """
+        data = {}
+        for userID in self.changedIDs:
+            if userID not in self.users:
+                data[str(userID)] = None
+                continue
+            try:
+                data[str(userID)] = self.users[userID].toDict(**kwargs)
+            except Exception as e:
+                botState.logger.log("UserDB", "toDeltaDict", "Error serialising BasedUser: " +
+                                    e.__class__.__name__, trace=traceback.format_exc(), eventType="USERERR")
+        return data
+
+
+    def __len__(self) -> int:
+        """Get the number of users stored in the database.
+
+        :return: The number of users in the database
+        :rtype: int
+        """
+        return len(self.users)
+
+
     def __str__(self) -> str:
         """Get summarising information about this UserDB in string format.
         Currently only the number of users stored.
@@ -193,15 +227,25 @@ class UserDB(serializable.Serializable):
     def fromDict(cls, userDBDict: dict, **kwargs) -> UserDB:
         """Construct a UserDB from a dictionary-serialised representation - the reverse of UserDB.toDict()
 
-        :param dict userDBDict: a dictionary-serialised representation of the UserDB to construct
+        :param dict userDBDict: a dictionary-serialised representation of the UserDB to construct. May also be an iterator
+                                over (user ID, serialised user) pairs, e.g from lib.jsonHandler.iterDBWithDeltas, so that
+                                users can be built as they are read from file.
         :return: the new UserDB
         :rtype: UserDB
         """
         # Instance the new UserDB
         newDB = UserDB()
+        users = newDB.users
+        listener = newDB.recordChanged
         # iterate over all user IDs to spawn
-        for userID in userDBDict.keys():
+        for userID, userDict in (userDBDict.items() if isinstance(userDBDict, dict) else userDBDict):
             # Construct new BasedUsers for each ID in the database
-            # JSON stores properties as strings, so ids must be converted to int first.
-            newDB.addUser(BasedUser.fromDict(userDBDict[userID], id=int(userID)))
+            # JSON stores properties as strings, so ids must be converted to int first. The binary format stores ints.
+            if type(userID) is not int:
+                userID = int(userID)
+            # Keys of userDBDict are unique, so users can be stored directly rather than through addUser
+            user = BasedUser.fromDict(userDict, id=userID)
+            user.changeListener = listener
+            users[userID] = user
+        # Users loaded from file do not need to be saved again until they change
         return newDB
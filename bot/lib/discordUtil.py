@@ -91,61 +91,101 @@ async def endLongProcess(message: Message):
         pass
 
 
+def emojiFromRaw(payload: RawReactionActionEvent) -> Union[emojis.BasedEmoji, None]:
+    """Convert the emoji in a RawReactionActionEvent payload to a BasedEmoji, without making any API calls.
+
+    :param RawReactionActionEvent payload: Payload describing the reaction action
+    :return: The emoji that changed, or None if it is a custom emoji that the client cannot access
+    :rtype: Union[BasedEmoji, None]
+    """
+    try:
+        return emojis.BasedEmoji.fromPartial(payload.emoji, rejectInvalid=True)
+    except exceptions.UnrecognisedCustomEmoji:
+        return None
+
+
+def channelFromRaw(payload: RawReactionActionEvent) -> Union[TextChannel, DMChannel, GroupChannel, None]:
+    """Find the channel containing the message in a RawReactionActionEvent payload, from the client's cache.
+
+    :param RawReactionActionEvent payload: Payload describing the reaction action
+    :return: The channel containing the reacted message, or None if it is not cached
+    :rtype: Union[TextChannel, DMChannel, GroupChannel, None]
+    """
+    if payload.guild_id is None:
+        return botState.client.get_channel(payload.channel_id)
+    guild = botState.client.get_guild(payload.guild_id)
+    if guild is None:
+        return None
+    return guild.get_channel(payload.channel_id)
+
+
+async def userFromRaw(payload: RawReactionActionEvent) -> Union[User, Member, None]:
+    """Find the user who completed the reaction action in a RawReactionActionEvent payload.
+    The user is taken from the payload or the client's cache where possible, and is only fetched from discord
+    (an API call) if it is not cached.
+
+    :param RawReactionActionEvent payload: Payload describing the reaction action
+    :return: The user who completed the action, or None if they could not be found
+    :rtype: Union[User, Member, None]
+    """
+    if payload.member is not None:
+        return payload.member
+
+    channel = channelFromRaw(payload)
+    # Individual handling for each channel type for efficiency
+    if isinstance(channel, DMChannel):
+        if channel.recipient is not None and channel.recipient.id == payload.user_id:
+            return channel.recipient
+        return channel.me
+    elif isinstance(channel, GroupChannel):
+        # Group channels should be small and far between, so iteration is fine here.
+        for currentUser in channel.recipients:
+            if currentUser.id == payload.user_id:
+                return currentUser
+        return channel.me
+    # Guild text channels
+    elif isinstance(channel, TextChannel):
+        user = channel.guild.get_member(payload.user_id)
+        if user is None:
+            try:
+                user = await channel.guild.fetch_member(payload.user_id)
+            except HTTPException:
+                return None
+        return user
+    elif channel is None and payload.guild_id is None:
+        # Uncached DM channel
+        user = botState.client.get_user(payload.user_id)
+        if user is None:
+            try:
+                user = await botState.client.fetch_user(payload.user_id)
+            except HTTPException:
+                return None
+        return user
+    return None
+
+
 async def reactionFromRaw(payload: RawReactionActionEvent) -> Tuple[Message, Union[User, Member], emojis.BasedEmoji]:
     """Retrieve complete Reaction and user info from a RawReactionActionEvent payload.
+    The reacted message is fetched (an API call) if it is not in botState.messageCache. Where the message is not needed, use userFromRaw and
+    emojiFromRaw instead.
 
     :param RawReactionActionEvent payload: Payload describing the reaction action
     :return: The message whose reactions changed, the user who completed the action, and the emoji that changed.
     :rtype: Tuple[Message, Union[User, Member], BasedEmoji]
     """
-    emoji = None
-    user = None
-    message = None
-
-    if payload.member is None:
-        # Get the channel containing the reacted message
-        if payload.guild_id is None:
-            channel = botState.client.get_channel(payload.channel_id)
-        else:
-            guild = botState.client.get_guild(payload.guild_id)
-            if guild is None:
-                return None, None, None
-            channel = guild.get_channel(payload.channel_id)
-
-        # Individual handling for each channel type for efficiency
-        if isinstance(channel, DMChannel):
-            if channel.recipient.id == payload.user_id:
-                user = channel.recipient
-            else:
-                user = channel.me
-        elif isinstance(channel, GroupChannel):
-            # Group channels should be small and far between, so iteration is fine here.
-            for currentUser in channel.recipients:
-                if currentUser.id == payload.user_id:
-                    user = currentUser
-                if user is None:
-                    user = channel.me
-        # Guild text channels
-        elif isinstance(channel, TextChannel):
-            user = channel.guild.get_member(payload.user_id)
-        else:
-            return None, None, None
-
-        # Fetch the reacted message (api call)
-        message = await channel.fetch_message(payload.message_id)
-
-    # If a reacting member was given, the guild can be inferred from the member.
-    else:
-        user = payload.member
-        message = await payload.member.guild.get_channel(payload.channel_id).fetch_message(payload.message_id)
+    # Convert reacted emoji to BasedEmoji
+    emoji = emojiFromRaw(payload)
+    if emoji is None:
+        return None, None, None
 
-    if message is None:
+    user = await userFromRaw(payload)
+    channel = channelFromRaw(payload)
+    if user is None or channel is None:
         return None, None, None
 
-    # Convert reacted emoji to BasedEmoji
-    try:
-        emoji = emojis.BasedEmoji.fromPartial(payload.emoji, rejectInvalid=True)
-    except exceptions.UnrecognisedCustomEmoji:
+    # Fetch the reacted message (api call)
+    message = await botState.messageCache.fetch(channel, payload.message_id)
+    if message is None:
         return None, None, None
 
     return message, user, emoji
@@ -1,11 +1,13 @@
 from __future__ import annotations
 import emoji
+import itertools
+import re
 from .. import botState
 from . import stringTyping, exceptions
 import traceback
 from ..baseClasses import serializable
 
-from typing import Union, TYPE_CHECKING
+from typing import Optional, Union, TYPE_CHECKING
 if TYPE_CHECKING:
     from discord import PartialEmoji, Emoji
 
@@ -22,6 +24,11 @@ VAR_SELECTOR = "️"
 # Regional indicator characters. Not technically classed as emojis, so they have to be special-cased.
 REGIONAL_INDICATORS = ('🇦', '🇧', '🇨', '🇩', '🇪', '🇫', '🇬', '🇭', '🇮', '🇯', '🇰', '🇱', '🇲', \
                         '🇳', '🇴', '🇵', '🇶', '🇷', '🇸', '🇹', '🇺', '🇻', '🇼', '🇽', '🇾', '🇿')
+# Every unicode emoji and regional indicator, with variation selectors removed. Built once on import, so that
+# classifyEmoji can recognise a unicode emoji with a single lookup.
+UNICODE_EMOJIS = frozenset(e.replace(VAR_SELECTOR, "") for e in itertools.chain(emoji.EMOJI_DATA, REGIONAL_INDICATORS))
+# Matches the whole of a discord custom emoji, <:NAME:ID>, or <a:NAME:ID> for animated emojis, capturing the ID
+CUSTOM_EMOJI_PATTERN = re.compile(r"<a?:\w+:(\d+)>")
 
 
 def strIsUnicodeEmoji(c: str) -> bool:
@@ -290,6 +297,28 @@ BasedEmoji.EMPTY.unicode = ""
 BasedEmoji.EMPTY.sendable = ""
 
 
+def classifyEmoji(s: str, rejectInvalid: bool = False) -> Optional[BasedEmoji]:
+    """Parse a string containing exactly one unicode emoji or discord custom emoji.
+    This is equivalent to checking strIsCustomEmoji and strIsUnicodeEmoji and then calling BasedEmoji.fromStr, but
+    makes one pass over s, using UNICODE_EMOJIS and CUSTOM_EMOJI_PATTERN rather than the emoji library.
+    Unlike strIsUnicodeEmoji, the whole of s must be the emoji, ignoring any variation selectors.
+
+    :param str s: The string to parse
+    :param bool rejectInvalid: When true, an exception is guaranteed to raise if an invalid emoji is requested,
+                                regardless of raiseUnknownEmojis (Default False)
+    :raise exceptions.UnrecognisedCustomEmoji: When rejectInvalid=True, and s is a custom emoji that does not exist or
+                                                the client cannot access.
+    :return: A BasedEmoji representing s, or None if s is not a single emoji
+    :rtype: Optional[BasedEmoji]
+    """
+    if s.startswith("<"):
+        match = CUSTOM_EMOJI_PATTERN.fullmatch(s)
+        return None if match is None else BasedEmoji(id=int(match[1]), rejectInvalid=rejectInvalid)
+    if len(s) <= MAX_EMOJI_LEN and s.replace(VAR_SELECTOR, "") in UNICODE_EMOJIS:
+        return BasedEmoji(unicode=s, rejectInvalid=rejectInvalid)
+    return None
+
+
 class UninitializedBasedEmoji:
     """A data class representing a BasedEmoji waiting to be initialized.
     No instances of this class should be present after bot client's on_ready event
@@ -1,5 +1,33 @@
 import json
 import os
+import re
+import tempfile
+import asyncio
+import zlib
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Extension added to a database's save path, for the file recording changes made since the database was last saved in full
+DELTA_EXT = ".delta"
+
+# Database save paths ending in BINARY_EXT are saved in a compact binary format rather than JSON.
+# Adding COMPRESSED_EXT after BINARY_EXT also compresses the file, e.g "users.msgpack.z"
+BINARY_EXT = ".msgpack"
+COMPRESSED_EXT = ".z"
+# Identifies binary database files, followed by one byte of format flags
+BINARY_MAGIC = b"BDB1"
+# Binary format flag indicating that the rest of the file is zlib-compressed
+FLAG_COMPRESSED = 1
+# zlib compression level for compressed binary databases. Lower is faster, higher is smaller.
+COMPRESSION_LEVEL = 1
+# Number of characters to read at a time when streaming records from a JSON database file
+STREAM_CHUNK_SIZE = 64 * 1024
+# Matches any amount of JSON whitespace
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
 
 
 def readJSON(dbFile: str) -> dict:
@@ -7,7 +35,7 @@ def readJSON(dbFile: str) -> dict:
 
     :param str dbFile: Path to the file to read
     :return: The contents of the requested json file, parsed into a python dictionary
-    :rtype: dict 
+    :rtype: dict
     """
     f = open(dbFile, "r")
     txt = f.read()
@@ -15,21 +43,282 @@ def readJSON(dbFile: str) -> dict:
     return json.loads(txt)
 
 
-def writeJSON(dbFile: str, db: dict, prettyPrint=False):
+def writeAtomic(filePath: str, data: bytes):
+    """Write the given bytes to the given file path atomically.
+    data is first written to a temporary file in the same directory, which is then moved over filePath.
+    If writing fails part way through, the existing contents of filePath are left intact.
+
+    :param str filePath: Path to the file which data should be written to
+    :param bytes data: The data to write
+    """
+    writeAtomicStream(filePath, (data,))
+
+
+def writeAtomicStream(filePath: str, chunks: Iterable[bytes]) -> int:
+    """Write the given sequence of byte strings to the given file path atomically, one at a time.
+    This allows large files to be written without holding their entire contents in memory.
+    If writing fails part way through, the existing contents of filePath are left intact.
+
+    :param str filePath: Path to the file which data should be written to
+    :param chunks: The data to write, in order
+    :type chunks: Iterable[bytes]
+    :return: A checksum of the written file
+    :rtype: int
+    """
+    checksum = 0
+    # The temporary file must be on the same filesystem as filePath for os.replace to be atomic
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(filePath) or ".", prefix=os.path.basename(filePath) + ".",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                checksum = zlib.crc32(chunk, checksum)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpPath, filePath)
+    except BaseException:
+        # Don't leave partially written temporary files lying around
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+    return checksum
+
+
+def writeJSON(dbFile: str, db: dict, prettyPrint=False) -> int:
     """Write the given json-serializable dictionary to the given file path.
     All objects in the dictionary must be JSON-serializable.
 
+    The file is written atomically, so if writing fails part way through, the existing contents of dbFile are left intact.
+
     :param str dbFile: Path to the file which db should be written to
     :param dict db: The json-serializable dictionary to write
     :param bool prettyPrint: When False, write minified JSON. When true, write JSON with basic pretty printing (indentation)
+    :return: A checksum of the written file
+    :rtype: int
     """
     if prettyPrint:
         txt = json.dumps(db, indent=4, sort_keys=True)
     else:
         txt = json.dumps(db)
-    f = open(dbFile, "w")
-    txt = f.write(txt)
-    f.close()
+    data = txt.encode()
+    writeAtomic(dbFile, data)
+    return zlib.crc32(data)
+
+
+def encodeJSONRecords(db: dict) -> Iterator[bytes]:
+    """Encode a dictionary as JSON one top-level item at a time, so that the full JSON text is never held in memory.
+    The concatenated result is identical to json.dumps(db) for a dictionary with string keys.
+
+    :param dict db: The json-serializable dictionary to encode
+    :return: An iterator over consecutive pieces of the JSON text, encoded as bytes
+    :rtype: Iterator[bytes]
+    """
+    yield b"{"
+    separator = ""
+    for key, value in db.items():
+        yield (separator + json.dumps(str(key)) + ": " + json.dumps(value)).encode()
+        separator = ", "
+    yield b"}"
+
+
+def writeJSONStream(dbFile: str, db: dict) -> int:
+    """Write the given json-serializable dictionary to the given file path as minified JSON, one record at a time.
+    This produces the same file as writeJSON, but only one record's JSON text is held in memory at a time.
+
+    The file is written atomically, so if writing fails part way through, the existing contents of dbFile are left intact.
+
+    :param str dbFile: Path to the file which db should be written to
+    :param dict db: The json-serializable dictionary to write
+    :return: A checksum of the written file
+    :rtype: int
+    """
+    return writeAtomicStream(dbFile, encodeJSONRecords(db))
+
+
+def iterJSONRecords(dbFile: str, chunkSize: int = STREAM_CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """Decode a JSON file containing a single object, one top-level item at a time.
+    The file is read in chunks, so only around one record is held in memory at a time, rather than the whole file.
+
+    :param str dbFile: Path to the JSON file to read
+    :param int chunkSize: The number of characters to read from the file at a time (Default STREAM_CHUNK_SIZE)
+    :raise json.JSONDecodeError: If the file does not contain a valid JSON object
+    :return: An iterator over the key and decoded value of each top-level item in the file
+    :rtype: Iterator[Tuple[str, Any]]
+    """
+    decoder = json.JSONDecoder()
+    with open(dbFile, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def readMore():
+            """Discard the consumed part of the buffer, and read more of the file into it.
+            The read size grows with the buffer, so that reading a single very large record takes linear time.
+            """
+            nonlocal buffer, pos, eof
+            chunk = f.read(max(chunkSize, len(buffer) - pos))
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def nextChar() -> str:
+            """Skip whitespace, reading more of the file if needed, and peek at the next character.
+            """
+            nonlocal pos
+            while True:
+                pos = JSON_WHITESPACE.match(buffer, pos).end()
+                if pos < len(buffer) or eof:
+                    return buffer[pos:pos + 1]
+                readMore()
+
+        def nextValue() -> Any:
+            """Decode the next JSON value, reading more of the file until the value is complete.
+            """
+            nonlocal pos
+            nextChar()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    # A number ending at the end of the buffer may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                readMore()
+
+        def expect(char: str):
+            """Consume the next non-whitespace character, which must be char.
+            """
+            nonlocal pos
+            if nextChar() != char:
+                raise json.JSONDecodeError("Expecting '" + char + "'", buffer, pos)
+            pos += 1
+
+        expect("{")
+        if nextChar() == "}":
+            return
+        while True:
+            key = nextValue()
+            expect(":")
+            yield key, nextValue()
+            if nextChar() == "}":
+                return
+            expect(",")
+
+
+def fileChecksum(filePath: str) -> Optional[int]:
+    """Calculate the checksum of a file's contents, reading it in chunks.
+
+    :param str filePath: Path to the file
+    :return: The checksum of the file, in the same form as returned by writeDB. None if the file does not exist.
+    :rtype: Optional[int]
+    """
+    if not os.path.isfile(filePath):
+        return None
+    checksum = 0
+    with open(filePath, "rb") as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum
+
+
+def isBinaryPath(dbFile: str) -> bool:
+    """Decide whether the given database save path selects the binary save format, by its extension.
+
+    :param str dbFile: Path to the database file
+    :return: True if dbFile ends in BINARY_EXT, or BINARY_EXT followed by COMPRESSED_EXT. False otherwise
+    :rtype: bool
+    """
+    return dbFile.endswith(BINARY_EXT) or dbFile.endswith(BINARY_EXT + COMPRESSED_EXT)
+
+
+def legacyJSONPath(dbFile: str) -> str:
+    """Get the path that the given binary database file would have been saved to in JSON format.
+    E.g, "saveData/users.msgpack.z" -> "saveData/users.json"
+
+    :param str dbFile: Path to a binary database file
+    :return: dbFile with its binary extensions replaced with .json
+    :rtype: str
+    """
+    if dbFile.endswith(COMPRESSED_EXT):
+        dbFile = dbFile[:-len(COMPRESSED_EXT)]
+    return dbFile[:-len(BINARY_EXT)] + ".json"
+
+
+def encodeBinary(db: dict, compress: bool = False) -> bytes:
+    """Encode a database in the binary save format.
+    The top-level keys of db must be IDs, either as ints or strings of digits. They are stored as ints.
+
+    :param dict db: A dictionary-serialized database, e.g as returned by UserDB.toDict
+    :param bool compress: Whether or not to compress the encoded database (Default False)
+    :raise RuntimeError: If the msgpack package is not installed
+    :return: The encoded database
+    :rtype: bytes
+    """
+    if msgpack is None:
+        raise RuntimeError("The msgpack package must be installed to save databases in binary format")
+    payload = msgpack.packb({int(key): value for key, value in db.items()})
+    if compress:
+        return BINARY_MAGIC + bytes((FLAG_COMPRESSED,)) + zlib.compress(payload, COMPRESSION_LEVEL)
+    return BINARY_MAGIC + bytes((0,)) + payload
+
+
+def decodeDB(raw: bytes) -> dict:
+    """Decode the contents of a database file, in either the binary or JSON save format.
+    Databases decoded from the binary format have int keys. Databases decoded from JSON have string keys.
+
+    :param bytes raw: The contents of the database file
+    :raise RuntimeError: If raw is in binary format, and the msgpack package is not installed
+    :return: The decoded database
+    :rtype: dict
+    """
+    if not raw.startswith(BINARY_MAGIC):
+        return json.loads(raw)
+    if msgpack is None:
+        raise RuntimeError("The msgpack package must be installed to load databases in binary format")
+    payload = raw[len(BINARY_MAGIC) + 1:]
+    if raw[len(BINARY_MAGIC)] & FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+    return msgpack.unpackb(payload, strict_map_key=False)
+
+
+def writeDB(dbFile: str, db: dict) -> int:
+    """Write the given dictionary-serialized database to the given file path, in the format selected by its extension.
+    If dbFile ends in BINARY_EXT or BINARY_EXT + COMPRESSED_EXT, the binary format is used. Otherwise, JSON is used,
+    and written one record at a time.
+
+    The file is written atomically, so if writing fails part way through, the existing contents of dbFile are left intact.
+
+    :param str dbFile: Path to the file which db should be written to
+    :param dict db: The dictionary-serialized database to write
+    :return: A checksum of the written file
+    :rtype: int
+    """
+    if not isBinaryPath(dbFile):
+        return writeJSONStream(dbFile, db)
+    data = encodeBinary(db, compress=dbFile.endswith(COMPRESSED_EXT))
+    writeAtomic(dbFile, data)
+    return zlib.crc32(data)
+
+
+async def writeJSONAsync(dbFile: str, db: dict, prettyPrint=False):
+    """Asynchronous version of writeJSON, performing serialization and file writing in a worker thread.
+    This avoids blocking the event loop while large databases are saved.
+
+    ⚠ db must not be modified until this coroutine returns. Pass a snapshot (e.g the result of a toDict call)
+    rather than a live database object.
+
+    :param str dbFile: Path to the file which db should be written to
+    :param dict db: The json-serializable dictionary to write
+    :param bool prettyPrint: When False, write minified JSON. When true, write JSON with basic pretty printing (indentation)
+    """
+    await asyncio.get_running_loop().run_in_executor(None, writeJSON, dbFile, db, prettyPrint)
 
 
 def saveDB(dbPath: str, db, **kwargs):
@@ -52,4 +341,173 @@ async def saveDBAsync(dbPath: str, db, **kwargs):
     :param str dbPath: path to the JSON file to save to. Theoretically, this can be absolute or relative.
     :param db: the database object to save
     """
-    writeJSON(dbPath, await db.toDict(**kwargs))
+    await writeJSONAsync(dbPath, await db.toDict(**kwargs))
+
+
+def startDeltaSegment(dbFile: str, snapshotChecksum: Optional[int]):
+    """Discard all changes recorded for the given database file, and begin recording changes against a new full save.
+    The checksum of the full save is recorded, so that changes recorded against an old version of the file can never
+    be applied to a newer one.
+
+    :param str dbFile: Path to the full database save file
+    :param int snapshotChecksum: The checksum of dbFile, as returned by writeDB. None if dbFile does not exist.
+    """
+    writeAtomic(dbFile + DELTA_EXT, (json.dumps({"snapshot": snapshotChecksum}) + "\n").encode())
+
+
+def appendDelta(dbFile: str, delta: dict):
+    """Record a set of changes to the given database file, without rewriting the full file.
+
+    :param str dbFile: Path to the full database save file
+    :param dict delta: A dictionary mapping the keys of changed records to their new values, or None if removed
+    """
+    with open(dbFile + DELTA_EXT, "a") as f:
+        f.write(json.dumps(delta) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def readDeltas(dbFile: str, snapshotChecksum: Optional[int]) -> Tuple[List[dict], bool]:
+    """Read all changes recorded against the given database file.
+    If changes were recorded against a different version of dbFile, they are ignored.
+    If the final change was only partially written (e.g due to a crash), it is ignored.
+
+    :param str dbFile: Path to the full database save file
+    :param int snapshotChecksum: The checksum of dbFile's current contents. None if dbFile does not exist.
+    :return: A list of all valid recorded changes in the order they were made, and whether or not more changes may be
+            safely appended to the file. If False, the database should be saved in full before recording any more changes.
+    :rtype: Tuple[List[dict], bool]
+    """
+    if not os.path.isfile(dbFile + DELTA_EXT):
+        return [], False
+    with open(dbFile + DELTA_EXT, "r") as f:
+        lines = f.read().split("\n")
+
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return [], False
+    if not isinstance(header, dict) or header.get("snapshot") != snapshotChecksum:
+        return [], False
+
+    deltas = []
+    # A correctly written file always ends in a new line, so the final element of lines should be empty
+    for line in lines[1:-1]:
+        try:
+            deltas.append(json.loads(line))
+        except ValueError:
+            return deltas, False
+    return deltas, lines[-1] == ""
+
+
+def iterDBWithDeltas(dbFile: str) -> Tuple[Iterator[Tuple[Union[str, int], Any]], int, bool]:
+    """Read the given database file one record at a time, applying all changes recorded against it since it was last
+    saved in full. The file may be in either the binary or JSON save format. If the file does not exist, only the
+    recorded changes are read.
+
+    JSON files are decoded one record at a time, so the whole file is never held in memory.
+    Binary files are decoded in full.
+
+    If dbFile selects the binary format but does not exist, the database is instead read from the JSON file that would
+    have been used before switching to the binary format, if it exists.
+
+    :param str dbFile: Path to the full database save file
+    :return: An iterator over the ID and dictionary-serialized form of each up to date record, the number of changed
+            records applied, and whether or not more changes may be safely appended to the file. If False, the database
+            should be saved in full before recording any more changes.
+    :rtype: Tuple[Iterator[Tuple[Union[str, int], Any]], int, bool]
+    """
+    if isBinaryPath(dbFile) and not os.path.isfile(dbFile) and os.path.isfile(legacyJSONPath(dbFile)):
+        records, numChanges, _ = iterDBWithDeltas(legacyJSONPath(dbFile))
+        # Changes must not be recorded against dbFile until it has been saved in full
+        return records, numChanges, False
+
+    # The checksum is calculated in a separate pass, so that deltas can be validated before any records are decoded
+    checksum = fileChecksum(dbFile)
+    deltas, deltasValid = readDeltas(dbFile, checksum)
+    # Later changes to the same record replace earlier ones
+    changes = {}
+    for delta in deltas:
+        changes.update(delta)
+
+    def iterRecords():
+        if checksum is not None:
+            with open(dbFile, "rb") as f:
+                binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+            if binary:
+                with open(dbFile, "rb") as f:
+                    records = decodeDB(f.read()).items()
+            else:
+                records = iterJSONRecords(dbFile)
+            for key, value in records:
+                # Delta files always store keys as strings
+                strKey = key if type(key) is str else str(key)
+                if strKey in changes:
+                    value = changes.pop(strKey)
+                    if value is None:
+                        continue
+                yield key, value
+        # Records added since the last full save
+        for key, value in changes.items():
+            if value is not None:
+                yield key, value
+
+    return iterRecords(), sum(len(delta) for delta in deltas), deltasValid
+
+
+def readDBWithDeltas(dbFile: str) -> Tuple[dict, int, bool]:
+    """Read the given database file, and apply all changes recorded against it since it was last saved in full.
+    The file may be in either the binary or JSON save format. If the file does not exist, changes are applied to an
+    empty dictionary. See iterDBWithDeltas.
+
+    :param str dbFile: Path to the full database save file
+    :return: The up to date database contents, the number of changed records applied, and whether or not more changes
+            may be safely appended to the file. If False, the database should be saved in full before recording any more changes.
+    :rtype: Tuple[dict, int, bool]
+    """
+    records, numChanges, deltasValid = iterDBWithDeltas(dbFile)
+    return dict(records), numChanges, deltasValid
+
+
+def prepareDBSave(dbPath: str, db, compactionRatio: float, **kwargs) -> Optional[Callable[[], None]]:
+    """Take a snapshot of the unsaved changes in a change-tracking database (e.g UserDB, GuildDB),
+    and return a function which writes those changes to file.
+    The snapshot is taken immediately, but writing is deferred so that it may be performed in a worker thread.
+
+    If only a few records have changed, only those records are written, by appending them to dbPath's delta file.
+    Once the number of records in the delta file passes compactionRatio * the number of records in the database,
+    the entire database is instead written to dbPath, and the delta file is cleared.
+    If writing fails, the database is marked as requiring a full save.
+
+    :param str dbPath: path to the file to save to, in the format selected by its extension (see writeDB).
+    :param db: the change-tracking database object to save
+    :param float compactionRatio: The maximum size of the delta file, relative to the size of the database.
+    :return: A function writing the snapshot to file, or None if the database has no changes to save
+    :rtype: Optional[Callable[[], None]]
+    """
+    if not db.hasChanges():
+        return None
+
+    if db.fullSaveRequired or db.deltaSize + len(db.changedIDs) > compactionRatio * len(db):
+        data = db.toDict(**kwargs)
+        db.deltaSize = 0
+
+        def write():
+            startDeltaSegment(dbPath, writeDB(dbPath, data))
+    else:
+        data = db.toDeltaDict(**kwargs)
+        db.deltaSize += len(data)
+
+        def write():
+            appendDelta(dbPath, data)
+
+    db.clearChanges()
+
+    def writeOrRequireFullSave():
+        try:
+            write()
+        except BaseException:
+            db.fullSaveRequired = True
+            raise
+
+    return writeOrRequireFullSave
@@ -0,0 +1,118 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from discord import Message
+    from discord.abc import Messageable
+
+from ..cfg import cfg
+from ..scheduling.clock import Clock, systemClock
+
+
+class MessageCache:
+    """A bounded cache of recently used discord messages, to avoid fetching the same message repeatedly.
+    Messages are evicted when they have not been used for a while, and are refetched when they have been cached for
+    longer than ttlSeconds, since reactions and edits made by other users are not reflected in a cached message.
+
+    Messages should be invalidated when they are deleted or edited by someone other than the bot.
+
+    :var messages: Cached messages and the monotonic time they were cached, keyed by message ID, from least to most
+                    recently used
+    :vartype messages: OrderedDict[int, Tuple[Message, float]]
+    :var cacheSize: The maximum number of messages to cache
+    :vartype cacheSize: int
+    :var ttlSeconds: The number of seconds that a message may be used from the cache before it must be refetched
+    :vartype ttlSeconds: float
+    :var hits: The number of lookups which found a fresh cached message
+    :vartype hits: int
+    :var misses: The number of lookups which found no message, or a message that had expired
+    :vartype misses: int
+    """
+
+    def __init__(self, cacheSize: int = None, ttlSeconds: float = None, clock: Clock = systemClock):
+        """
+        :param int cacheSize: The maximum number of messages to cache (Default cfg.messageCacheSize)
+        :param float ttlSeconds: The number of seconds that a message may be used from the cache before it must be
+                                    refetched (Default cfg.messageCacheTTLSeconds)
+        :param Clock clock: The clock to measure message ages with (Default the system clock)
+        """
+        self.messages: OrderedDict[int, Tuple[Message, float]] = OrderedDict()
+        self.cacheSize = cfg.messageCacheSize if cacheSize is None else cacheSize
+        self.ttlSeconds = cfg.messageCacheTTLSeconds if ttlSeconds is None else ttlSeconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+
+
+    def store(self, message: Message):
+        """Cache the given message as the most recently used message.
+        If too many messages are cached, the least recently used message is evicted.
+
+        :param discord.Message message: The message to cache
+        """
+        self.messages[message.id] = (message, self.clock.monotonic())
+        self.messages.move_to_end(message.id)
+        while len(self.messages) > self.cacheSize:
+            self.messages.popitem(last=False)
+
+
+    def get(self, msgID: int) -> Optional[Message]:
+        """Get the cached message with the given ID, if it is cached and has not expired.
+
+        :param int msgID: The ID of the message to look up
+        :return: The cached message, or None if it is not cached or has expired
+        :rtype: Optional[discord.Message]
+        """
+        entry = self.messages.get(msgID, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self.clock.monotonic() - entry[1] > self.ttlSeconds:
+            del self.messages[msgID]
+            self.misses += 1
+            return None
+        self.messages.move_to_end(msgID)
+        self.hits += 1
+        return entry[0]
+
+
+    async def fetch(self, channel: Messageable, msgID: int) -> Message:
+        """Get the message with the given ID from the cache, or fetch it from discord (an API call) and cache it if it is
+        not cached or has expired.
+
+        :param discord.abc.Messageable channel: The channel containing the message
+        :param int msgID: The ID of the message to get
+        :return: The requested message
+        :rtype: discord.Message
+        :raise discord.NotFound: If the message is not cached and does not exist
+        :raise discord.Forbidden: If the message is not cached and the bot cannot read it
+        :raise discord.HTTPException: If the message is not cached and fetching it failed
+        """
+        message = self.get(msgID)
+        if message is None:
+            message = await channel.fetch_message(msgID)
+            self.store(message)
+        return message
+
+
+    def invalidate(self, msgID: int):
+        """Remove the message with the given ID from the cache, if it is cached.
+        The next fetch for the message will fetch it from discord.
+
+        :param int msgID: The ID of the message to remove
+        """
+        self.messages.pop(msgID, None)
+
+
+    def hitRate(self) -> float:
+        """Get the proportion of lookups which found a fresh cached message.
+
+        :return: The number of hits divided by the number of lookups, or 0 if there have been no lookups
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+
+    def __len__(self) -> int:
+        return len(self.messages)
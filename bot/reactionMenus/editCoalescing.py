@@ -0,0 +1,100 @@
+from __future__ import annotations
+import asyncio
+from typing import Dict, List, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from discord import Message
+
+from ..cfg import cfg
+from ..scheduling.clock import Clock, systemClock
+
+
+class EditCoalescer:
+    """Combines rapid edits to the same message into as few API requests as possible.
+    The first edit to a message is sent straight away. Edits requested while it is in flight, or within windowSeconds
+    of it completing, wait, and are combined into one edit once the window has passed, with later arguments replacing
+    earlier ones, e.g only the most recently requested embed is sent. At most
+    one edit is in flight per message, so a user flipping through a paged menu quickly costs about one edit per window,
+    rather than one edit per reaction.
+
+    :var windowSeconds: The minimum number of seconds between the end of one edit to a message, and the start of the next
+    :vartype windowSeconds: float
+    :var pending: The latest edit waiting to be sent to each message, as the message, the edit's keyword arguments, and
+                    futures for every caller waiting for the edit, by message ID
+    :vartype pending: Dict[int, Tuple[Message, dict, List[asyncio.Future]]]
+    :var workers: The task sending edits to each message which has edits in flight or pending, by message ID
+    :vartype workers: Dict[int, asyncio.Task]
+    :var numRequested: The number of edits requested
+    :vartype numRequested: int
+    :var numSent: The number of edits sent to discord
+    :vartype numSent: int
+    """
+
+    def __init__(self, windowSeconds: float = None, clock: Clock = systemClock):
+        """
+        :param float windowSeconds: The minimum number of seconds between the end of one edit to a message, and the start
+                                    of the next (Default cfg.menuEditWindowSeconds)
+        :param Clock clock: The clock to wait for windows on (Default the system clock)
+        """
+        self.windowSeconds = cfg.menuEditWindowSeconds if windowSeconds is None else windowSeconds
+        self.clock = clock
+        self.pending: Dict[int, Tuple[Message, dict, List[asyncio.Future]]] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.numRequested = 0
+        self.numSent = 0
+
+
+    async def edit(self, msg: Message, **kwargs):
+        """Edit the given message, combining the edit with any other edits requested for the message in the meantime.
+        This returns once msg has been edited with these arguments, or with the arguments of a later edit request.
+
+        :param discord.Message msg: The message to edit
+        :param kwargs: The keyword arguments to pass to msg.edit
+        :raise discord.HTTPException: If the edit sent for this request failed
+        """
+        self.numRequested += 1
+        future = asyncio.get_running_loop().create_future()
+        if msg.id in self.pending:
+            # Later arguments replace earlier ones, so earlier requests are satisfied by the combined edit
+            _, pendingKwargs, waiting = self.pending[msg.id]
+            waiting.append(future)
+            self.pending[msg.id] = (msg, {**pendingKwargs, **kwargs}, waiting)
+        else:
+            self.pending[msg.id] = (msg, kwargs, [future])
+        if msg.id not in self.workers:
+            self.workers[msg.id] = asyncio.create_task(self.sendEdits(msg.id))
+        await future
+
+
+    async def sendEdits(self, msgID: int):
+        """Send pending edits to the message with the given ID, one at a time and at least windowSeconds apart,
+        until no more are pending.
+        If this task is cancelled, every caller waiting for an edit that has not completed is cancelled too.
+
+        :param int msgID: The ID of the message to edit
+        """
+        try:
+            while msgID in self.pending:
+                msg, kwargs, waiting = self.pending.pop(msgID)
+                self.numSent += 1
+                try:
+                    await msg.edit(**kwargs)
+                # The edit may not have been sent, so cancel everyone waiting for it rather than leaving them waiting
+                except asyncio.CancelledError:
+                    for future in waiting:
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    for future in waiting:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for future in waiting:
+                        if not future.done():
+                            future.set_result(None)
+                await self.clock.sleep(self.windowSeconds)
+        finally:
+            del self.workers[msgID]
+            # Only reached with edits still pending if this task was cancelled
+            if msgID in self.pending:
+                for future in self.pending.pop(msgID)[2]:
+                    future.cancel()
@@ -25,7 +25,7 @@ async def removeEmbedAndOptions(menuID: int):
     """
     if menuID in botState.reactionMenusDB:
         menu = botState.reactionMenusDB[menuID]
-        await menu.msg.edit(suppress=True)
+        await botState.editCoalescer.edit(menu.msg, suppress=True)
 
         for react in menu.options:
             await menu.msg.remove_reaction(react.sendable, menu.msg.guild.me)
@@ -41,7 +41,7 @@ async def markExpiredMenu(menuID: int):
     """
     menu = botState.reactionMenusDB[menuID]
     try:
-        await menu.msg.edit(content=cfg.expiredMenuMsg)
+        await botState.editCoalescer.edit(menu.msg, content=cfg.expiredMenuMsg)
     except NotFound:
         pass
     except HTTPException:
@@ -59,7 +59,9 @@ async def markExpiredMenuAndRemoveOptions(menuID: int):
     :param int menuID: The ID of the menu, corresponding with the discord ID of the menu's message
     """
     menu = botState.reactionMenusDB[menuID]
-    menu.msg = await menu.msg.channel.fetch_message(menu.msg.id)
+    # The cached message may predate the menu's option reactions, which the fallback below needs to remove
+    botState.messageCache.invalidate(menu.msg.id)
+    menu.msg = await botState.messageCache.fetch(menu.msg.channel, menu.msg.id)
     try:
         await menu.msg.clear_reactions()
     except Forbidden:
@@ -106,7 +106,7 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
         self.updateCurrentPage()
         await self.updateMessage(noRefreshOptions=True)
         if self.currentPageNum == len(self.pages) - 1:
-            self.msg = await self.msg.channel.fetch_message(self.msg.id)
+            self.msg = await botState.messageCache.fetch(self.msg.channel, self.msg.id)
             await self.msg.remove_reaction(cfg.defaultEmojis.next.sendable, botState.client.user)
         if self.currentPageNum == 1:
             await self.msg.add_reaction(cfg.defaultEmojis.previous.sendable)
@@ -123,7 +123,7 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
         self.updateCurrentPage()
         await self.updateMessage(noRefreshOptions=True)
         if self.currentPageNum == 0:
-            self.msg = await self.msg.channel.fetch_message(self.msg.id)
+            self.msg = await botState.messageCache.fetch(self.msg.channel, self.msg.id)
             await self.msg.remove_reaction(cfg.defaultEmojis.previous.sendable, botState.client.user)
         if self.currentPageNum == len(self.pages) - 2:
             await self.msg.add_reaction(cfg.defaultEmojis.next.sendable)
@@ -143,7 +143,7 @@ class PagedReactionMenu(reactionMenu.ReactionMenu):
             await self.updateMessage(noRefreshOptions=True)
             if len(self.pages) > 1:
                 if self.currentPageNum == 0:
-                    self.msg = await self.msg.channel.fetch_message(self.msg.id)
+                    self.msg = await botState.messageCache.fetch(self.msg.channel, self.msg.id)
                     await self.msg.remove_reaction(cfg.defaultEmojis.previous.sendable, botState.client.user)
                 if self.currentPageNum != len(self.pages) - 1:
                     await self.msg.add_reaction(cfg.defaultEmojis.next.sendable)
@@ -3,7 +3,7 @@
 
 from ..scheduling.timedTask import TimedTask
 import inspect
-from discord import Embed, Colour, NotFound, HTTPException, Forbidden, Member, User, Message, Role, RawReactionActionEvent
+from discord import Embed, Colour, Member, User, Message, Role, RawReactionActionEvent
 from ..cfg import cfg
 from .. import botState, lib
 from abc import abstractmethod
@@ -308,6 +308,8 @@ class ReactionMenu(serializable.Serializable):
 
         # discord.message
         self.msg = msg
+        if botState.messageCache is not None:
+            botState.messageCache.store(msg)
         # Dict of lib.emojis.BasedEmoji: ReactionMenuOption
         self.options = options if options is not None else {}
 
@@ -407,26 +409,36 @@ class ReactionMenu(serializable.Serializable):
         return menuEmbed
 
 
-    async def updateMessage(self, noRefreshOptions=False):
-        """Update the menu message by removing all reactions, replacing any existing embed with
-        up to date embed content, and readd all of the menu's option reactions.
+    async def updateMessage(self, noRefreshOptions=False) -> float:
+        """Update the menu message by replacing any existing embed with up to date embed content, and bringing the
+        message's reactions in line with the menu's options.
+        Edits are sent through botState.editCoalescer, so rapid updates to the same menu are combined.
+        Only missing option reactions are added, and only reactions which are not options are removed, by
+        botState.reactionSeeder. The message is always refetched before seeding, bypassing botState.messageCache.
+
+        :param bool noRefreshOptions: Give True to only update the menu embed, leaving reactions untouched
+                                        (Default False)
+        :return: The number of seconds taken to seed the menu's reactions, or 0 if noRefreshOptions was given
+        :rtype: float
         """
-        await self.msg.edit(embed=self.getMenuEmbed())
+        await botState.editCoalescer.edit(self.msg, embed=self.getMenuEmbed())
+
+        if noRefreshOptions:
+            return 0
+        # Cached messages' reactions are not updated by reaction events, so the seeder needs a fresh reactions list
+        botState.messageCache.invalidate(self.msg.id)
+        self.msg = await botState.messageCache.fetch(self.msg.channel, self.msg.id)
+        return await botState.reactionSeeder.seedReactions(self.msg, list(self.options))
 
-        if not noRefreshOptions:
-            self.msg = await self.msg.channel.fetch_message(self.msg.id)
 
-            try:
-                await self.msg.clear_reactions()
-            except Forbidden:
-                for reaction in self.msg.reactions:
-                    try:
-                        await reaction.remove(botState.client.user)
-                    except (HTTPException, NotFound):
-                        pass
+    async def afterRestore(self, budget: asyncio.Semaphore = None):
+        """Called once a menu restored from file has been added to the reaction menus DB, with its message freshly
+        fetched. Override this to catch up with anything that happened to the menu while the bot was offline.
+        Does nothing by default.
 
-            for option in self.options:
-                await self.msg.add_reaction(option.sendable)
+        :param asyncio.Semaphore budget: Held while making discord API requests (Default None)
+        """
+        pass
 
 
     async def delete(self):
@@ -484,7 +496,7 @@ class ReactionMenu(serializable.Serializable):
             data["authorName"] = self.authorName
 
         if self.timeout != None:
-            data["timeout"] = self.timeout.expiryTime.timestamp()
+            data["timeout"] = self.timeout.expiryTimestamp()
 
         if self.targetMember is not None:
             data["targetMember"] = self.targetMember.id
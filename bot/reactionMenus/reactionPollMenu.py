@@ -1,117 +1,184 @@
 from __future__ import annotations
+import asyncio
+import contextlib
 from . import reactionMenu
 from ..cfg import cfg
 from .. import botState, lib
-from discord import Colour, Emoji, PartialEmoji, Message, Embed, User, Member, Role
-from datetime import datetime
+from discord import Colour, Emoji, PartialEmoji, Message, Embed, User, Member, Role, NotFound, HTTPException, Forbidden
 from ..scheduling import timedTask
-from typing import Dict, Union, TYPE_CHECKING
+from typing import Dict, List, Optional, Set, Union, TYPE_CHECKING
 from ..users import basedUser
+from ..databases import timedTaskDB
+
+
+# Polls waiting to be finalised in the next batch, mapping menu IDs to futures which are resolved once finalised
+pendingPolls: Dict[int, asyncio.Future] = {}
+# Limits the number of discord API requests made at once by the poll finaliser. Created on first use, inside the event loop.
+requestBudget: Optional[asyncio.Semaphore] = None
 
 
 async def printAndExpirePollResults(msgID : int):
-    """Menu expiring method specific to ReactionPollMenus. Count the reactions on the menu, selecting only one per user
-    in the case of single-choice mode polls, and replace the menu embed content with a bar chart summarising
-    the results of the poll.
+    """Menu expiring method specific to ReactionPollMenus. Replace the menu embed content with a bar chart summarising
+    the results of the poll, counting only one vote per user in the case of single-choice mode polls.
+    Polls which expire at the same time are finalised together in one batch, with finalisePolls.
 
     :param int msgID: The id of the discord message containing the menu to expire
     """
-    print("printAndExpirePollResults",msgID)
-    menu = botState.reactionMenusDB[msgID]
-    menuMsg = await menu.msg.channel.fetch_message(menu.msg.id)
-    results = {}
+    finalised = pendingPolls.get(msgID, None)
+    if finalised is None:
+        finalised = pendingPolls[msgID] = asyncio.get_running_loop().create_future()
+        # The first poll to expire leads the batch, letting every other poll expiring at the same time join it first
+        if len(pendingPolls) == 1:
+            await asyncio.sleep(0)
+            batch = dict(pendingPolls)
+            pendingPolls.clear()
+            await finalisePolls(batch)
+    await finalised
 
-    if menu.owningBasedUser is not None:
-        menu.owningBasedUser.pollOwned = False
 
-    maxOptionLen = 0
-    
-    for option in menu.options.values():
-        results[option] = []
-        if len(option.name) > maxOptionLen:
-            maxOptionLen = len(option.name)
-
-    for reaction in menuMsg.reactions:
-        if type(reaction.emoji) in [Emoji, PartialEmoji]:
-            currentEmoji = lib.emojis.BasedEmoji(id=reaction.emoji.id)
-        else:
-            currentEmoji = lib.emojis.BasedEmoji(unicode=reaction.emoji)
+async def finalisePolls(batch: Dict[int, asyncio.Future]):
+    """Finalise a batch of expired polls, printing their results into their menus.
+    Polls are grouped by channel. Channels are processed concurrently, and the polls in each channel one at a time.
+    At most cfg.pollFinaliserMaxRequests reaction removal requests are made at once, across all batches. Edits to the
+    polls go through botState.editCoalescer instead.
+    Each poll's future is resolved once that poll has been finalised, or given the exception that stopped it.
+
+    :param batch: The polls to finalise, mapping menu IDs to futures to resolve
+    :type batch: Dict[int, asyncio.Future]
+    """
+    global requestBudget
+    if requestBudget is None:
+        requestBudget = asyncio.Semaphore(cfg.pollFinaliserMaxRequests)
+    budget = requestBudget
+    channels: Dict[int, List[int]] = {}
+    for msgID, finalised in batch.items():
+        if msgID in botState.reactionMenusDB:
+            channels.setdefault(botState.reactionMenusDB[msgID].msg.channel.id, []).append(msgID)
+        # The menu was deleted before it could be finalised
+        elif not finalised.done():
+            finalised.set_result(None)
+
+    async def finaliseChannel(msgIDs: List[int]):
+        for msgID in msgIDs:
+            try:
+                if msgID in botState.reactionMenusDB:
+                    await finalisePoll(botState.reactionMenusDB[msgID], budget)
+            except Exception as e:
+                if not batch[msgID].done():
+                    batch[msgID].set_exception(e)
+            else:
+                if not batch[msgID].done():
+                    batch[msgID].set_result(None)
 
-        if currentEmoji is None:
-            botState.logger.log("ReactPollMenu", "prtAndExpirePollResults", "Failed to fetch BasedEmoji for reaction: " + str(reaction), category="reactionMenus", eventType="INV_REACT")
-            pollEmbed = menuMsg.embeds[0]
-            pollEmbed.set_footer(text="This poll has ended.")
-            await menu.msg.edit(content="An error occured when calculating the results of this poll. The error has been logged.", embed=pollEmbed)
+    await asyncio.gather(*(finaliseChannel(msgIDs) for msgIDs in channels.values()))
+
+
+def makeResultsStr(results: Dict[reactionMenu.ReactionMenuOption, int]) -> str:
+    """Make a bar chart summarising the votes for each of a poll's options.
+
+    :param results: The number of votes for each option, as returned by ReactionPollMenu.getResults
+    :type results: dict[ReactionMenuOption, int]
+    :return: A bar chart of the results in a code block, or a message saying that there were no votes
+    :rtype: str
+    """
+    maxOptionLen = max((len(option.name) for option in results), default=0)
+    maxCount = max(results.values(), default=0)
+    if maxCount == 0:
+        return "No votes received!"
+
+    resultsStr = "```\n"
+    for currentOption, count in results.items():
+        resultsStr += ("🏆" if count == maxCount else "  ") + currentOption.name + (" " * (maxOptionLen - len(currentOption.name))) + " | " + ("=" * int((count / maxCount) * cfg.pollMenuResultsBarLength)) + (" " if count == 0 else "") + " +" + str(count) + " Vote" + ("s" if count != 1 else "") + "\n"
+    return resultsStr + "```"
+
+
+async def removePollReactions(menu: ReactionPollMenu, budget: asyncio.Semaphore):
+    """Remove the reactions from a finalised poll's message.
+    If the bot may manage messages in the poll's channel, all reactions are cleared at once. Otherwise, only the bot's
+    own option reactions are removed, one at a time.
+
+    :param ReactionPollMenu menu: The finalised poll
+    :param asyncio.Semaphore budget: Held while making discord API requests
+    """
+    menuMsg = menu.msg
+    if menuMsg.channel.permissions_for(menuMsg.guild.me).manage_messages:
+        try:
+            async with budget:
+                await menuMsg.clear_reactions()
+            return
+        except Forbidden:
+            pass
+        except NotFound:
             return
 
-        menuOption = None
-        for currentOption in results:
-            if currentOption.emoji == currentEmoji:
-                menuOption = currentOption
-                break
-
-        if menuOption is None:
-            # botState.logger.log("ReactPollMenu", "prtAndExpirePollResults", "Failed to find menuOption for emoji: " + str(currentEmoji), category="reactionMenus", eventType="UNKN_OPTN")
-            # pollEmbed = menuMsg.embeds[0]
-            # pollEmbed.set_footer(text="This poll has ended.")
-            # await menu.msg.edit(content="An error occured when calculating the results of this poll. The error has been logged.", embed=pollEmbed)
-            # return
-            continue
-
-        async for user in reaction.users():
-            if user != botState.client.user:
-                validVote = True
-                if not menu.multipleChoice:
-                    for currentOption in results:
-                        if currentOption.emoji != currentEmoji and user in results[currentOption]:
-                            validVote = False
-                            break
-                if validVote and user not in results[menuOption]:
-                    results[menuOption].append(user)
-                    # print(str(user),"voted for", menuOption.emoji.sendable)
-    
-    pollEmbed = menuMsg.embeds[0]
-    pollEmbed.set_footer(text="This poll has ended.")
+    for emoji in menu.options:
+        try:
+            async with budget:
+                await menuMsg.remove_reaction(emoji.sendable, menuMsg.guild.me)
+        except NotFound:
+            return
+        except HTTPException:
+            pass
 
-    maxCount = 0
-    for currentResult in results.values():
-        if len(currentResult) > maxCount:
-            maxCount = len(currentResult)
-    
-    if maxCount > 0:
-        resultsStr = "```\n"
-        for currentOption in results:
-            resultsStr += ("🏆" if len(results[currentOption]) == maxCount else "  ") + currentOption.name + (" " * (maxOptionLen - len(currentOption.name))) + " | " + ("=" * int((len(results[currentOption]) / maxCount) * cfg.pollMenuResultsBarLength)) + (" " if len(results[currentOption]) == 0 else "") + " +" + str(len(results[currentOption])) + " Vote" + ("s" if len(results[currentOption]) != 1 else "") + "\n"
-        resultsStr += "```"
 
-        pollEmbed.add_field(name="Results", value=resultsStr, inline=False)
-    
-    else:
-        pollEmbed.add_field(name="Results", value="No votes received!", inline=False)
+async def finalisePoll(menu: ReactionPollMenu, budget: asyncio.Semaphore):
+    """Replace a poll's menu embed content with a bar chart summarising its results, and remove it from the active
+    reaction menus DB.
+    Votes are counted as they arrive, so this does not need to fetch the poll's reactions.
 
-    await menuMsg.edit(embed=pollEmbed)
-    if msgID in botState.reactionMenusDB:
-        del botState.reactionMenusDB[msgID]
+    :param ReactionPollMenu menu: The poll to finalise
+    :param asyncio.Semaphore budget: Held while removing the poll's reactions. It is not held while editing the poll,
+                                        since the edit goes through botState.editCoalescer and may wait for its window.
+    """
+    if menu.owningBasedUser is not None:
+        menu.owningBasedUser.pollOwned = False
+    if menu.msg.id in botState.reactionMenusDB:
+        del botState.reactionMenusDB[menu.msg.id]
+    # The poll will not be used again, so make room for active menus
+    botState.messageCache.invalidate(menu.msg.id)
 
-    for reaction in menuMsg.reactions:
-        await reaction.remove(menuMsg.guild.me)
+    pollEmbed = menu.getMenuEmbed()
+    pollEmbed.set_footer(text="This poll has ended.")
+    pollEmbed.add_field(name="Results", value=makeResultsStr(menu.getResults()), inline=False)
+
+    # The edit may wait for the coalescer's window, so it is not sent under the budget. The coalescer limits each
+    # message to one edit in flight.
+    try:
+        await botState.editCoalescer.edit(menu.msg, embed=pollEmbed)
+    # The poll's message was deleted
+    except NotFound:
+        return
+
+    await removePollReactions(menu, budget)
+
+timedTaskDB.registerExpiryFunction(printAndExpirePollResults, "printAndExpirePollResults")
     
 
 class ReactionPollMenu(reactionMenu.ReactionMenu):
     """A saveable reaction menu taking a vote from its participants on a selection of option strings.
     On menu expiry, the menu's TimedTask should call printAndExpirePollResults. This edits to menu embed to provide a summary and bar chart of the votes submitted to the poll.
-    The poll options have no functionality, all vote counting takes place after menu expiry.
+    The poll options have no functionality. Votes are counted as reactions are added and removed, and reconciled with the menu's reactions when the poll is restored from file.
     TODO: change pollOptions from dict[BasedEmoji, ReactionMenuOption] to dict[BasedEmoji, str] which is used to spawn DummyReactionMenuOptions
 
     :var multipleChoice: Whether to accept votes for multiple options from the same user, or to restrict users to one option vote per poll.
     :vartype multipleChoice: bool
     :var owningBasedUser: The bbUser who started the poll
     :vartype owningBasedUser: bbUser
+    :var voters: The IDs of all users currently reacting with each option, kept up to date as reactions are added and removed
+    :vartype voters: dict[lib.emojis.BasedEmoji, set[int]]
+    :var choices: The option counted for each user in single choice mode. This is the first option in the menu that the
+                    user votes for, regardless of the order their votes were made in, so that counting votes live and
+                    recounting them from the message's reactions give the same results.
+    :vartype choices: dict[int, lib.emojis.BasedEmoji]
+    :var optionOrder: The position of each option's emoji in the menu
+    :vartype optionOrder: dict[lib.emojis.BasedEmoji, int]
+    :var choiceCounts: The number of users in choices who chose each option
+    :vartype choiceCounts: dict[lib.emojis.BasedEmoji, int]
     """
     def __init__(self, msg : Message, pollOptions : dict, timeout : timedTask.TimedTask, pollStarter : Union[User, Member] = None,
             multipleChoice : bool = False, titleTxt : str = "", desc : str = "", col : Colour = Colour.blue(), footerTxt : str = "",
             img : str = "", thumb : str = "", icon : str = "", authorName : str = "", targetMember : Member = None,
-            targetRole : Role = None, owningBasedUser : basedUser.BasedUser = None):
+            targetRole : Role = None, owningBasedUser : basedUser.BasedUser = None, voters : Dict[lib.emojis.BasedEmoji, Set[int]] = None):
         """
         :param discord.Message msg: the message where this menu is embedded
         :param options: A dictionary storing all of the poll options. Poll option behaviour functions are not called. TODO: Add reactionAdded/Removed overloads that just return and dont check anything
@@ -130,6 +197,8 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
         :param discord.Member targetMember: The only discord.Member that is able to interact with this menu. All other reactions are ignored (Default None)
         :param discord.Role targetRole: In order to interact with this menu, users must possess this role. All other reactions are ignored (Default None)
         :param bbUser owningBasedUser: The bbUser who started the poll. Used for resetting whether or not a user can make a new poll (Default None)
+        :param voters: The IDs of the users voting for each option, e.g when restoring a saved poll (Default no votes)
+        :type voters: dict[lib.emojis.BasedEmoji, set[int]]
         """
         self.multipleChoice = multipleChoice
         self.owningBasedUser = owningBasedUser
@@ -152,6 +221,137 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
 
         super(ReactionPollMenu, self).__init__(msg, options=pollOptions, titleTxt=titleTxt, desc=desc, col=col, footerTxt=footerTxt, img=img, thumb=thumb, icon=icon, authorName=authorName, timeout=timeout, targetMember=targetMember, targetRole=targetRole)
         self.saveable = True
+        self.setVoters(voters if voters is not None else {})
+
+
+    def setVoters(self, voters : Dict[lib.emojis.BasedEmoji, Set[int]]):
+        """Replace all of the poll's votes, and recount the choices of single choice mode.
+        Votes for emojis that are not options in the poll are ignored.
+
+        :param voters: The IDs of the users voting for each option
+        :type voters: dict[lib.emojis.BasedEmoji, set[int]]
+        """
+        self.voters = {emoji: set(voters.get(emoji, ())) for emoji in self.options}
+        self.optionOrder = {emoji: position for position, emoji in enumerate(self.options)}
+        self.choices = {}
+        self.choiceCounts = {emoji: 0 for emoji in self.options}
+        for emoji, optionVoters in self.voters.items():
+            for userID in optionVoters:
+                if userID not in self.choices:
+                    self.choices[userID] = emoji
+                    self.choiceCounts[emoji] += 1
+
+
+    def addVote(self, emoji : lib.emojis.BasedEmoji, userID : int):
+        """Record a user voting for an option.
+        In single choice mode, this becomes the user's counted choice if it comes before their current choice in the menu.
+
+        :param lib.emojis.BasedEmoji emoji: The emoji of the option voted for
+        :param int userID: The ID of the voting user
+        """
+        self.voters[emoji].add(userID)
+        choice = self.choices.get(userID, None)
+        if choice is None or self.optionOrder[emoji] < self.optionOrder[choice]:
+            if choice is not None:
+                self.choiceCounts[choice] -= 1
+            self.choices[userID] = emoji
+            self.choiceCounts[emoji] += 1
+
+
+    def removeVote(self, emoji : lib.emojis.BasedEmoji, userID : int):
+        """Record a user withdrawing their vote for an option.
+        If this was the user's counted choice in single choice mode, the first option in the menu that the user still
+        votes for is counted instead.
+
+        :param lib.emojis.BasedEmoji emoji: The emoji of the option no longer voted for
+        :param int userID: The ID of the user
+        """
+        self.voters[emoji].discard(userID)
+        if self.choices.get(userID, None) == emoji:
+            self.choiceCounts[emoji] -= 1
+            del self.choices[userID]
+            for otherEmoji, optionVoters in self.voters.items():
+                if userID in optionVoters:
+                    self.choices[userID] = otherEmoji
+                    self.choiceCounts[otherEmoji] += 1
+                    break
+
+
+    def canVote(self, member : Union[Member, User]) -> bool:
+        """Decide whether a user is allowed to vote in this poll, according to targetMember and targetRole.
+
+        :param discord.Member member: The user to check
+        :return: True if member may vote in this poll, False otherwise
+        :rtype: bool
+        """
+        if self.targetMember is not None and member != self.targetMember:
+            return False
+        if self.targetRole is not None and (not isinstance(member, Member) or self.targetRole not in member.roles):
+            return False
+        return True
+
+
+    async def reactionAdded(self, emoji : lib.emojis.BasedEmoji, member : Union[Member, User]):
+        """Record a vote for the option with the given emoji, if member may vote in this poll.
+
+        :param lib.emojis.BasedEmoji emoji: The emoji that member reacted to the menu with
+        :param discord.Member member: The member that added the emoji reaction
+        """
+        if self.canVote(member):
+            self.addVote(emoji, member.id)
+
+
+    async def reactionRemoved(self, emoji : lib.emojis.BasedEmoji, member : Union[Member, User]):
+        """Withdraw member's vote for the option with the given emoji.
+
+        :param lib.emojis.BasedEmoji emoji: The emoji reaction that member removed from the menu
+        :param discord.Member member: The member that removed the emoji reaction
+        """
+        self.removeVote(emoji, member.id)
+
+
+    def getResults(self) -> Dict[reactionMenu.ReactionMenuOption, int]:
+        """Get the number of votes counted for each option, in O(options) time.
+        In single choice mode, each user's vote is only counted for one option.
+
+        :return: The number of votes for each option
+        :rtype: dict[ReactionMenuOption, int]
+        """
+        if self.multipleChoice:
+            return {option: len(self.voters[emoji]) for emoji, option in self.options.items()}
+        return {option: self.choiceCounts[emoji] for emoji, option in self.options.items()}
+
+
+    async def reconcileVotes(self, budget : asyncio.Semaphore = None):
+        """Update the poll's votes from the reactions on its message, catching up with any reactions added or removed
+        while the bot was offline. self.msg should be freshly fetched, so that its reactions are up to date.
+        To save API requests, only options whose reaction count does not match their recorded votes are fetched.
+
+        :param asyncio.Semaphore budget: Held while making discord API requests (Default None)
+        """
+        voters = {emoji: set(optionVoters) for emoji, optionVoters in self.voters.items()}
+        for reaction in self.msg.reactions:
+            if type(reaction.emoji) in [Emoji, PartialEmoji]:
+                emoji = lib.emojis.BasedEmoji(id=reaction.emoji.id)
+            else:
+                emoji = lib.emojis.BasedEmoji(unicode=reaction.emoji)
+            if emoji not in voters or reaction.count == len(voters[emoji]) + (1 if reaction.me else 0):
+                continue
+
+            voters[emoji] = set()
+            async with budget if budget is not None else contextlib.nullcontext():
+                async for user in reaction.users():
+                    if user != botState.client.user and self.canVote(user):
+                        voters[emoji].add(user.id)
+        self.setVoters(voters)
+
+
+    async def afterRestore(self, budget : asyncio.Semaphore = None):
+        """Count any votes made or removed while the bot was offline.
+
+        :param asyncio.Semaphore budget: Held while making discord API requests (Default None)
+        """
+        await self.reconcileVotes(budget)
 
 
     def getMenuEmbed(self) -> Embed:
@@ -180,12 +380,14 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
         baseDict = super(ReactionPollMenu, self).toDict(**kwargs)
         baseDict["multipleChoice"] = self.multipleChoice
         baseDict["owningBasedUser"] = self.owningBasedUser.id
+        baseDict["votes"] = {emoji.sendable: list(optionVoters) for emoji, optionVoters in self.voters.items() if optionVoters}
         return baseDict
     
 
     @classmethod
     def fromDict(cls, rmDict : dict, **kwargs) -> ReactionPollMenu:
         """Reconstruct a ReactionPollMenu object from its dictionary-serialized representation - the opposite of ReactionPollMenu.toDict
+        If the poll's timeout was restored from file, it is claimed from the restoredTasks kwarg. Otherwise, a new timeout is scheduled.
 
         :param dict rmDict: A dictionary containing all information needed to recreate the desired ReactionPollMenu
         :return: A new ReactionPollMenu object as described in rmDict
@@ -196,14 +398,19 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
         msg = kwargs["msg"]
 
         options = {}
+        voters = {}
         for emojiName in rmDict["options"]:
             emoji = lib.emojis.BasedEmoji.fromStr(emojiName, rejectInvalid=True)
             options[emoji] = reactionMenu.DummyReactionMenuOption(rmDict["options"][emojiName], emoji)
+            if "votes" in rmDict and emojiName in rmDict["votes"]:
+                voters[emoji] = set(rmDict["votes"][emojiName])
 
         timeoutTT = None
-        if "timeout" in rmDict:
-            expiryTime = datetime.utcfromtimestamp(rmDict["timeout"])
-            botState.reactionMenusTTDB.scheduleTask(timedTask.TimedTask(expiryTime=expiryTime, expiryFunction=printAndExpirePollResults, expiryFunctionArgs=msg.id))
+        if "restoredTasks" in kwargs and kwargs["restoredTasks"] is not None:
+            timeoutTT = kwargs["restoredTasks"].claimTask(printAndExpirePollResults, msg.id)
+        if timeoutTT is None and "timeout" in rmDict:
+            timeoutTT = timedTask.TimedTask(expiryTimestamp=rmDict["timeout"], expiryFunction=printAndExpirePollResults, expiryFunctionArgs=msg.id)
+            botState.reactionMenusTTDB.scheduleTask(timeoutTT)
 
         return ReactionPollMenu(msg, options, timeoutTT, multipleChoice=rmDict["multipleChoice"] if "multipleChoice" in rmDict else False,
                                     titleTxt=rmDict["titleTxt"] if "titleTxt" in rmDict else "",
@@ -216,4 +423,5 @@ class ReactionPollMenu(reactionMenu.ReactionMenu):
                                     authorName=rmDict["authorName"] if "authorName" in rmDict else "",
                                     targetMember=msg.guild.get_member(rmDict["targetMember"]) if "targetMember" in rmDict else None,
                                     targetRole=msg.guild.get_role(rmDict["targetRole"]) if "targetRole" in rmDict else None,
-                                    owningBasedUser=botState.usersDB.getUser(rmDict["owningBasedUser"]) if "owningBasedUser" in rmDict and botState.usersDB.userIDExists(rmDict["owningBasedUser"]) else None)
+                                    owningBasedUser=botState.usersDB.getUser(rmDict["owningBasedUser"]) if "owningBasedUser" in rmDict and botState.usersDB.idExists(rmDict["owningBasedUser"]) else None,
+                                    voters=voters)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+import asyncio
+import traceback
+from typing import Dict, List, TYPE_CHECKING
+if TYPE_CHECKING:
+    from discord import Message
+
+from discord import HTTPException, NotFound
+from ..cfg import cfg
+from .. import botState, lib
+from ..scheduling.clock import Clock, systemClock
+
+
+class ReactionSeeder:
+    """Brings the reactions on menu messages in line with the menu's options, making as few reaction requests as possible.
+    Existing reactions are diffed against the wanted emojis, so only missing options are added, and only reactions which
+    are not options are removed.
+
+    Discord limits reaction requests per channel, so requests are paced cfg.reactionSeedingIntervalSeconds apart within
+    each channel. Removals are sent without waiting for each other to complete. Reactions are shown in the order they
+    were added, which is the order users see the menu's options in, so each addition is awaited before the next is sent.
+
+    :var intervalSeconds: The minimum number of seconds between reaction requests in the same channel
+    :vartype intervalSeconds: float
+    :var nextRequestTimes: The earliest monotonic time at which the next reaction request may be sent, by channel ID
+    :vartype nextRequestTimes: Dict[int, float]
+    :var numSeeded: The number of messages seeded
+    :vartype numSeeded: int
+    :var numRequests: The number of reaction requests sent
+    :vartype numRequests: int
+    :var totalSeconds: The total number of seconds spent seeding messages
+    :vartype totalSeconds: float
+    :var maxSeconds: The largest number of seconds spent seeding one message
+    :vartype maxSeconds: float
+    """
+
+    def __init__(self, intervalSeconds: float = None, clock: Clock = systemClock):
+        """
+        :param float intervalSeconds: The minimum number of seconds between reaction requests in the same channel
+                                        (Default cfg.reactionSeedingIntervalSeconds)
+        :param Clock clock: The clock to pace requests with (Default the system clock)
+        """
+        self.intervalSeconds = cfg.reactionSeedingIntervalSeconds if intervalSeconds is None else intervalSeconds
+        self.clock = clock
+        self.nextRequestTimes: Dict[int, float] = {}
+        self.numSeeded = 0
+        self.numRequests = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+
+
+    def reserveRequest(self, channelID: int) -> float:
+        """Reserve the next free reaction request slot in the given channel.
+
+        :param int channelID: The ID of the channel to send a reaction request in
+        :return: The number of seconds to wait before sending the request
+        :rtype: float
+        """
+        now = self.clock.monotonic()
+        sendTime = max(now, self.nextRequestTimes.get(channelID, now))
+        self.nextRequestTimes[channelID] = sendTime + self.intervalSeconds
+        return sendTime - now
+
+
+    async def sendRequest(self, msg: Message, request):
+        """Wait for a free reaction request slot in msg's channel, and then send the given request.
+        Requests which fail because the message or reaction no longer exists are ignored. Other failures are logged.
+
+        :param discord.Message msg: The message the request reacts to
+        :param request: A coroutine sending the reaction request
+        """
+        await self.clock.sleep(self.reserveRequest(msg.channel.id))
+        self.numRequests += 1
+        try:
+            await request
+        except NotFound:
+            pass
+        except HTTPException:
+            botState.logger.log("ReactionSeeder", "sendRequest", "Failed to seed reaction on message " + str(msg.id),
+                                category="reactionMenus", eventType="SEED_ERR", trace=traceback.format_exc())
+
+
+    async def seedReactions(self, msg: Message, emojis: List[lib.emojis.BasedEmoji]) -> float:
+        """Ensure that the bot has reacted to msg with each of the given emojis, in order, and that msg has no other
+        reactions. Reactions by other users with the given emojis are kept.
+        Other users' reactions can only be removed with the manage messages permission; without it, only the bot's own
+        reactions are removed.
+
+        :param discord.Message msg: The message to seed reactions on. Its reactions list should be recent.
+        :param List[lib.emojis.BasedEmoji] emojis: The emojis to react with
+        :return: The number of seconds taken to seed the reactions
+        :rtype: float
+        """
+        start = self.clock.monotonic()
+        wanted = set(emojis)
+        me = msg.guild.me if msg.guild is not None else botState.client.user
+        canManage = msg.guild is not None and msg.channel.permissions_for(me).manage_messages
+
+        removals = []
+        # Existing reactions with wanted emojis, by emoji
+        current = {}
+        for reaction in msg.reactions:
+            try:
+                emoji = lib.emojis.BasedEmoji.fromReaction(reaction.emoji, rejectInvalid=True)
+            except lib.exceptions.UnrecognisedCustomEmoji:
+                emoji = None
+            if emoji in wanted:
+                current[emoji] = reaction
+            elif canManage:
+                removals.append(msg.clear_reaction(reaction.emoji))
+            elif reaction.me:
+                removals.append(msg.remove_reaction(reaction.emoji, me))
+        additions = [emoji for emoji in emojis if emoji not in current or not current[emoji].me]
+
+        async def addReactions():
+            # A retried or slow request must not let a later option's reaction overtake it
+            for emoji in additions:
+                await self.sendRequest(msg, msg.add_reaction(emoji.sendable))
+
+        await asyncio.gather(addReactions(), *(self.sendRequest(msg, request) for request in removals))
+
+        seconds = self.clock.monotonic() - start
+        self.numSeeded += 1
+        self.totalSeconds += seconds
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        return seconds
+
+
+    def meanSeconds(self) -> float:
+        """Get the average number of seconds spent seeding one message.
+
+        :return: The mean seeding latency in seconds, or 0 if no messages have been seeded
+        :rtype: float
+        """
+        return self.totalSeconds / self.numSeeded if self.numSeeded else 0
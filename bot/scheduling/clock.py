@@ -0,0 +1,135 @@
+from __future__ import annotations
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+
+class Clock:
+    """The source of time for TimedTasks and TimedTaskHeaps.
+    This clock reads the real system clocks. Give a SimulatedClock to a TimedTaskHeap and its tasks to run them in virtual time,
+    e.g for testing or benchmarking the scheduler without sleeping.
+    """
+
+    def monotonic(self) -> float:
+        """Get the current monotonic time, which is unaffected by changes to the wall clock.
+
+        :return: The current monotonic time, in seconds
+        :rtype: float
+        """
+        return time.monotonic()
+
+
+    def time(self) -> float:
+        """Get the current wall-clock time.
+
+        :return: The current POSIX timestamp
+        :rtype: float
+        """
+        return time.time()
+
+
+    def utcnow(self) -> datetime:
+        """Get the current wall-clock time as a datetime.
+
+        :return: A naive datetime in UTC
+        :rtype: datetime
+        """
+        return datetime.utcnow()
+
+
+    async def sleep(self, seconds: float):
+        """Wait for the given number of seconds to pass on this clock.
+
+        :param float seconds: The number of seconds to wait
+        """
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    """A virtual clock which only moves forward when told to, with advance or advanceTo.
+    Sleeping on a SimulatedClock returns once the clock has been advanced far enough.
+
+    :var now: The current monotonic time on this clock
+    :vartype now: float
+    :var epoch: The POSIX timestamp reported by time() when now is 0
+    :vartype epoch: float
+    """
+
+    def __init__(self, now: float = 0, epoch: float = None):
+        """
+        :param float now: The starting monotonic time (Default 0)
+        :param float epoch: The POSIX timestamp reported by time() when now is 0 (Default the real current time)
+        """
+        self.now = now
+        self.epoch = time.time() - now if epoch is None else epoch
+        # Sleeping coroutines, as a list of (wake time, future) pairs
+        self.sleepers = []
+
+
+    def monotonic(self) -> float:
+        """Get the current virtual monotonic time.
+
+        :return: The current virtual monotonic time, in seconds
+        :rtype: float
+        """
+        return self.now
+
+
+    def time(self) -> float:
+        """Get the current virtual wall-clock time.
+
+        :return: The current virtual POSIX timestamp
+        :rtype: float
+        """
+        return self.epoch + self.now
+
+
+    def utcnow(self) -> datetime:
+        """Get the current virtual wall-clock time as a datetime.
+
+        :return: A naive datetime in UTC
+        :rtype: datetime
+        """
+        return datetime(1970, 1, 1) + timedelta(seconds=self.time())
+
+
+    async def sleep(self, seconds: float):
+        """Wait until the clock has been advanced by at least the given number of seconds.
+
+        :param float seconds: The number of virtual seconds to wait
+        """
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.sleepers.append((self.now + seconds, future))
+        await future
+
+
+    def advanceTo(self, now: float):
+        """Move the clock forward to the given monotonic time, waking any coroutines whose sleep has finished.
+        The clock never moves backwards.
+
+        :param float now: The new monotonic time
+        """
+        self.now = max(self.now, now)
+        waiting = []
+        for wakeTime, future in self.sleepers:
+            if wakeTime <= self.now:
+                if not future.done():
+                    future.set_result(None)
+            else:
+                waiting.append((wakeTime, future))
+        self.sleepers = waiting
+
+
+    def advance(self, seconds: float):
+        """Move the clock forward by the given number of seconds, waking any coroutines whose sleep has finished.
+
+        :param float seconds: The number of seconds to advance by
+        """
+        self.advanceTo(self.now + seconds)
+
+
+# The clock used by TimedTasks and TimedTaskHeaps that are not given one
+systemClock = Clock()
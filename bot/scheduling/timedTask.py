@@ -4,6 +4,29 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 import inspect
 from types import FunctionType
+from .clock import Clock, systemClock
+
+
+def monotonicToDatetime(monotonicTime: float, clock: Clock = systemClock) -> datetime:
+    """Convert a monotonic time into the equivalent UTC wall-clock datetime, according to the current wall clock.
+
+    :param float monotonicTime: The monotonic time to convert
+    :param Clock clock: The clock that monotonicTime was read from (Default systemClock)
+    :return: A naive datetime in UTC
+    :rtype: datetime
+    """
+    return clock.utcnow() + timedelta(seconds=monotonicTime - clock.monotonic())
+
+
+def datetimeToMonotonic(utcTime: datetime, clock: Clock = systemClock) -> float:
+    """Convert a naive UTC wall-clock datetime into the equivalent monotonic time, according to the current wall clock.
+
+    :param datetime utcTime: A naive datetime in UTC
+    :param Clock clock: The clock to convert to monotonic time on (Default systemClock)
+    :return: The equivalent monotonic time
+    :rtype: float
+    """
+    return clock.monotonic() + (utcTime - clock.utcnow()).total_seconds()
 
 
 class TimedTask:
@@ -13,12 +36,18 @@ class TimedTask:
     At least one of expiryTime or expiryDelta must be given.
     If the task is set to autoReschedule, issueTime is updated to show the task's current rescheduling time.
 
-    :var issueTime: The datetime when this task was created.
-    :vartype issueTime: datetime.datetime
-    :var expiryTime: The datetime when this task should expire.
-    :vartype expiryTime: datetime.datetime
-    :var expiryDelta: The timedelta to add to issueTime, to find the expiryTime.
-    :vartype expiryDelta: datetime.timedelta
+    Times are stored as floats from the task's clock's monotonic time, so tasks are unaffected by changes to the wall clock.
+    issueTime, expiryTime and expiryDelta are available as datetimes/timedeltas for convenience, converted using the
+    current wall clock. To persist a task's expiry, use expiryTimestamp.
+
+    :var clock: The clock that this task reads the time from
+    :vartype clock: Clock
+    :var issueMonotonic: The monotonic time when this task was created.
+    :vartype issueMonotonic: float
+    :var expiryMonotonic: The monotonic time when this task should expire.
+    :vartype expiryMonotonic: float
+    :var delaySeconds: The number of seconds to add to issueMonotonic, to find expiryMonotonic.
+    :vartype delaySeconds: float
     :var expiryFunction: The function to call once expiryTime has been reached/surpassed.
     :vartype expiryFunction: FunctionType
     :var hasExpiryFunction: Whether or not the task has an expiry function to call
@@ -34,10 +63,21 @@ class TimedTask:
     :vartype gravestone: bool
     :var asyncExpiryFunction: whether or not the expiryFunction is a coroutine and needs to be awaited
     :vartype asyncExpiryFunction: bool
+    :var orderedExpiry: Whether this task must expire after all tasks in its heap with orderedExpiry and an earlier
+                        expiryTime have finished expiring. Tasks without orderedExpiry may expire concurrently.
+    :vartype orderedExpiry: bool
+    :var heap: The TimedTaskHeap (or TimingWheel) that this task is scheduled on, or None if it is not scheduled
+    :vartype heap: TimedTaskHeap
+    :var heapIndex: This task's position in heap.tasksHeap (or its tick in a TimingWheel), or None if it is not scheduled
+    :vartype heapIndex: int
     """
+    __slots__ = ("clock", "issueMonotonic", "expiryMonotonic", "delaySeconds", "expiryFunction", "hasExpiryFunction",
+                    "expiryFunctionArgs", "hasExpiryFunctionArgs", "autoReschedule", "orderedExpiry", "_gravestone",
+                    "asyncExpiryFunction", "heap", "heapIndex")
 
     def __init__(self, issueTime: datetime = None, expiryTime: datetime = None, expiryDelta: timedelta = None,
-                 expiryFunction: FunctionType = None, expiryFunctionArgs = None, autoReschedule: bool = False):
+                 expiryFunction: FunctionType = None, expiryFunctionArgs = None, autoReschedule: bool = False,
+                 orderedExpiry: bool = False, expiryTimestamp: float = None, clock: Clock = None):
         """
         :param datetime.datetime issueTime: The datetime when this task was created. (Default now)
         :param datetime.datetime expiryTime: The datetime when this task should expire. (Default None)
@@ -47,24 +87,40 @@ class TimedTask:
                                     but a dictionary is recommended as a close representation of KWArgs. (Default {})
         :param bool autoReschedule: Whether or not this task should automatically reschedule itself by the
                                     same timedelta. (Default False)
+        :param bool orderedExpiry: Whether this task must expire after all tasks in its heap with orderedExpiry and an
+                                    earlier expiryTime have finished expiring. (Default False)
+        :param float expiryTimestamp: The POSIX timestamp when this task should expire, as returned by expiryTimestamp().
+                                        Used in place of expiryTime when restoring saved tasks. (Default None)
+        :param Clock clock: The clock to read the time from. This must be the same as the clock of any heap that this task
+                            is scheduled on. (Default systemClock)
         """
         # Ensure that at least one of expiryTime or expiryDelta is specified
-        if expiryTime is None and expiryDelta is None:
+        if expiryTime is None and expiryDelta is None and expiryTimestamp is None:
             raise ValueError("No expiry time given, both expiryTime and expiryDelta are None")
 
+        self.clock = systemClock if clock is None else clock
         # Calculate issueTime as now if none is given
-        self.issueTime = datetime.utcnow() if issueTime is None else issueTime
+        self.issueMonotonic = self.clock.monotonic() if issueTime is None else datetimeToMonotonic(issueTime, self.clock)
         # Calculate expiryTime as issueTime + expiryDelta if none is given
-        self.expiryTime = self.issueTime + expiryDelta if expiryTime is None else expiryTime
+        if expiryTimestamp is not None:
+            self.expiryMonotonic = self.clock.monotonic() + expiryTimestamp - self.clock.time()
+        elif expiryTime is not None:
+            self.expiryMonotonic = datetimeToMonotonic(expiryTime, self.clock)
+        else:
+            self.expiryMonotonic = self.issueMonotonic + expiryDelta.total_seconds()
         # Calculate expiryDelta as expiryTime - issueTime if none is given. This is needed for rescheduling.
-        self.expiryDelta = self.expiryTime - self.issueTime if expiryDelta is None else expiryDelta
+        self.delaySeconds = self.expiryMonotonic - self.issueMonotonic if expiryDelta is None \
+                            else expiryDelta.total_seconds()
 
         self.expiryFunction = expiryFunction
         self.hasExpiryFunction = expiryFunction is not None
         self.hasExpiryFunctionArgs = expiryFunctionArgs is not None
         self.expiryFunctionArgs = expiryFunctionArgs if self.hasExpiryFunctionArgs else {}
         self.autoReschedule = autoReschedule
+        self.orderedExpiry = orderedExpiry
 
+        self.heap = None
+        self.heapIndex = None
         # A task's 'gravestone' is marked as True when the TimedTask will no longer execute and
         # can be removed from any TimedTask heap. I.e, it is expired (whether manually or through timeout)
         # and does not auto-reschedule.
@@ -74,6 +130,53 @@ class TimedTask:
         self.asyncExpiryFunction = inspect.iscoroutinefunction(expiryFunction)
 
 
+    @property
+    def issueTime(self) -> datetime:
+        """The UTC datetime when this task was created, or last rescheduled.
+        """
+        return monotonicToDatetime(self.issueMonotonic, self.clock)
+
+
+    @property
+    def expiryTime(self) -> datetime:
+        """The UTC datetime when this task should expire.
+        """
+        return monotonicToDatetime(self.expiryMonotonic, self.clock)
+
+
+    @property
+    def expiryDelta(self) -> timedelta:
+        """The timedelta to add to issueTime, to find the expiryTime.
+        """
+        return timedelta(seconds=self.delaySeconds)
+
+
+    def expiryTimestamp(self) -> float:
+        """Get the wall-clock time when this task should expire, for saving to file.
+        Give this to the expiryTimestamp constructor parameter to restore the task.
+
+        :return: The POSIX timestamp when this task should expire
+        :rtype: float
+        """
+        return self.clock.time() + self.expiryMonotonic - self.clock.monotonic()
+
+
+    @property
+    def gravestone(self) -> bool:
+        """Whether the task will no longer execute, and can be removed from any TimedTask heap.
+        Changes are reported to the heap that this task is scheduled on, if any.
+        """
+        return self._gravestone
+
+
+    @gravestone.setter
+    def gravestone(self, value: bool):
+        changed = value != getattr(self, "_gravestone", False)
+        self._gravestone = value
+        if changed and self.heap is not None:
+            self.heap.taskGravestoneChanged(self)
+
+
     def __lt__(self, other: TimedTask) -> bool:
         """< Overload, to be used in TimedTask heaps.
         The other object must be a TimedTask. Compares only the expiryTimes of the two tasks.
@@ -84,7 +187,7 @@ class TimedTask:
         """
         if not isinstance(other, TimedTask):
             raise TypeError("< error: TimedTask can only be compared to other TimedTasks")
-        return self.expiryTime < other.expiryTime
+        return self.expiryMonotonic < other.expiryMonotonic
 
 
     def __gt__(self, other: TimedTask) -> bool:
@@ -97,7 +200,7 @@ class TimedTask:
         """
         if not isinstance(other, TimedTask):
             raise TypeError("> error: TimedTask can only be compared to other TimedTasks")
-        return self.expiryTime > other.expiryTime
+        return self.expiryMonotonic > other.expiryMonotonic
 
 
     def __lte__(self, other: TimedTask) -> bool:
@@ -110,7 +213,7 @@ class TimedTask:
         """
         if not isinstance(other, TimedTask):
             raise TypeError("<= error: TimedTask can only be compared to other TimedTasks")
-        return self.expiryTime <= other.expiryTime
+        return self.expiryMonotonic <= other.expiryMonotonic
 
 
     def __gte__(self, other: TimedTask) -> bool:
@@ -123,7 +226,7 @@ class TimedTask:
         """
         if not isinstance(other, TimedTask):
             raise TypeError(">= error: TimedTask can only be compared to other TimedTasks")
-        return self.expiryTime >= other.expiryTime
+        return self.expiryMonotonic >= other.expiryMonotonic
 
 
     def isExpired(self) -> bool:
@@ -133,7 +236,7 @@ class TimedTask:
         :return: True if this timedTask has been manually expired, or has reached its expiryTime. False otherwise
         :rtype: bool
         """
-        self.gravestone = self.gravestone or self.expiryTime <= datetime.utcnow()
+        self.gravestone = self.gravestone or self.expiryMonotonic <= self.clock.monotonic()
         return self.gravestone
 
 
@@ -189,25 +292,39 @@ class TimedTask:
                                                 Default: now + self.expiryTime
         """
         # Update the task's issueTime to now
-        self.issueTime = datetime.utcnow()
+        self.issueMonotonic = self.clock.monotonic()
         # Create the new expiryTime from now + expirydelta
         if expiryTime is not None:
-            self.expiryTime = expiryTime
+            self.expiryMonotonic = datetimeToMonotonic(expiryTime, self.clock)
+        elif expiryDelta is not None:
+            self.expiryMonotonic = self.issueMonotonic + expiryDelta.total_seconds()
         else:
-            self.expiryTime = self.issueTime + (self.expiryDelta if expiryDelta is None else expiryDelta)
+            self.expiryMonotonic = self.issueMonotonic + self.delaySeconds
         # reset the gravestone to False, in case the task had been expired and marked for removal
         self.gravestone = False
+        # Move the task to its new position in its heap
+        if self.heap is not None:
+            self.heap.taskRescheduled(self)
 
 
     async def forceExpire(self, callExpiryFunc: bool = True):
         """Force the expiry of this task.
         Handles calling of this task's expiryFunction, and rescheduling if specified. Set's the task's expiryTime to now.
+        The task is removed from its heap while its expiryFunction runs, and is only put back if it autoreschedules.
+        Tasks which have already expired and do not autoreschedule are not expired again.
 
         :param bool callExpiryFunction: Whether or not to call the task's expiryFunction if the task expires. Default: True
         :return: The result of the expiry function, if it is called
         """
+        # Tasks which have already expired, e.g because their heap is expiring them, are not expired again
+        if self.gravestone and not self.autoReschedule:
+            return None
         # Update expiryTime
-        self.expiryTime = datetime.utcnow()
+        self.expiryMonotonic = self.clock.monotonic()
+        # Take the task out of its heap while it expires, so that the heap cannot expire it again in the meantime
+        heap = self.heap
+        if heap is not None:
+            heap.removeTask(self)
         # Call expiryFunction and reschedule if specified
         if callExpiryFunc and self.hasExpiryFunction:
             expiryFuncResults = await self.callExpiryFunction()
@@ -216,7 +333,10 @@ class TimedTask:
 
         if self.autoReschedule:
             await self.reschedule()
-        # Mark for removal if not rescheduled
+            # Put autorescheduling tasks back onto the heap
+            if heap is not None and self.heap is None:
+                heap.scheduleTask(self)
+        # Mark as expired if not rescheduled
         else:
             self.gravestone = True
         # Return expiry function results
@@ -241,15 +361,21 @@ class DynamicRescheduleTask(TimedTask):
                                 but a dictionary is recommended as a close representation of KWArgs. Default: {}
     :param bool autoReschedule: Whether or not this task should automatically reschedule itself.
                                 You probably want this to be True, otherwise you may as well use a TimedTask. Default: False
+    :param bool orderedExpiry: Whether this task must expire after all tasks in its heap with orderedExpiry and an
+                                earlier expiryTime have finished expiring. Default: False
+    :param Clock clock: The clock to read the time from. Default: systemClock
     """
+    __slots__ = ("delayTimeGenerator", "hasDelayTimeGeneratorArgs", "delayTimeGeneratorArgs", "asyncDelayTimeGenerator")
 
     def __init__(self, delayTimeGenerator, delayTimeGeneratorArgs = None, issueTime : datetime = None,
                         expiryTime : datetime = None, expiryFunction : FunctionType = None,
-                        expiryFunctionArgs = None, autoReschedule : bool = False):
+                        expiryFunctionArgs = None, autoReschedule : bool = False, orderedExpiry : bool = False,
+                        clock : Clock = None):
         # Initialise TimedTask-inherited attributes
         super(DynamicRescheduleTask, self).__init__(expiryDelta=delayTimeGenerator(delayTimeGeneratorArgs),
                                                     issueTime=issueTime, expiryTime=expiryTime, expiryFunction=expiryFunction,
-                                                    expiryFunctionArgs=expiryFunctionArgs, autoReschedule=autoReschedule)
+                                                    expiryFunctionArgs=expiryFunctionArgs, autoReschedule=autoReschedule,
+                                                    orderedExpiry=orderedExpiry, clock=clock)
         self.delayTimeGenerator = delayTimeGenerator
         self.hasDelayTimeGeneratorArgs = delayTimeGeneratorArgs is not None
         self.delayTimeGeneratorArgs = delayTimeGeneratorArgs if self.hasDelayTimeGeneratorArgs else {}
@@ -281,8 +407,11 @@ class DynamicRescheduleTask(TimedTask):
         """Override. Start a new scheduling period for this task using the timedelta produced by delayTimeGenerator.
         """
         # Update the task's issueTime to now
-        self.issueTime = datetime.utcnow()
+        self.issueMonotonic = self.clock.monotonic()
         # Create the new expiryTime from now + delayTimeGenerator result
-        self.expiryTime = self.issueTime + await self.callDelayTimeGenerator()
+        self.expiryMonotonic = self.issueMonotonic + (await self.callDelayTimeGenerator()).total_seconds()
         # reset the gravestone to False, in case the task had been expired and marked for removal
         self.gravestone = False
+        # Move the task to its new position in its heap
+        if self.heap is not None:
+            self.heap.taskRescheduled(self)
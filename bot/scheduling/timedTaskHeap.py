@@ -1,11 +1,29 @@
+from __future__ import annotations
 from . import timedTask
-from heapq import heappop, heappush
+from .. import botState
+import asyncio
 import inspect
+import traceback
+from collections import deque
 from types import FunctionType
+from typing import List, Optional
+from .clock import Clock, systemClock
+
+
+# Default proportion of tasks in a heap that may be tombstones before the heap is compacted
+DEFAULT_COMPACTION_RATIO = 0.5
+# Default maximum number of task expiries that may run at once
+DEFAULT_MAX_CONCURRENT_EXPIRIES = 50
 
 
 class TimedTaskHeap:
     """A min-heap of TimedTasks, sorted by task expiration time.
+    Each task in the heap tracks its own position in the heap, so that tasks can be removed, or moved after being
+    rescheduled, in O(log n) time.
+
+    Tasks which are marked as expired (given a gravestone) without being removed from the heap, e.g with
+    TimedTask.isExpired, remain in the heap as tombstones, in case they are rescheduled. Once the proportion of tombstones
+    in the heap passes compactionRatio, all tombstones are removed at once.
     TODO: Return a value from the expiryFunction in case someone wants to use that
 
     :var tasksHeap: The heap, stored as an array. tasksHeap[0] is always the TimedTask with the closest expiry time.
@@ -20,16 +38,41 @@ class TimedTaskHeap:
     :vartype hasExpiryFunctionArgs: bool
     :var asyncExpiryFunction: whether or not the expiryFunction is a coroutine and needs to be awaited
     :vartype asyncExpiryFunction: bool
+    :var wakeEvent: Set whenever a task is scheduled to expire before every other task in the heap.
+                    Schedulers sleeping until the heap's next expiry time should wait on this, to wake up early.
+    :vartype wakeEvent: asyncio.Event
+    :var compactionRatio: The proportion of tasks in the heap that may be tombstones before the heap is compacted
+    :vartype compactionRatio: float
+    :var numTombstones: The number of tasks in the heap that have been marked as expired, but not yet removed
+    :vartype numTombstones: int
+    :var maxConcurrentExpiries: The maximum number of tasks without orderedExpiry that may be expiring at once
+    :vartype maxConcurrentExpiries: int
+    :var pendingExpiries: Due tasks without orderedExpiry, waiting to be expired
+    :vartype pendingExpiries: deque[TimedTask]
+    :var orderedExpiries: Due tasks with orderedExpiry set, waiting to be expired one at a time in order
+    :vartype orderedExpiries: deque[TimedTask]
+    :var runningExpiries: The asyncio tasks currently working through pendingExpiries and orderedExpiries
+    :vartype runningExpiries: Set[asyncio.Task]
+    :var clock: The clock that this heap reads the time from. All tasks in the heap must use the same clock.
+    :vartype clock: Clock
     """
 
-    def __init__(self, expiryFunction: FunctionType = None, expiryFunctionArgs = None):
+    def __init__(self, expiryFunction: FunctionType = None, expiryFunctionArgs = None,
+                    compactionRatio: float = DEFAULT_COMPACTION_RATIO,
+                    maxConcurrentExpiries: int = DEFAULT_MAX_CONCURRENT_EXPIRIES, clock: Clock = None):
         """
         :param function expiryFunction: function reference to call upon the expiry of any
                                         TimedTask managed by this heap. (Default None)
         :param expiryFunctionArgs: an object to pass to expiryFunction when calling. There is no type requirement,
                                     but a dictionary is recommended as a close representation of KWArgs. (Default {})
+        :param float compactionRatio: The proportion of tasks in the heap that may be tombstones before the heap is
+                                        compacted (Default DEFAULT_COMPACTION_RATIO)
+        :param int maxConcurrentExpiries: The maximum number of task expiries that may run at once
+                                            (Default DEFAULT_MAX_CONCURRENT_EXPIRIES)
+        :param Clock clock: The clock to read the time from (Default systemClock)
         """
         self.tasksHeap = []
+        self.clock = systemClock if clock is None else clock
 
         self.expiryFunction = expiryFunction
         self.hasExpiryFunction = expiryFunction is not None
@@ -38,6 +81,121 @@ class TimedTaskHeap:
 
         # Track whether or not the expiryFunction is a coroutine and needs to be awaited
         self.asyncExpiryFunction = inspect.iscoroutinefunction(expiryFunction)
+        self.wakeEvent = asyncio.Event()
+
+        self.compactionRatio = compactionRatio
+        self.numTombstones = 0
+
+        self.maxConcurrentExpiries = maxConcurrentExpiries
+        self.pendingExpiries = deque()
+        self.orderedExpiries = deque()
+        self.runningExpiries = set()
+        # The number of asyncio tasks working through pendingExpiries
+        self.numExpiryWorkers = 0
+        # Whether or not an asyncio task is currently working through orderedExpiries
+        self.orderedExpiriesRunning = False
+
+
+    def countLiveTasks(self) -> int:
+        """Get the number of tasks in the heap which have not been marked as expired.
+
+        :return: The number of live tasks in the heap
+        :rtype: int
+        """
+        return len(self.tasksHeap) - self.numTombstones
+
+
+    def countTombstones(self) -> int:
+        """Get the number of tasks in the heap which have been marked as expired, but not yet removed.
+
+        :return: The number of tombstoned tasks in the heap
+        :rtype: int
+        """
+        return self.numTombstones
+
+
+    def moveTask(self, task: timedTask.TimedTask, index: int):
+        """Place a task at the given position in the heap array, and record the position in the task.
+
+        :param TimedTask task: The task to move
+        :param int index: The task's new position in tasksHeap
+        """
+        self.tasksHeap[index] = task
+        task.heapIndex = index
+
+
+    def siftUp(self, index: int):
+        """Move the task at the given position towards the head of the heap, until it is in the correct position.
+
+        :param int index: The position of the task to move
+        """
+        heap = self.tasksHeap
+        task = heap[index]
+        while index > 0:
+            parentIndex = (index - 1) >> 1
+            parent = heap[parentIndex]
+            if not task.expiryMonotonic < parent.expiryMonotonic:
+                break
+            self.moveTask(parent, index)
+            index = parentIndex
+        self.moveTask(task, index)
+
+
+    def siftDown(self, index: int):
+        """Move the task at the given position away from the head of the heap, until it is in the correct position.
+
+        :param int index: The position of the task to move
+        """
+        heap = self.tasksHeap
+        task = heap[index]
+        size = len(heap)
+        while True:
+            childIndex = 2 * index + 1
+            if childIndex >= size:
+                break
+            # Pick the child that expires first
+            if childIndex + 1 < size and heap[childIndex + 1].expiryMonotonic < heap[childIndex].expiryMonotonic:
+                childIndex += 1
+            child = heap[childIndex]
+            if not child.expiryMonotonic < task.expiryMonotonic:
+                break
+            self.moveTask(child, index)
+            index = childIndex
+        self.moveTask(task, index)
+
+
+    def removeTask(self, task: timedTask.TimedTask):
+        """Remove a task from the heap in O(log n) time, without calling any expiry functions.
+
+        :param TimedTask task: The task to remove. Must be in this heap.
+        """
+        index = task.heapIndex
+        last = self.tasksHeap.pop()
+        if last is not task:
+            self.moveTask(last, index)
+            self.siftDown(index)
+            self.siftUp(last.heapIndex)
+        if task.gravestone:
+            self.numTombstones -= 1
+        task.heap = None
+        task.heapIndex = None
+
+
+    def compact(self):
+        """Remove all tombstoned tasks from the heap at once, in O(n) time.
+        """
+        live = [task for task in self.tasksHeap if not task.gravestone]
+        for task in self.tasksHeap:
+            if task.gravestone:
+                task.heap = None
+                task.heapIndex = None
+        self.tasksHeap = live
+        for index, task in enumerate(live):
+            task.heapIndex = index
+        # Heapify bottom-up, from the last task with children
+        for index in reversed(range(len(live) // 2)):
+            self.siftDown(index)
+        self.numTombstones = 0
 
 
     def cleanHead(self):
@@ -46,15 +204,58 @@ class TimedTaskHeap:
         I.e, it is expired (whether manually or through timeout) and does not auto-reschedule.
         """
         while len(self.tasksHeap) > 0 and self.tasksHeap[0].gravestone:
-            heappop(self.tasksHeap)
+            self.removeTask(self.tasksHeap[0])
 
 
     def scheduleTask(self, task: timedTask.TimedTask):
         """Schedule a new task onto this heap.
 
         :param TimedTask task: the task to schedule
+        :raise ValueError: If the task is already scheduled, or uses a different clock to this on a heap
         """
-        heappush(self.tasksHeap, task)
+        if task.heap is not None:
+            raise ValueError("Attempted to schedule a task that is already scheduled")
+        if task.clock is not self.clock:
+            raise ValueError("Attempted to schedule a task that uses a different clock")
+        task.heap = self
+        self.tasksHeap.append(task)
+        if task.gravestone:
+            self.numTombstones += 1
+        self.siftUp(len(self.tasksHeap) - 1)
+        # Wake up any scheduler sleeping until a later expiry time
+        if self.tasksHeap[0] is task:
+            self.wakeEvent.set()
+
+
+    def scheduleTasks(self, tasks: List[timedTask.TimedTask]):
+        """Schedule many new tasks onto this heap at once, rebuilding the heap in O(n) time rather than
+        inserting each task in O(log n) time.
+
+        :param List[TimedTask] tasks: the tasks to schedule
+        :raise ValueError: If any of the tasks is already scheduled, or uses a different clock to this heap
+        """
+        for task in tasks:
+            if task.heap is not None:
+                raise ValueError("Attempted to schedule a task that is already scheduled")
+            if task.clock is not self.clock:
+                raise ValueError("Attempted to schedule a task that uses a different clock")
+        for task in tasks:
+            task.heap = self
+            self.tasksHeap.append(task)
+            if task.gravestone:
+                self.numTombstones += 1
+        self.compact()
+        if tasks:
+            self.wakeEvent.set()
+
+
+    def getTasks(self) -> List[timedTask.TimedTask]:
+        """Get all tasks in the heap which have not been marked as expired, in no particular order.
+
+        :return: A list of the live tasks in the heap
+        :rtype: List[TimedTask]
+        """
+        return [task for task in self.tasksHeap if not task.gravestone]
 
 
     def unscheduleTask(self, task: timedTask.TimedTask):
@@ -64,7 +265,44 @@ class TimedTaskHeap:
         :param TimedTask task: the task to remove from the heap
         """
         task.gravestone = True
+        if task.heap is self:
+            self.removeTask(task)
+
+
+    def taskRescheduled(self, task: timedTask.TimedTask):
+        """Move a task to its correct position in the heap after its expiry time has changed.
+        Called by TimedTask.reschedule.
+
+        :param TimedTask task: The task that was rescheduled. Must be in this heap.
+        """
+        self.siftDown(task.heapIndex)
+        self.siftUp(task.heapIndex)
+        if self.tasksHeap[0] is task:
+            self.wakeEvent.set()
+
+
+    def taskGravestoneChanged(self, task: timedTask.TimedTask):
+        """Update the heap's tombstone count after a task in the heap is marked as expired, or revived.
+        If too many tasks are tombstones, the heap is compacted. Called by TimedTask when its gravestone is changed.
+
+        :param TimedTask task: The task whose gravestone changed. Must be in this heap.
+        """
+        if task.gravestone:
+            self.numTombstones += 1
+            if self.numTombstones > self.compactionRatio * len(self.tasksHeap):
+                self.compact()
+        else:
+            self.numTombstones -= 1
+
+
+    def nextExpiryTime(self) -> Optional[float]:
+        """Get the time when the next task in the heap will expire, as a monotonic time on the heap's clock.
+
+        :return: The expiryMonotonic of the task at the head of the heap, or None if the heap is empty
+        :rtype: Optional[float]
+        """
         self.cleanHead()
+        return self.tasksHeap[0].expiryMonotonic if self.tasksHeap else None
 
 
     async def callExpiryFunction(self):
@@ -89,20 +327,110 @@ class TimedTaskHeap:
                 self.expiryFunction()
 
 
+    def popDueTasks(self) -> List[timedTask.TimedTask]:
+        """Remove all tasks which are due to expire from the heap, and mark them as expired.
+
+        :return: The removed tasks, in order of expiry time
+        :rtype: List[TimedTask]
+        """
+        self.cleanHead()
+        now = self.clock.monotonic()
+        dueTasks = []
+        while len(self.tasksHeap) > 0 and self.tasksHeap[0].expiryMonotonic <= now:
+            task = self.tasksHeap[0]
+            self.removeTask(task)
+            # Mark the task as expired straight away, so that forceExpire does not expire it again in the meantime
+            task.gravestone = True
+            dueTasks.append(task)
+            self.cleanHead()
+        return dueTasks
+
+
+    async def expireTask(self, task: timedTask.TimedTask):
+        """Expire a task that has been removed from the heap, calling the task and heap-level expiry functions.
+        If the task is rescheduled, it is put back onto the heap.
+        Exceptions raised by expiry functions are logged, rather than propogated.
+
+        :param TimedTask task: The due task to expire
+        """
+        try:
+            await task.doExpiryCheck()
+            # Call the heap's expiry function
+            if self.hasExpiryFunction:
+                await self.callExpiryFunction()
+        except Exception as e:
+            if botState.logger is None:
+                traceback.print_exc()
+            else:
+                botState.logger.log(type(self).__name__, "expireTask",
+                                    "Exception in TimedTask expiry: " + type(e).__name__,
+                                    eventType="TT_EXPIRY_ERR", trace=traceback.format_exc())
+            # The expiry function failed before the task could reschedule itself
+            if task.autoReschedule and task.gravestone:
+                await task.reschedule()
+        # push autorescheduling tasks back onto the heap
+        if not task.gravestone and task.heap is None:
+            self.scheduleTask(task)
+
+
+    async def runPendingExpiries(self):
+        """Expire tasks from pendingExpiries until none are left.
+        Up to maxConcurrentExpiries of these run at once, each expiring one task at a time.
+        """
+        try:
+            while self.pendingExpiries:
+                await self.expireTask(self.pendingExpiries.popleft())
+        finally:
+            self.numExpiryWorkers -= 1
+
+
+    async def runOrderedExpiries(self):
+        """Expire the tasks in orderedExpiries one at a time, in order, until none are left.
+        """
+        try:
+            while self.orderedExpiries:
+                await self.expireTask(self.orderedExpiries.popleft())
+        finally:
+            self.orderedExpiriesRunning = False
+
+
+    def startExpiry(self, coro):
+        """Run a task expiry coroutine in the background, tracking it in runningExpiries.
+
+        :param coro: The coroutine to run
+        """
+        runner = asyncio.ensure_future(coro)
+        self.runningExpiries.add(runner)
+        runner.add_done_callback(self.runningExpiries.discard)
+
+
     async def doTaskChecking(self):
         """Function to be called regularly (ideally in a main loop), that handles the expiring of tasks.
         Tasks are checked against their expiry times and manual expiry.
         Task and heap-level expiry functions are called upon task expiry, if they are defined.
         Tasks are rescheduled if they are marked for auto-rescheduling.
         Expired, non-rescheduling tasks are removed from the heap.
+
+        Due tasks are removed from the heap immediately, but expired in the background, so that slow expiry functions
+        do not hold up the caller. Up to maxConcurrentExpiries tasks are expired at once, in no particular order.
+        Tasks with orderedExpiry set are expired separately, one at a time in order of expiry time.
+        Use waitForExpiries to wait until all due tasks have finished expiring.
         """
-        # Is the task at the head of the heap expired?
-        while len(self.tasksHeap) > 0 and (self.tasksHeap[0].gravestone or await self.tasksHeap[0].doExpiryCheck()):
-            # Call the heap's expiry function
-            if self.hasExpiryFunction:
-                await self.callExpiryFunction()
-            # Remove the expired task from the heap
-            task = heappop(self.tasksHeap)
-            # push autorescheduling tasks back onto the heap
-            if not task.gravestone:
-                heappush(self.tasksHeap, task)
+        for task in self.popDueTasks():
+            if task.orderedExpiry:
+                self.orderedExpiries.append(task)
+            else:
+                self.pendingExpiries.append(task)
+        while self.numExpiryWorkers < min(self.maxConcurrentExpiries, len(self.pendingExpiries)):
+            self.numExpiryWorkers += 1
+            self.startExpiry(self.runPendingExpiries())
+        if self.orderedExpiries and not self.orderedExpiriesRunning:
+            self.orderedExpiriesRunning = True
+            self.startExpiry(self.runOrderedExpiries())
+
+
+    async def waitForExpiries(self):
+        """Wait until all task expiries started by doTaskChecking have finished.
+        """
+        while self.runningExpiries:
+            await asyncio.gather(*self.runningExpiries)
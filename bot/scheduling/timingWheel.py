@@ -0,0 +1,276 @@
+from __future__ import annotations
+from . import timedTask
+from .timedTaskHeap import TimedTaskHeap, DEFAULT_MAX_CONCURRENT_EXPIRIES
+from .clock import Clock
+import heapq
+import math
+from types import FunctionType
+from typing import Dict, List, Optional, Set
+
+
+class TimingWheel(TimedTaskHeap):
+    """A hashed timing wheel of TimedTasks, usable anywhere that a TimedTaskHeap is.
+    Time is divided into ticks of tickSeconds, and each task is stored in the slot for the tick in which it expires,
+    so scheduling, unscheduling and rescheduling are all O(1), and tasks are never compared with each other.
+    Tasks expire up to one tick late, and tasks expiring within the same tick expire in no particular order.
+
+    To find the next expiry time without scanning the wheel, the number of live tasks in each tick is counted, and the
+    occupied ticks are kept in a min-heap. Only the first task scheduled into a tick touches the heap, in O(log t) time
+    for t occupied ticks. Ticks which have since emptied are removed lazily, when they reach the head of the heap.
+
+    Ticks map onto slots cyclically, so a slot holds tasks from many revolutions of the wheel. Each task records the tick
+    it expires in, and is only expired once that tick has been reached.
+    Because tasks are not sorted, the tasksHeap attribute inherited from TimedTaskHeap is always empty.
+
+    :var tickSeconds: The length of a tick, in seconds. This is the most that a task may expire late by.
+    :vartype tickSeconds: float
+    :var slots: For each slot of the wheel, the tasks stored in it. Dictionaries are used as ordered sets.
+    :vartype slots: List[Dict[TimedTask, None]]
+    :var startTime: The monotonic time at which tick 0 ends
+    :vartype startTime: float
+    :var currentTick: The last tick for which tasks have been expired
+    :vartype currentTick: int
+    :var numTasks: The number of tasks stored in the wheel, including tombstones
+    :vartype numTasks: int
+    :var tickCounts: The number of live tasks expiring in each tick, for ticks with at least one live task
+    :vartype tickCounts: Dict[int, int]
+    :var occupiedTicks: A min-heap of ticks which have held live tasks, including ticks which have since emptied
+    :vartype occupiedTicks: List[int]
+    :var queuedTicks: The ticks in occupiedTicks, so that each tick is pushed at most once
+    :vartype queuedTicks: Set[int]
+    """
+
+    def __init__(self, tickSeconds: float, numSlots: int, expiryFunction: FunctionType = None,
+                    expiryFunctionArgs = None, startTime: float = None,
+                    maxConcurrentExpiries: int = DEFAULT_MAX_CONCURRENT_EXPIRIES, clock: Clock = None):
+        """
+        :param float tickSeconds: The length of a tick, in seconds
+        :param int numSlots: The number of slots in the wheel. Tasks expiring up to tickSeconds * numSlots in the future
+                                are stored in different slots.
+        :param function expiryFunction: function reference to call upon the expiry of any
+                                        TimedTask managed by this wheel. (Default None)
+        :param expiryFunctionArgs: an object to pass to expiryFunction when calling. There is no type requirement,
+                                    but a dictionary is recommended as a close representation of KWArgs. (Default {})
+        :param float startTime: The monotonic time on clock at which tick 0 ends (Default now)
+        :param int maxConcurrentExpiries: The maximum number of task expiries that may run at once
+                                            (Default DEFAULT_MAX_CONCURRENT_EXPIRIES)
+        :param Clock clock: The clock to read the time from (Default systemClock)
+        """
+        super().__init__(expiryFunction=expiryFunction, expiryFunctionArgs=expiryFunctionArgs,
+                            maxConcurrentExpiries=maxConcurrentExpiries, clock=clock)
+        self.tickSeconds = tickSeconds
+        self.slots: List[Dict[timedTask.TimedTask, None]] = [{} for _ in range(numSlots)]
+        self.startTime = self.clock.monotonic() if startTime is None else startTime
+        self.currentTick = 0
+        self.numTasks = 0
+        self.tickCounts: Dict[int, int] = {}
+        self.occupiedTicks: List[int] = []
+        self.queuedTicks: Set[int] = set()
+        # The tick that the last call to nextExpiryTime reported, used to decide when to set wakeEvent
+        self.nextWakeTick = None
+
+
+    def tickAt(self, monotonicTime: float) -> int:
+        """Get the tick in which the given time falls.
+
+        :param float monotonicTime: The monotonic time to convert
+        :return: The first tick ending at or after monotonicTime
+        :rtype: int
+        """
+        return math.ceil((monotonicTime - self.startTime) / self.tickSeconds)
+
+
+    def tickEnd(self, tick: int) -> float:
+        """Get the time at which the given tick ends.
+
+        :param int tick: The tick to convert
+        :return: The monotonic time at which tick ends
+        :rtype: float
+        """
+        return self.startTime + tick * self.tickSeconds
+
+
+    def countLiveTasks(self) -> int:
+        """Get the number of tasks in the wheel which have not been marked as expired.
+
+        :return: The number of live tasks in the wheel
+        :rtype: int
+        """
+        return self.numTasks - self.numTombstones
+
+
+    def countLiveTask(self, tick: int):
+        """Record a new live task expiring in the given tick.
+
+        :param int tick: The tick in which the task expires
+        """
+        self.tickCounts[tick] = self.tickCounts.get(tick, 0) + 1
+        if tick not in self.queuedTicks:
+            self.queuedTicks.add(tick)
+            heapq.heappush(self.occupiedTicks, tick)
+
+
+    def uncountLiveTask(self, tick: int):
+        """Record that a live task expiring in the given tick was removed or tombstoned.
+
+        :param int tick: The tick in which the task expires
+        """
+        if self.tickCounts[tick] == 1:
+            del self.tickCounts[tick]
+        else:
+            self.tickCounts[tick] -= 1
+
+
+    def insertTask(self, task: timedTask.TimedTask):
+        """Store a task in the slot for the tick in which it expires.
+
+        :param TimedTask task: The task to store
+        """
+        # Tasks which are already due expire in the next tick
+        tick = max(self.tickAt(task.expiryMonotonic), self.currentTick + 1)
+        task.heap = self
+        task.heapIndex = tick
+        self.slots[tick % len(self.slots)][task] = None
+        self.numTasks += 1
+        if task.gravestone:
+            self.numTombstones += 1
+        else:
+            self.countLiveTask(tick)
+            # Wake up any scheduler sleeping until a later tick
+            if self.nextWakeTick is None or tick < self.nextWakeTick:
+                self.wakeEvent.set()
+
+
+    def removeTask(self, task: timedTask.TimedTask):
+        """Remove a task from the wheel in O(1) time, without calling any expiry functions.
+
+        :param TimedTask task: The task to remove. Must be in this wheel.
+        """
+        del self.slots[task.heapIndex % len(self.slots)][task]
+        self.numTasks -= 1
+        if task.gravestone:
+            self.numTombstones -= 1
+        else:
+            self.uncountLiveTask(task.heapIndex)
+        task.heap = None
+        task.heapIndex = None
+
+
+    def compact(self):
+        """Remove all tombstoned tasks from the wheel at once, in O(n) time.
+        """
+        for slot in self.slots:
+            for task in [task for task in slot if task.gravestone]:
+                self.removeTask(task)
+
+
+    def cleanHead(self):
+        """Tombstoned tasks are removed from the wheel as their tick is reached, so this does nothing.
+        """
+        pass
+
+
+    def scheduleTask(self, task: timedTask.TimedTask):
+        """Schedule a new task onto this wheel.
+
+        :param TimedTask task: the task to schedule
+        :raise ValueError: If the task is already scheduled, or uses a different clock to this
+        """
+        if task.heap is not None:
+            raise ValueError("Attempted to schedule a task that is already scheduled")
+        if task.clock is not self.clock:
+            raise ValueError("Attempted to schedule a task that uses a different clock")
+        self.insertTask(task)
+
+
+    def scheduleTasks(self, tasks: List[timedTask.TimedTask]):
+        """Schedule many new tasks onto this wheel at once.
+
+        :param List[TimedTask] tasks: the tasks to schedule
+        :raise ValueError: If any of the tasks is already scheduled, or uses a different clock to this
+        """
+        for task in tasks:
+            self.scheduleTask(task)
+
+
+    def getTasks(self) -> List[timedTask.TimedTask]:
+        """Get all tasks in the wheel which have not been marked as expired, in no particular order.
+
+        :return: A list of the live tasks in the wheel
+        :rtype: List[TimedTask]
+        """
+        return [task for slot in self.slots for task in slot if not task.gravestone]
+
+
+    def taskRescheduled(self, task: timedTask.TimedTask):
+        """Move a task to the slot for its new expiry time. Called by TimedTask.reschedule.
+
+        :param TimedTask task: The task that was rescheduled. Must be in this wheel.
+        """
+        self.removeTask(task)
+        self.insertTask(task)
+
+
+    def taskGravestoneChanged(self, task: timedTask.TimedTask):
+        """Update the wheel's tombstone count after a task in the wheel is marked as expired, or revived.
+        If too many tasks are tombstones, the wheel is compacted. Called by TimedTask when its gravestone is changed.
+
+        :param TimedTask task: The task whose gravestone changed. Must be in this wheel.
+        """
+        if task.gravestone:
+            self.numTombstones += 1
+            self.uncountLiveTask(task.heapIndex)
+            if self.numTombstones > self.compactionRatio * self.numTasks:
+                self.compact()
+        else:
+            self.numTombstones -= 1
+            self.countLiveTask(task.heapIndex)
+
+
+    def nextExpiryTime(self) -> Optional[float]:
+        """Get the time when the next task in the wheel will expire, rounded up to the end of its tick.
+
+        :return: The end of the next tick in which a task expires as a monotonic time, or None if the wheel is empty
+        :rtype: Optional[float]
+        """
+        # Discard ticks which no longer hold any live tasks
+        while self.occupiedTicks and self.occupiedTicks[0] not in self.tickCounts:
+            self.queuedTicks.discard(heapq.heappop(self.occupiedTicks))
+        if not self.occupiedTicks:
+            self.nextWakeTick = None
+            return None
+        self.nextWakeTick = self.occupiedTicks[0]
+        return self.tickEnd(self.nextWakeTick)
+
+
+    def popDueTasks(self) -> List[timedTask.TimedTask]:
+        """Remove all tasks in every tick that has ended since this was last called from the wheel, and mark the live
+        ones as expired.
+
+        :return: The removed tasks, in order of expiry time
+        :rtype: List[TimedTask]
+        """
+        now = self.clock.monotonic()
+        nowTick = self.tickAt(now)
+        # tickAt rounds up, but only ticks which have fully ended are processed
+        if self.tickEnd(nowTick) > now:
+            nowTick -= 1
+        numSlots = len(self.slots)
+        # Every slot holding a due task is visited once, even if many revolutions have passed
+        firstTick = max(self.currentTick + 1, nowTick - numSlots + 1)
+        self.currentTick = nowTick
+        dueTasks = []
+        for tick in range(firstTick, nowTick + 1):
+            slot = self.slots[tick % numSlots]
+            for task in [task for task in slot if task.heapIndex <= nowTick]:
+                self.removeTask(task)
+                if not task.gravestone:
+                    # Mark the task as expired straight away, so that forceExpire does not expire it again
+                    task.gravestone = True
+                    dueTasks.append(task)
+        # Every tick up to nowTick is now empty
+        while self.occupiedTicks and self.occupiedTicks[0] <= nowTick:
+            self.queuedTicks.discard(heapq.heappop(self.occupiedTicks))
+        # Tasks within a slot are unordered
+        dueTasks.sort(key=lambda task: task.expiryMonotonic)
+        return dueTasks
@@ -3,20 +3,26 @@ from __future__ import annotations
 from discord import Guild
 
 from .. import botState, lib
-from ..baseClasses import serializable
+from ..baseClasses import serializable, changeTracked
 from ..cfg import cfg
+from .storyEngine import StoryEngine
 
 
-class BasedGuild(serializable.Serializable):
+class BasedGuild(changeTracked.ChangeTracked, serializable.Serializable):
     """A class representing a guild in discord, and storing extra bot-specific information about it.
 
     :var id: The ID of the guild, directly corresponding to a discord guild's ID.
     :vartype id: int
     :var dcGuild: This guild's corresponding discord.Guild object
     :vartype dcGuild: discord.Guild
+    :var journalSeq: The sequence number of the last story journal record applied to this guild
+    :vartype journalSeq: int
+    :var storyEngine: The guild's story so far, which validates and records story turns
+    :vartype storyEngine: StoryEngine
     """
+    trackedAttrs = ("commandPrefix", "lastAuthorID", "storyChannelID", "emojiOnly", "journalSeq")
 
-    def __init__(self, id : int, dcGuild: Guild, commandPrefix : str = cfg.defaultCommandPrefix, story : str = "", lastAuthorID : int = -1, storyChannelID : int = -1, emojiOnly : bool = False):
+    def __init__(self, id : int, dcGuild: Guild, commandPrefix : str = cfg.defaultCommandPrefix, story : str = "", lastAuthorID : int = -1, storyChannelID : int = -1, emojiOnly : bool = False, journalSeq : int = 0):
         """
         :param int id: The ID of the guild, directly corresponding to a discord guild's ID.
         :param discord.Guild guild: This guild's corresponding discord.Guild object
@@ -31,11 +37,58 @@ class BasedGuild(serializable.Serializable):
         if not commandPrefix:
             raise ValueError("Empty command prefix provided")
         self.commandPrefix = commandPrefix
-        self.story = story
-        self.lastAuthorID = lastAuthorID
+        self.storyEngine = StoryEngine(story, lastAuthorID)
         self.storyChannelID = storyChannelID
         self.emojiOnly = emojiOnly
         self.emojiOnlyErrSent = False
+        self.journalSeq = journalSeq
+
+
+    @property
+    def story(self) -> str:
+        """The guild's story so far, rendered from its story engine.
+        """
+        return self.storyEngine.render()
+
+
+    @property
+    def lastAuthorID(self) -> int:
+        """The ID of the user who took the last turn in the guild's story, or -1 if no turn has been taken.
+        """
+        return self.storyEngine.lastAuthorID
+
+
+    @lastAuthorID.setter
+    def lastAuthorID(self, authorID: int):
+        self.storyEngine.lastAuthorID = authorID
+
+
+    def storyChanged(self):
+        """Report a change to the guild's story to changeListener, if there is one.
+        """
+        if self.changeListener is not None:
+            self.changeListener(self)
+
+
+    def addToStory(self, text: str, authorID: int):
+        """Add text to the end of the guild's story, and record it in the story journal.
+
+        :param str text: The text to add, including any leading whitespace
+        :param int authorID: The ID of the user who contributed the text
+        """
+        self.storyEngine.append(text, authorID)
+        self.storyChanged()
+        if botState.storyJournal is not None:
+            self.journalSeq = botState.storyJournal.recordAppend(self.id, text, authorID)
+
+
+    def resetStory(self):
+        """Clear the guild's story and last author, and record it in the story journal.
+        """
+        self.storyEngine.reset()
+        self.storyChanged()
+        if botState.storyJournal is not None:
+            self.journalSeq = botState.storyJournal.recordReset(self.id)
 
 
     def toDict(self, **kwargs) -> dict:
@@ -44,7 +97,9 @@ class BasedGuild(serializable.Serializable):
         :return: A dictionary containing all information needed to reconstruct this BasedGuild
         :rtype: dict
         """
-        return {"commandPrefix" : self.commandPrefix, "currentStory": self.story, "lastAuthorID" : self.lastAuthorID, "storyChannelID": self.storyChannelID, "emojiOnly": self.emojiOnly}
+        data = {"commandPrefix" : self.commandPrefix, "currentStory": self.story, "lastAuthorID" : self.lastAuthorID, "storyChannelID": self.storyChannelID, "emojiOnly": self.emojiOnly}
+        if self.journalSeq: data["journalSeq"] = self.journalSeq
+        return data
 
 
     @classmethod
@@ -66,5 +121,5 @@ class BasedGuild(serializable.Serializable):
             raise lib.exceptions.NoneDCGuildObj("Could not get guild object for id " + str(guildID))
 
         if "commandPrefix" in guildDict:
-            return BasedGuild(guildID, dcGuild, commandPrefix=guildDict["commandPrefix"], story=guildDict["currentStory"] if "currentStory" in guildDict else "", lastAuthorID=guildDict["lastAuthorID"] if "lastAuthorID" in guildDict else -1, storyChannelID=guildDict["storyChannelID"] if "storyChannelID" in guildDict else -1, emojiOnly=guildDict["emojiOnly"] if "emojiOnly" in guildDict else False)
-        return BasedGuild(guildID, dcGuild, story=guildDict["currentStory"] if "currentStory" in guildDict else "", lastAuthorID=guildDict["lastAuthorID"] if "lastAuthorID" in guildDict else -1, storyChannelID=guildDict["storyChannelID"] if "storyChannelID" in guildDict else -1, emojiOnly=guildDict["emojiOnly"] if "emojiOnly" in guildDict else False)
+            return BasedGuild(guildID, dcGuild, commandPrefix=guildDict["commandPrefix"], story=guildDict["currentStory"] if "currentStory" in guildDict else "", lastAuthorID=guildDict["lastAuthorID"] if "lastAuthorID" in guildDict else -1, storyChannelID=guildDict["storyChannelID"] if "storyChannelID" in guildDict else -1, emojiOnly=guildDict["emojiOnly"] if "emojiOnly" in guildDict else False, journalSeq=guildDict.get("journalSeq", 0))
+        return BasedGuild(guildID, dcGuild, story=guildDict["currentStory"] if "currentStory" in guildDict else "", lastAuthorID=guildDict["lastAuthorID"] if "lastAuthorID" in guildDict else -1, storyChannelID=guildDict["storyChannelID"] if "storyChannelID" in guildDict else -1, emojiOnly=guildDict["emojiOnly"] if "emojiOnly" in guildDict else False, journalSeq=guildDict.get("journalSeq", 0))
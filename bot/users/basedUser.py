@@ -2,16 +2,17 @@
 from __future__ import annotations
 from typing import Optional
 
-from ..baseClasses import serializable
+from ..baseClasses import serializable, changeTracked
 
 
-class BasedUser(serializable.Serializable):
+class BasedUser(changeTracked.ChangeTracked, serializable.Serializable):
     """A user of the bot. There is currently no guarantee that user still shares any guilds with the bot,
     though this is planned to change in the future.
 
     :var id: The user's unique ID. The same as their unique discord ID.
     :vartype id: int
     """
+    trackedAttrs = ("helpMenuOwned", "pollOwned", "timeOffset")
 
     def __init__(self, id: int, helpMenuOwned: bool = False, pollOwned: bool = False, timeOffset: Optional[str] = None):
         """
@@ -0,0 +1,271 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from discord import Message
+    from .basedGuild import BasedGuild
+
+from .. import botState, lib
+from ..cfg import cfg
+
+
+# Stories are sent as a single discord message, so can be no longer than this many characters
+MAX_STORY_LENGTH = 2000
+
+# Outcomes of a story turn, as decided by StoryEngine.checkTurn
+TURN_ACCEPTED = "accepted"
+TURN_WRONG_AUTHOR = "wrongAuthor"
+TURN_TOO_MANY_WORDS = "tooManyWords"
+TURN_TOO_LONG = "tooLong"
+TURN_NOT_EMOJI = "notEmoji"
+TURN_UNKNOWN_EMOJI = "unknownEmoji"
+TURN_COMPLETE = "complete"
+TURN_IGNORED = "ignored"
+
+
+class StoryEngine:
+    """A guild's story, stored as the list of contributions that make it up.
+    Adding a contribution appends to the list and updates a running length, without copying the story. The story is
+    only joined into a single string when it is rendered, and the rendered story is kept until the next contribution.
+
+    :var tokens: The contributions making up the story, each including any whitespace before it
+    :vartype tokens: List[str]
+    :var authorIDs: The ID of the user who contributed each token, or -1 for tokens restored from file
+    :vartype authorIDs: List[int]
+    :var length: The number of characters in the story
+    :vartype length: int
+    :var lastAuthorID: The ID of the user who took the last turn, or -1 if no turn has been taken
+    :vartype lastAuthorID: int
+    """
+
+    def __init__(self, story: str = "", lastAuthorID: int = -1):
+        """
+        :param str story: The story so far (Default "")
+        :param int lastAuthorID: The ID of the user who took the last turn (Default -1)
+        """
+        self.tokens: List[str] = [story] if story else []
+        self.authorIDs: List[int] = [-1] if story else []
+        self.length = len(story)
+        self.lastAuthorID = lastAuthorID
+        # The story joined into one string, or None if it has changed since it was last rendered
+        self.rendered: Optional[str] = story
+
+
+    def append(self, token: str, authorID: int):
+        """Add a contribution to the end of the story.
+
+        :param str token: The text to add, including any leading whitespace
+        :param int authorID: The ID of the user who contributed the text
+        """
+        self.tokens.append(token)
+        self.authorIDs.append(authorID)
+        self.length += len(token)
+        self.lastAuthorID = authorID
+        self.rendered = None
+
+
+    def reset(self):
+        """Clear the story and last author.
+        """
+        self.tokens = []
+        self.authorIDs = []
+        self.length = 0
+        self.lastAuthorID = -1
+        self.rendered = ""
+
+
+    def render(self) -> str:
+        """Get the story as a single string.
+
+        :return: The story so far
+        :rtype: str
+        """
+        if self.rendered is None:
+            self.rendered = "".join(self.tokens)
+        return self.rendered
+
+
+    def __len__(self) -> int:
+        return self.length
+
+
+    def checkTurn(self, authorID: int, text: str = None, emojiOnly: bool = False,
+                    allowSymbols: bool = True) -> Tuple[str, str]:
+        """Decide the outcome of a user taking a turn in the story, without changing the story.
+        This is the only place where story turns are validated.
+
+        The turn is rejected if the user took the previous turn. The text must be a single word (or emoji, if emojiOnly
+        is True). If allowSymbols is True, the word may be preceded by one of cfg.ignoredSymbols and a space, and a lone
+        "." completes the story.
+
+        :param int authorID: The ID of the user taking the turn
+        :param str text: The user's contribution, or None to only check that it is the user's turn (Default None)
+        :param bool emojiOnly: Whether contributions must be a single emoji (Default False)
+        :param bool allowSymbols: Whether to allow symbols before the word, and completing the story (Default True)
+        :return: The outcome of the turn, as one of the TURN_ constants, and the token to add to the story if the turn
+                    is accepted
+        :rtype: Tuple[str, str]
+        """
+        if authorID == self.lastAuthorID:
+            return TURN_WRONG_AUTHOR, None
+        if text is None:
+            return TURN_ACCEPTED, None
+        if allowSymbols and text == ".":
+            return (TURN_COMPLETE if self.length else TURN_IGNORED), None
+
+        words = text.split(" ", 2)
+        if len(words) > 2 or len(words) == 2 and allowSymbols and words[0] not in cfg.ignoredSymbols:
+            return TURN_TOO_MANY_WORDS, None
+        if self.length + len(text) > MAX_STORY_LENGTH:
+            return TURN_TOO_LONG, None
+        if emojiOnly:
+            try:
+                if lib.emojis.classifyEmoji(text, rejectInvalid=True) is None:
+                    return TURN_NOT_EMOJI, None
+            except lib.exceptions.UnrecognisedCustomEmoji:
+                return TURN_UNKNOWN_EMOJI, None
+
+        # Symbols other than "-" attach to the previous word
+        if allowSymbols and len(words) == 2 and words[0] != "-":
+            return TURN_ACCEPTED, text
+        return TURN_ACCEPTED, " " + text
+
+
+async def respondToTurn(message: Message, guild: BasedGuild, outcome: str) -> bool:
+    """Carry out the outcome of a story turn decided by StoryEngine.checkTurn, responding in the story channel and
+    ending the story where needed. The caller is responsible for adding accepted turns to the story.
+
+    :param discord.Message message: The message taking the turn
+    :param BasedGuild guild: The guild whose story the turn was taken in
+    :param str outcome: The outcome of the turn, as returned by StoryEngine.checkTurn
+    :return: True if the turn was accepted, False otherwise
+    :rtype: bool
+    """
+    if outcome == TURN_ACCEPTED:
+        if guild.emojiOnly and guild.emojiOnlyErrSent:
+            guild.emojiOnlyErrSent = False
+        return True
+
+    if outcome == TURN_NOT_EMOJI:
+        await message.delete()
+        if not guild.emojiOnlyErrSent:
+            await message.channel.send(message.author.mention + " emoji only mode is enabled! You can only contribute a single emoji.")
+            guild.emojiOnlyErrSent = True
+        return False
+    if outcome == TURN_UNKNOWN_EMOJI:
+        await message.delete()
+        await message.channel.send(message.author.mention + " please only use standard emojis or emojis from this server!")
+        return False
+    if outcome == TURN_IGNORED:
+        return False
+
+    if outcome == TURN_WRONG_AUTHOR:
+        await message.channel.send(":boom: **Story broken, " + message.author.mention + "!** It wasn't your turn!")
+    elif outcome == TURN_TOO_MANY_WORDS:
+        await message.channel.send(f":boom: **Story broken, {message.author.mention}!** You only add one {'emoji' if guild.emojiOnly else 'word'} at a time!")
+        guild.emojiOnlyErrSent = False
+    elif outcome == TURN_TOO_LONG:
+        await message.channel.send(":boom: **Max story length exceeded!**")
+    elif outcome == TURN_COMPLETE:
+        await message.channel.send("**Story complete!**")
+    if guild.story:
+        await message.channel.send(guild.story)
+    guild.resetStory()
+    return False
+
+
+async def playTurn(message: Message, text: str, allowSymbols: bool = True) -> bool:
+    """Take a turn in the story of the guild that message was sent in, adding text to the story if the turn is valid.
+    This should be run through turnQueue, so that turns in the same guild cannot interleave.
+
+    :param discord.Message message: The message taking the turn
+    :param str text: The word to add to the story
+    :param bool allowSymbols: Whether to allow symbols before the word, and completing the story (Default True)
+    :return: True if the turn was accepted, False otherwise
+    :rtype: bool
+    """
+    # The guild is fetched here rather than when the turn is queued, in case it was unloaded in the meantime
+    guild = botState.guildsDB.getGuild(message.guild.id)
+    outcome, token = guild.storyEngine.checkTurn(message.author.id, text, emojiOnly=guild.emojiOnly,
+                                                    allowSymbols=allowSymbols)
+    if await respondToTurn(message, guild, outcome):
+        guild.addToStory(token, message.author.id)
+        return True
+    return False
+
+
+class TurnQueue:
+    """Runs story turns one at a time for each guild, in message ID order, while turns in different guilds run
+    concurrently.
+    Checking a turn, responding to it and updating the story involve several API calls, so without the queue, two
+    turns sent at the same moment could both be accepted, or both break the story.
+
+    Each guild with queued turns has a worker task, which exits once the guild's queue is empty. Before taking its first
+    turn, the worker yields to the event loop once, so that messages received at the same moment are all queued and
+    ordered by ID. Turns are ordered by the messages' IDs, which discord assigns in the order they were sent.
+
+    :var queues: Turns waiting to be run in each guild, as heaps of (message ID, queue order, turn, future), by guild ID
+    :vartype queues: Dict[int, List[Tuple[int, int, Callable[[], Awaitable], asyncio.Future]]]
+    :var workers: The task running each guild's queued turns, by guild ID
+    :vartype workers: Dict[int, asyncio.Task]
+    """
+
+    def __init__(self):
+        self.queues: Dict[int, List[Tuple[int, int, Callable[[], Awaitable], asyncio.Future]]] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+        # Breaks ties between turns for the same message, keeping them in the order they were queued
+        self.queueOrder = itertools.count()
+
+
+    async def takeTurn(self, guildID: int, messageID: int, turn: Callable[[], Awaitable]) -> Any:
+        """Queue a turn in the given guild's story, and wait for it to be run.
+
+        :param int guildID: The ID of the guild whose story the turn is taken in
+        :param int messageID: The ID of the message taking the turn
+        :param turn: A coroutine function taking the turn
+        :type turn: Callable[[], Awaitable]
+        :return: The result of turn
+        :raise Exception: Any exception raised by turn
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queues.setdefault(guildID, []), (messageID, next(self.queueOrder), turn, future))
+        if guildID not in self.workers:
+            self.workers[guildID] = asyncio.create_task(self.runTurns(guildID))
+        return await future
+
+
+    async def runTurns(self, guildID: int):
+        """Run the given guild's queued turns one at a time, in message ID order, until none are left.
+
+        :param int guildID: The ID of the guild whose turns to run
+        """
+        queue = self.queues[guildID]
+        try:
+            # Let messages received at the same moment join the queue before choosing the first
+            await asyncio.sleep(0)
+            while queue:
+                turn, future = heapq.heappop(queue)[2:]
+                try:
+                    result = await turn()
+                # Don't leave the turn's caller waiting for a turn that will never finish
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            del self.workers[guildID]
+            del self.queues[guildID]
+            # Only reached with turns still queued if this task was cancelled
+            for _, _, _, future in queue:
+                future.cancel()
+
+
+# The queue that all story turns are taken through
+turnQueue = TurnQueue()
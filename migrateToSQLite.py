@@ -0,0 +1,10 @@
+import sys
+from bot.databases.sqliteDB import migrateFromJSON
+
+# Copy a JSON users or guilds database into an SQLite database, to be used with the SQLite storage backend
+if len(sys.argv) != 4 or sys.argv[3] not in ("users", "guilds"):
+    print("usage: python migrateToSQLite.py <JSON database file> <SQLite database file> <users|guilds>")
+    sys.exit(1)
+
+numRecords = migrateFromJSON(sys.argv[1], sys.argv[2], sys.argv[3])
+print("migrated " + str(numRecords) + " " + sys.argv[3] + " into " + sys.argv[2])